@@ -1,15 +1,45 @@
+import time
+_import_started = time.perf_counter()
+
 import gradio as gr
-from backend import smart_qa_system
+import uvicorn
+from fastapi import FastAPI, HTTPException
+from async_backend import smart_qa_system_async, memory_store
+from backend import services, graph_views, GRAPH_VIEW_PREFIX
+from export_jobs import ExportQueue
+from ui_stream import coalesce_stream
+import asyncio
 import sys
 import os
-import time
+import threading
 from pathlib import Path
 import shutil
+from tracing import configure_logging, get_logger
+from services import warmup_names
 
 current_dir = os.path.dirname(os.path.abspath(__file__))
 sys.path.append(current_dir)
-import csv2GOPPRRE
-import GOPPRRE2sim
+
+log = get_logger("app")
+
+# Static graph pages are swept by a background thread instead of on every chat message.
+GRAPH_MAX_AGE = float(os.getenv("GRAPH_MAX_AGE", "3600"))
+GRAPH_CLEANUP_INTERVAL = float(os.getenv("GRAPH_CLEANUP_INTERVAL", "600"))
+EXPORT_POLL_INTERVAL = float(os.getenv("EXPORT_POLL_INTERVAL", "0.5"))
+
+# The export queue and the plan store it reads are built on the first export.
+services.provider("export_queue", warm=False)(lambda: ExportQueue(services.plan_store))
+
+server = FastAPI()
+
+
+@server.get("/graph-view/{key}/node/{node_id:path}")
+def graph_view_node(key: str, node_id: str):
+    # Edges of a hub that was collapsed in a large graph view, fetched when the user expands it.
+    detail = graph_views.detail(key, node_id)
+    if detail is None:
+        raise HTTPException(status_code=404, detail="Unknown graph view or node")
+    return detail
 
 custom_css = """
 * {
@@ -136,7 +166,7 @@ GRAPH_PLACEHOLDER_HTML = (
     "</div>"
 )
 
-def clean_old_graphs(static_folder="static", max_age=3600):
+def clean_old_graphs(static_folder="static", max_age=GRAPH_MAX_AGE):
     now = time.time()
     p = Path(static_folder)
     if not p.exists():
@@ -146,11 +176,26 @@ def clean_old_graphs(static_folder="static", max_age=3600):
             try:
                 f.unlink()
             except Exception as e:
-                print("Delete graph failed:", e)
+                log.warning("Delete graph failed: %s", e)
+
+def start_graph_cleanup(interval=GRAPH_CLEANUP_INTERVAL):
+    def sweep():
+        while True:
+            try:
+                clean_old_graphs()
+            except Exception as e:
+                log.warning("Graph cleanup failed: %s", e)
+            time.sleep(interval)
+
+    thread = threading.Thread(target=sweep, name="graph-cleanup", daemon=True)
+    thread.start()
+    return thread
 
 def get_graph_html_content(graph_html_path):
     if not graph_html_path:
         return "There are no graph data."
+    if graph_html_path.startswith(GRAPH_VIEW_PREFIX):
+        return graph_views.render(graph_html_path) or "There are no graph data."
     full = Path(os.getcwd()) / graph_html_path.lstrip("/")
     if not full.exists():
         return "There are no graph data."
@@ -161,66 +206,67 @@ def get_graph_html_content(graph_html_path):
                 style="width: 100%; height: 100%; border: none;"></iframe>
     </div>"""
 
-def mbse_action(history):
-    plans_dir = './plans'
-    mbse_dir = './MBSE'
-    os.makedirs(mbse_dir, exist_ok=True)
-
-    csv_files = [
-        f for f in os.listdir(plans_dir)
-        if f.startswith('assembly_plan_') and f.endswith('.csv')
-    ]
-    if not csv_files:
-        return history + [{"role": "assistant", "content":
-            "❌ No assembly_plan_*.csv file found in ./plans. Please generate the assembly plan first!"}]
-
-    csv_files.sort()
-    latest_csv = csv_files[-1]
-    latest_csv_path = os.path.join(plans_dir, latest_csv)
-    time_suffix = latest_csv[len('assembly_plan_'):-len('.csv')]
-
-    frag_txt = os.path.join(mbse_dir, f"owl_out_{time_suffix}.txt")
-    merged_owl = os.path.join(mbse_dir, f"assembly_plan_MBSE_{time_suffix}.owl")
-    main_owl = os.path.join(current_dir, "GOPPRRE.owl")
-
-    csv2GOPPRRE.build(latest_csv_path, frag_txt)
-    csv2GOPPRRE.merge_fragment(main_owl, frag_txt, merged_owl)
-
-    if os.path.exists(frag_txt):
-        os.remove(frag_txt)
-
-    msg = (
-        "✅ The MBSE model of the assembly plan has been saved as an OWL file:\n"
-        f"./MBSE/assembly_plan_MBSE_{time_suffix}.owl"
-    )
-    return history + [{"role": "assistant", "content": msg}]
-
-def simulation_action(history):
-    sim_dir = './Simulation'
-    mbse_dir = './MBSE'
-    os.makedirs(sim_dir, exist_ok=True)
-
-    owl_files = [
-        f for f in os.listdir(mbse_dir)
-        if f.startswith('assembly_plan_MBSE_') and f.endswith('.owl')
-    ]
-    if not owl_files:
-        return history + [{"role": "assistant", "content":
-            "❌ No assembly_plan_MBSE_*.owl file found in ./MBSE. Please generate the MBSE model first!"}]
-
-    owl_files.sort()
-    latest_owl = owl_files[-1]
-    latest_owl_path = os.path.join(mbse_dir, latest_owl)
-    m_file_name = latest_owl.replace('.owl', '.m')
-    m_file_path = os.path.join(sim_dir, m_file_name)
-
-    try:
-        GOPPRRE2sim.owl_to_matlab(latest_owl_path, m_file_path)
-        msg = f"✅ The MATLAB simulation file has been generated:\n{m_file_path}"
-    except Exception as e:
-        msg = f"❌ Simulation failed: {e}"
-
-    return history + [{"role": "assistant", "content": msg}]
+async def follow_export_jobs(history, jobs, title):
+    # Re-renders one progress message until every job has finished; the click handler never blocks on an export.
+    while True:
+        lines = [job.describe() for job in jobs]
+        done = sum(not job.active for job in jobs)
+        content = f"{title} ({done}/{len(jobs)} done)\n" + "\n".join(lines)
+        yield history + [{"role": "assistant", "content": content}]
+        if done == len(jobs):
+            return
+        await asyncio.sleep(EXPORT_POLL_INTERVAL)
+
+async def mbse_action(history, request: gr.Request):
+    # The first export opens the plan store, so it is read off the event loop.
+    entry = await asyncio.to_thread(services.plan_store.latest, "plan", request.session_hash)
+    if entry is None:
+        yield history + [{"role": "assistant", "content":
+            "❌ There is no assembly plan for this session yet. Please generate the assembly plan first!"}]
+        return
+
+    job = services.export_queue.submit(entry["plan"], "mbse")
+    async for messages in follow_export_jobs(history, [job], "Generating the MBSE model"):
+        if not job.active:
+            break
+        yield messages
+
+    if job.status == "failed":
+        msg = f"❌ MBSE export failed: {job.error}"
+    else:
+        msg = (
+            "✅ The MBSE model of the assembly plan has been saved as an OWL file:\n"
+            f"{job.outputs['owl']}"
+        )
+    yield history + [{"role": "assistant", "content": msg}]
+
+async def simulation_action(history, request: gr.Request):
+    entry = await asyncio.to_thread(services.plan_store.latest, "owl", request.session_hash)
+    if entry is None:
+        yield history + [{"role": "assistant", "content":
+            "❌ There is no MBSE model for this session yet. Please generate the MBSE model first!"}]
+        return
+
+    job = services.export_queue.submit(entry["plan"], "simulation", entry["owl"])
+    async for messages in follow_export_jobs(history, [job], "Generating the simulation model"):
+        if not job.active:
+            break
+        yield messages
+
+    if job.status == "failed":
+        msg = f"❌ Simulation failed: {job.error}"
+    else:
+        msg = f"✅ The MATLAB simulation file has been generated:\n{job.outputs['model']}"
+    yield history + [{"role": "assistant", "content": msg}]
+
+async def batch_export_action(history):
+    jobs = await asyncio.to_thread(services.export_queue.batch)
+    if not jobs:
+        yield history + [{"role": "assistant", "content":
+            "✅ Every saved assembly plan already has its MBSE model and simulation file."}]
+        return
+    async for messages in follow_export_jobs(history, jobs, "Exporting saved assembly plans"):
+        yield messages
 
 with gr.Blocks(css=custom_css) as demo:
     title_row = gr.Row()
@@ -268,6 +314,7 @@ with gr.Blocks(css=custom_css) as demo:
         plan_btn = gr.Button("Plan", min_width=80)
         mbse_btn = gr.Button("MBSE", min_width=80)
         simulation_btn = gr.Button("Simulation")
+        batch_export_btn = gr.Button("Export all")
 
     fullscreen_header = gr.Row(visible=False)
     with fullscreen_header:
@@ -292,37 +339,43 @@ with gr.Blocks(css=custom_css) as demo:
                 fullscreen_send_btn = gr.Button("Send")
                 fullscreen_clear_btn = gr.Button("Clear")
 
-    def handle_chat(user_msg, history):
-        clean_old_graphs()
-        assistant_partial = ""
-        graph_html_content = GRAPH_PLACEHOLDER_HTML
+    async def handle_chat(user_msg, history, request: gr.Request):
+        parts = []
+        # The graph panel is reset once, then updated only when the graph arrives; every other
+        # yield leaves it untouched, and Gradio sends only the appended text of the chat message.
+        graph_update = GRAPH_PLACEHOLDER_HTML
+        graph_shown = False
 
-        for part, g_path in smart_qa_system(user_msg):
-            if g_path and (graph_html_content == GRAPH_PLACEHOLDER_HTML or not graph_html_content):
-                graph_html_content = get_graph_html_content(g_path)
+        stream = smart_qa_system_async(user_msg, request.session_hash)
+        async for delta, g_path in coalesce_stream(stream):
+            if g_path and not graph_shown:
+                graph_update = get_graph_html_content(g_path)
+                graph_shown = True
 
-            assistant_partial += part
+            parts.append(delta)
 
             yield (
                 history +
                 [{"role": "user", "content": user_msg},
-                 {"role": "assistant", "content": assistant_partial}],
-                graph_html_content
+                 {"role": "assistant", "content": "".join(parts)}],
+                graph_update
             )
+            graph_update = gr.update()
 
 
-    def handle_fullscreen_chat(user_msg, history):
-        assistant_partial = ""
+    async def handle_fullscreen_chat(user_msg, history, request: gr.Request):
+        parts = []
 
-        for part, g_path in smart_qa_system(user_msg):
+        stream = smart_qa_system_async(user_msg, request.session_hash)
+        async for delta, _ in coalesce_stream(stream):
             # 累加回答
-            assistant_partial += part
+            parts.append(delta)
 
             # 输出给前端
             yield (
                     history +
                     [{"role": "user", "content": user_msg},
-                     {"role": "assistant", "content": assistant_partial}]
+                     {"role": "assistant", "content": "".join(parts)}]
             )
 
 
@@ -355,8 +408,16 @@ with gr.Blocks(css=custom_css) as demo:
         outputs=[chatbot, graph_html],
     )
 
+    def clear_chat(request: gr.Request):
+        memory_store.clear(request.session_hash)
+        return [], GRAPH_PLACEHOLDER_HTML
+
+    def clear_fullscreen_chat(request: gr.Request):
+        memory_store.clear(request.session_hash)
+        return []
+
     clear_btn.click(
-        fn=lambda: ([], GRAPH_PLACEHOLDER_HTML),
+        fn=clear_chat,
         inputs=[],
         outputs=[chatbot, graph_html]
     )
@@ -368,7 +429,7 @@ with gr.Blocks(css=custom_css) as demo:
     )
 
     fullscreen_clear_btn.click(
-        fn=lambda: [],
+        fn=clear_fullscreen_chat,
         inputs=[],
         outputs=[fullscreen_chatbot]
     )
@@ -436,11 +497,27 @@ with gr.Blocks(css=custom_css) as demo:
         outputs=chatbot
     )
 
+    batch_export_btn.click(
+        batch_export_action,
+        inputs=[chatbot],
+        outputs=chatbot
+    )
+
 # ------------------------- 启动 ----------------------------
 if __name__ == "__main__":
+    configure_logging()
     static_dir = os.path.join(os.getcwd(), "static")
     if not os.path.exists(static_dir):
         os.makedirs(static_dir)
-
-    demo.queue().launch(server_name="localhost",
-                        server_port=7860)
\ No newline at end of file
+    start_graph_cleanup()
+    log.info("App modules loaded in %.2f s", time.perf_counter() - _import_started)
+    names = warmup_names()
+    if names != []:
+        # Clients and the graph connection are built in the background; requests that arrive
+        # first build what they need themselves.
+        services.warm_up_in_background(names)
+
+    # Chat handlers are async, so many sessions can stream at once without one worker thread each.
+    # Mounted on FastAPI so the graph viewer can page in collapsed hub edges from the same origin.
+    demo.queue(default_concurrency_limit=int(os.getenv("GRADIO_CONCURRENCY", "64")))
+    uvicorn.run(gr.mount_gradio_app(server, demo, path="/"), host="localhost", port=7860)
\ No newline at end of file
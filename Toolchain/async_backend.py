@@ -0,0 +1,190 @@
+import asyncio
+import os
+from contextlib import aclosing
+from typing import AsyncGenerator, Tuple, Optional
+
+import backend
+from backend import services, local_router, router_prompt, cypher_schema, qa_pipeline, Stream
+from kg_engine import InMemoryGraph
+from cypher_guard import CypherCursor
+from tracing import Trace, traced, get_logger
+
+log = get_logger("async_backend")
+
+# Upper bound of requests in flight per pipeline stage, shared by every connected session.
+STAGE_LIMITS = {
+    "router": int(os.getenv("ASYNC_ROUTER_CONCURRENCY", "8")),
+    "cypher": int(os.getenv("ASYNC_CYPHER_CONCURRENCY", "8")),
+    "graph": int(os.getenv("ASYNC_GRAPH_CONCURRENCY", "16")),
+    "summary": int(os.getenv("ASYNC_SUMMARY_CONCURRENCY", "16")),
+    "design": int(os.getenv("ASYNC_DESIGN_CONCURRENCY", "4")),
+}
+STAGE_TIMEOUTS = {
+    "router": float(os.getenv("ASYNC_ROUTER_TIMEOUT", "30")),
+    "cypher": float(os.getenv("ASYNC_CYPHER_TIMEOUT", "60")),
+    "graph": float(os.getenv("ASYNC_GRAPH_TIMEOUT", "30")),
+}
+NEO4J_POOL_SIZE = int(os.getenv("NEO4J_POOL_SIZE", "50"))
+
+_semaphores = {}
+_client = None
+_async_graph = None
+
+
+def stage(name):
+    semaphore = _semaphores.get(name)
+    if semaphore is None:
+        semaphore = _semaphores[name] = asyncio.Semaphore(STAGE_LIMITS[name])
+    return semaphore
+
+
+def get_client():
+    global _client
+    if _client is None:
+        from openai import AsyncOpenAI
+        _client = AsyncOpenAI()
+    return _client
+
+
+class AsyncGraph:
+    def __init__(self, sync_graph):
+        self.sync_graph = sync_graph
+        self.driver = None
+        self.database = os.getenv("NEO4J_DATABASE", "neo4j")
+        if not isinstance(sync_graph, InMemoryGraph):
+            from neo4j import AsyncGraphDatabase
+            self.driver = AsyncGraphDatabase.driver(
+                os.getenv("NEO4J_URI", "bolt://localhost:7687"),
+                auth=(os.getenv("NEO4J_USERNAME", "neo4j"), os.getenv("NEO4J_PASSWORD", "")),
+                max_connection_pool_size=NEO4J_POOL_SIZE,
+            )
+
+    async def query(self, cypher, params=None):
+        # Checked and bounded like the sync path (read-only, LIMIT, timeout, paged fetch).
+        cursor = CypherCursor(self.sync_graph, cypher, params)
+        if self.driver is None:
+            return await asyncio.to_thread(cursor.fetch_all)
+        return await cursor.afetch_all(self.driver, self.database)
+
+    async def close(self):
+        if self.driver is not None:
+            await self.driver.close()
+
+
+def get_async_graph():
+    global _async_graph
+    if _async_graph is None:
+        _async_graph = AsyncGraph(services.graph)
+    return _async_graph
+
+
+async def chat_token_stream(model: str, prompt_text: str, stage_name: str, trace=None) -> AsyncGenerator[str, None]:
+    async with stage(stage_name):
+        stream = await get_client().chat.completions.create(
+            model      = model,
+            messages   = [{"role": "user", "content": prompt_text}],
+            temperature= 0,
+            stream     = True,
+            stream_options = {"include_usage": True},
+        )
+        try:
+            async for chunk in stream:
+                if chunk.usage and trace:
+                    trace.usage(chunk.usage)
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+        finally:
+            # Closing the response frees the pooled connection when the client disconnects mid-stream.
+            await stream.close()
+
+
+async def llm_route_async(question: str) -> str:
+    async with stage("router"):
+        resp = await asyncio.wait_for(get_client().chat.completions.create(
+            model      = "gpt-4",
+            messages   = [{"role": "user", "content": router_prompt.format(question=question)}],
+            temperature= 0,
+        ), STAGE_TIMEOUTS["router"])
+    return (resp.choices[0].message.content or "").strip().lower().strip('"\' ')
+
+
+async def route_question_async(question: str, trace=None) -> str:
+    return await local_router.aroute(question, fallback=llm_route_async, trace=trace)
+
+
+async def generate_cypher_async(question: str) -> str:
+    from langchain_community.chains.graph_qa.cypher import extract_cypher
+    # The first call builds the chain (and the graph connection) off the event loop.
+    cypher_chain = await asyncio.to_thread(services.get, "cypher_chain")
+    schema = await asyncio.to_thread(cypher_schema, question)
+    async with stage("cypher"):
+        generated = await asyncio.wait_for(cypher_chain.cypher_generation_chain.arun(
+            {"question": question, "schema": schema}
+        ), STAGE_TIMEOUTS["cypher"])
+    return extract_cypher(generated)
+
+
+async def run_cypher_async(cypher: str):
+    if not cypher:
+        return []
+    async with stage("graph"):
+        return await asyncio.wait_for(get_async_graph().query(cypher), STAGE_TIMEOUTS["graph"])
+
+
+async def query_graph_async(question: str, trace=None):
+    graph = await asyncio.to_thread(services.get, "graph")
+    cypher_cache = backend.cypher_cache
+    await asyncio.to_thread(cypher_cache.check_fingerprint, graph)
+    cached = cypher_cache.get(question)
+    if cached:
+        return cached["result"], cached["cypher"]
+    with traced(trace, "cypher_generation"):
+        generated = await generate_cypher_async(question)
+    with traced(trace, "graph_query"):
+        graph_data = await run_cypher_async(generated)
+    cypher = generated.replace("cypher", "").strip()
+    cypher_cache.put(question, cypher, graph_data)
+    return graph_data, cypher
+
+
+# I/O steps of the shared pipeline with a native async variant; the others run in a worker thread.
+ASYNC_STEPS = {
+    "route_question": route_question_async,
+    "query_graph": query_graph_async,
+}
+
+
+async def run_step(step):
+    fn = ASYNC_STEPS.get(step.name)
+    if fn is not None:
+        return await fn(*step.args)
+    return await asyncio.to_thread(getattr(backend, step.name), *step.args)
+
+
+async def smart_qa_system_async(question: str, session_id: Optional[str] = None) -> AsyncGenerator[Tuple[str, Optional[str]], None]:
+    trace = Trace(question, backend.metrics_sink, session_id)
+    pipeline = qa_pipeline(question, session_id, trace)
+    try:
+        step = next(pipeline)
+        while True:
+            try:
+                if isinstance(step, tuple):
+                    yield step
+                    result = None
+                elif isinstance(step, Stream):
+                    tokens = chat_token_stream(step.model, step.prompt, step.stage, trace)
+                    async with aclosing(trace.astream(step.name, tokens)) as stream:
+                        async for tok in stream:
+                            step.on_token(tok)
+                            yield tok, step.graph
+                    result = None
+                else:
+                    result = await run_step(step)
+            except Exception as e:
+                step = pipeline.throw(e)
+                continue
+            step = pipeline.send(result)
+    except StopIteration:
+        return
+    finally:
+        pipeline.close()
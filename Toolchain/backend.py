@@ -1,28 +1,73 @@
-from langchain_openai import ChatOpenAI
-from langchain_community.graphs import Neo4jGraph
-from langchain.chains import GraphCypherQAChain
-from langchain.memory import ConversationBufferWindowMemory
-from langchain.prompts import PromptTemplate
 from dotenv import load_dotenv
-from pyvis.network import Network
-import uuid, re, csv, os, datetime, openai
+import uuid, csv, os, logging, json
 from typing import Generator, Tuple, Optional
-from openai import OpenAI
+from router import LocalRouter
+from cypher_cache import CypherCache
+from kg_engine import InMemoryGraph, KG_DUMP_PATH, as_graph_store
+from kg_tables import KGTables
+from scheduler import (
+    load_problem_from_views, load_problem_from_csv, solve_plan, plan_request_from_question, can_schedule,
+)
+from plan_search import search_plan, PlanCandidate, PLAN_SEARCH_LLM_CANDIDATES
+from plan_library import PlanLibrary
+from export_jobs import PLANS_DIR
+from plan_store import PlanStore, new_plan_id
+from plan_validator import PlanValidator, format_report
+from plan_stream import Phase3TableParser
+from session_memory import SessionMemoryStore
+from tracing import Trace, configure_logging, metrics_sink, traced, get_logger
+from graph_view import GraphBuilder, GraphViewCache, content_hash, GRAPH_VIEW_PREFIX
+from graph_layout import prepare_view, operation_groups
+from result_converter import convert_result
+from context_compactor import graph_context
+from services import ServiceContainer, load_graph_schema, save_graph_schema
+from schema_service import SchemaService, EXCLUDED_SCHEMA_TYPES
+from cypher_guard import CypherCursor, CYPHER_MAX_ROWS
 
 load_dotenv()
-client = OpenAI()
-
-llm = ChatOpenAI(model="gpt-4", temperature=0)
-llm_2 = ChatOpenAI(model="gpt-4", temperature=0, streaming=True)
-llm_3 = ChatOpenAI(model="gpt-4", temperature=0, streaming=True)
-openai.api_key = os.getenv("OPENAI_API_KEY")
-
-graph = Neo4jGraph()
-memory = ConversationBufferWindowMemory(k=10)
-
-router_prompt = PromptTemplate(
-    input_variables=["question"],
-    template=""" 
+log = get_logger("backend")
+
+# Clients, chains and the graph connection are built on first use, so importing this module
+# needs neither the network nor the OpenAI / LangChain / pyvis libraries.
+services = ServiceContainer()
+
+def __getattr__(name):
+    # backend.graph, backend.llm, backend.cypher_chain, ... resolve to the lazily built services.
+    if name in services:
+        return services.get(name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+@services.provider("client")
+def _openai_client():
+    from openai import OpenAI
+    return OpenAI()
+
+def _chat_model(streaming=False):
+    from langchain_openai import ChatOpenAI
+    return ChatOpenAI(model="gpt-4", temperature=0, streaming=streaming)
+
+services.provider("llm")(_chat_model)
+services.provider("llm_2", warm=False)(lambda: _chat_model(streaming=True))
+services.provider("llm_3", warm=False)(lambda: _chat_model(streaming=True))
+
+@services.provider("graph")
+def _graph():
+    # KG_BACKEND=memory answers graph questions from Toolchain/domain_KG.json without a Neo4j server.
+    if os.getenv("KG_BACKEND", "neo4j").lower() == "memory":
+        return InMemoryGraph.from_json(os.getenv("KG_DUMP_PATH", KG_DUMP_PATH))
+    from langchain_community.graphs import Neo4jGraph
+    graph = Neo4jGraph(refresh_schema=False)
+    # Introspecting a large KG is slow; the schema is cached on disk per database.
+    load_graph_schema(graph, graph_schema_key())
+    return graph
+
+def graph_schema_key():
+    return f"{os.getenv('NEO4J_URI', '')}/{os.getenv('NEO4J_DATABASE', 'neo4j')}"
+
+memory_store = SessionMemoryStore()
+
+# Prompts are str.format templates; LangChain wraps them only when a chain is built.
+router_prompt = """ 
 You are an intelligent routing assistant designed to classify user queries.
 
 **Query Context:**
@@ -43,28 +88,36 @@ User Query: {question}
 **Output Specification:**
 Respond exclusively with either **"graph"** or **"design"**. No additional text or explanation should be included.
 """
-)
 
-router_chain = router_prompt | llm
-
-cypher_chain = GraphCypherQAChain.from_llm(
-    llm=llm,
-    graph=graph,
-    allow_dangerous_requests=True,
-    verbose=True,
-    exclude_types=[
-        "Class", "Relationship", "_GraphConfig", "SCO_RESTRICTION",
-        "DOMAIN", "RANGE", "isSubClassOf", "isSubPropertyOf", "hasOptionalAutoOperation",
-        "hasOptionalManualOperation"
-    ],
-    top_k=300,
-    return_direct=True,
-    return_intermediate_steps=True
-)
+def _prompt_chain(template, llm_name):
+    from langchain_core.prompts import PromptTemplate
+    return PromptTemplate.from_template(template) | services.get(llm_name)
+
+services.provider("router_chain")(lambda: _prompt_chain(router_prompt, "llm"))
+local_router = LocalRouter()
+
+@services.provider("cypher_chain")
+def _cypher_chain():
+    from langchain.chains import GraphCypherQAChain
+    return GraphCypherQAChain.from_llm(
+        llm=services.llm,
+        graph=as_graph_store(services.graph),
+        allow_dangerous_requests=True,
+        verbose=log.isEnabledFor(logging.DEBUG),
+        exclude_types=EXCLUDED_SCHEMA_TYPES,
+        top_k=CYPHER_MAX_ROWS,
+        return_direct=True,
+        return_intermediate_steps=True
+    )
+
+cypher_cache = CypherCache()
+# Cypher prompts carry only the part of the KG schema the question family needs.
+schema_service = SchemaService()
+kg_tables = KGTables()
+# Answer canonical questions straight from the precomputed tables unless an LLM summary is requested.
+KG_TABLES_SUMMARIZE = os.getenv("KG_TABLES_SUMMARIZE", "0") == "1"
 
-graph_response_prompt = PromptTemplate(
-    input_variables=["question", "graph_data", "cypher"],
-    template=""" 
+graph_response_prompt = """ 
 You are a specialized knowledge graph interpreter for aircraft fuselage joint domain expertise. Your function is to process structured query results from the knowledge graph and provide accurate, semantically-rich responses to domain inquiries.
 
 **Query Context:**
@@ -76,17 +129,15 @@ Knowledge Graph Query Results: {graph_data}
 1. Extract only relevant information from the knowledge graph results to answer the user query
 2. Present answers in structured list format for clarity
 3. Include all data values without omission or inference beyond the provided results
+4. Short ids in the results (such as R1 or O2) stand for the names listed under Legend; always write out the full names
 
 **Output Requirements:**
 Provide a comprehensive, structured response that directly addresses the user query while maintaining complete fidelity to the knowledge graph data.
 """
-)
 
-graph_response_chain = graph_response_prompt | llm_2
+services.provider("graph_response_chain", warm=False)(lambda: _prompt_chain(graph_response_prompt, "llm_2"))
 
-design_qa_prompt = PromptTemplate(
-    input_variables=["question", "history"],
-    template="""
+design_qa_prompt = """
 **Role**: You are an expert in aircraft fuselage assembly planning. Your task is to generate a complete and feasible assembly plan based only on the conversation history and user query.
 
 **Query Context:**
@@ -136,194 +187,77 @@ Phase 4. **Validation Report**:
    ▪ [✓/✗] Shared operations correctly positioned
    ▪ [✓/✗] The required resources at the current moment do not exceed the total number of resources
 """
-)
 
-design_qa_chain = design_qa_prompt | llm_3
+services.provider("design_qa_chain", warm=False)(lambda: _prompt_chain(design_qa_prompt, "llm_3"))
 
-def extract_phase3_table(text):
-    print("\n==== [DEBUG] Start extracting Phase 3 blocks ====")
-    phase3_pat = (
-        r"(?:\s*(?:#+|\*\*)\s*)?Phase\s*3[^\n]*\n"
-        r"([\s\S]+?)"
-        r"(?=(?:\s*(?:#+|\*\*)\s*)?Phase\s*4|\Z)"
-    )
-    m = re.search(phase3_pat, text, re.IGNORECASE | re.MULTILINE)
-    if not m:
-        print('[DEBUG] Phase 3 Regular miss！')
-        return None
-    phase3_block = m.group(1).strip()
-    print("[DEBUG] Phase 3 Preview at the beginning of the block:\n", phase3_block[:120], "..." if len(phase3_block) > 120 else "")
-
-    print("\n==== [DEBUG] Attempt to strictly extract Markdown tables ====")
-    table_pat = re.compile(
-        r'((?:\|[^\n]*?\|[^\n]*?\n)+?)'
-        r'((?:\|\s*[-:]+\s*){2,}\|[^\n]*?\n)'
-        r'((?:(?:\|[^\n]*?\|[^\n]*?\n)+)+)',
-        re.MULTILINE
-    )
-    t = table_pat.search(phase3_block)
-    if t:
-        table_text = (t.group(1) + t.group(2) + t.group(3)).strip()
-        print("[DEBUG] Strict mode hits table, table preview:\n", table_text[:180], "..." if len(table_text)>180 else "")
-        return table_text
-    else:
-        print('[DEBUG] Strict Markdown table miss, enter loose matching ..')
-
-    greedy_lines = [ln for ln in phase3_block.split("\n") if re.match(r'^\|.*\|\s*', ln)]
-    print(f"[DEBUG] Number of hit rows in fallback mode: {len(greedy_lines)}")
-    if len(greedy_lines) >= 2:
-        for i, ln in enumerate(greedy_lines[:3]):
-            print(f"[DEBUG] fallback行{i}: {ln}")
-        return "\n".join(greedy_lines)
-    print("[DEBUG] Fallback does not have enough table rows")
-    return None
-
-def clean_markdown_table(markdown_table_text):
-    print("\n==== [DEBUG] Enter table cleaning ====")
-    print("[DEBUG] Truncate the content of the input table:\n", markdown_table_text[:200], "..." if len(markdown_table_text) > 200 else "")
-
-    lines = [
-        ln.strip() for ln in markdown_table_text.strip().split('\n')
-        if "|" in ln
-           and not re.match(r'^\s*\|?[\s:\-\|]+\|?\s*$', ln)
-                            and not re.match(r'^\s*(Total)', ln, re.I)
-    ]
-
-    print(f"[DEBUG] Remaining valid table rows: {len(lines)}")
-    for i, l in enumerate(lines[:3]):
-        print(f"[DEBUG] 行{i}: {l}")
-
-    if len(lines) < 2:
-        print("[DEBUG] The number of valid rows is less than 2, and the table cleaning has failed")
-        return []
+design_explain_prompt = """
+**Role**: You are an expert in aircraft fuselage assembly planning. A constraint-based scheduler has already computed the assembly plan below from the knowledge graph. Your task is to explain it, not to recompute it.
 
-    col_cnt = max(len([c for c in row.split("|") if c.strip()]) for row in lines)
-    print(f"[DEBUG] Automatically identify the number of columns: {col_cnt}")
+**Query Context:**
+Conversation history: {history}
+User query: {question}
 
-    table = []
-    for i, row in enumerate(lines):
-        cells = [c.strip() for c in row.strip("|").split("|")]
-        while len(cells) < col_cnt:
-            cells.append("")
-        if i < 3:
-            print(f"[DEBUG] Parsed line{i}: {cells}")
-        table.append(cells)
-    return table
+**Computed Plan:**
+{plan}
+
+**Requirements**:
+▪ Do not repeat, modify or regenerate the plan table; all times and costs in it are final.
+▪ Phase 1. **Data Extraction**: briefly summarise the operations and resources the plan uses.
+▪ Phase 2. **Constraint Analysis**: explain how the sequence satisfies each constraint of the user query, including the automatic and manual quarter aircraft fuselage joint logic.
+▪ Phase 4. **Validation Report**: mark each condition with ✓ or ✗ based on the computed plan:
+   ▪ Completed 4 joints of 1/4 body
+   ▪ Meets all constraints
+   ▪ Shared operations correctly positioned
+   ▪ The required resources at the current moment do not exceed the total number of resources
+"""
 
-def generate_graph_html(graph_data):
+# DESIGN_ENGINE=scheduler computes the plan natively and only asks the LLM to explain it;
+# DESIGN_ENGINE=search scores the scheduler's alternatives and several o1 plans and keeps the best;
+# DESIGN_ENGINE=llm keeps the original single o1 completion.
+DESIGN_ENGINE = os.getenv("DESIGN_ENGINE", "scheduler").lower()
+# Validated plans are kept per request and KG fingerprint and reused by later design questions.
+PLAN_LIBRARY_ENABLED = os.getenv("PLAN_LIBRARY", "1") == "1"
+plan_library = PlanLibrary()
+# Every saved plan: typed rows, owning session and exported artifacts, for queries and the exports.
+# Opened on first use, like the other services; importing backend touches no database.
+services.provider("plan_store")(PlanStore)
+
+# GRAPH_VIEW=json sends compact nodes/edges to one reusable renderer and caches them by result hash;
+# GRAPH_VIEW=pyvis writes a standalone pyvis page into static/ per query.
+GRAPH_VIEW = os.getenv("GRAPH_VIEW", "json").lower()
+graph_views = GraphViewCache()
+
+def generate_graph(graph_data, cypher=None):
+    if GRAPH_VIEW == "pyvis":
+        return generate_graph_html(graph_data, cypher)
+    return generate_graph_view(graph_data, cypher)
+
+def generate_graph_view(graph_data, cypher=None):
+    key = content_hash({"cypher": cypher, "rows": graph_data})
+    if key not in graph_views:
+        net = GraphBuilder(directed=True)
+        converter = build_network(net, graph_data, cypher)
+        view = dict(net.to_dict(), key=key)
+        kg_tables.refresh(services.graph, cypher_cache.check_fingerprint(services.graph))
+        # Predecessor edges point backwards in time; lay them out right to left.
+        columns = " ".join(graph_data[0]).lower() if graph_data and isinstance(graph_data[0], dict) else ""
+        edge_types = " ".join(converter.edge_types()).lower()
+        detail = prepare_view(view, operation_groups(kg_tables.views.get("process_operations", [])),
+                              reverse="predecessor" in columns or "predecessor" in edge_types)
+        graph_views.put(key, json.dumps(view, ensure_ascii=False, separators=(",", ":"), default=str), detail)
+    return f"{GRAPH_VIEW_PREFIX}{key}"
+
+def generate_graph_html(graph_data, cypher=None):
+    from pyvis.network import Network
     net = Network(height="750px", width="100%", directed=True, notebook=False)
-    node_records = {}
-
-    data_format = detect_data_format(graph_data)
-
-    format_handlers = {
-        "A": process_format_a,
-        "B": process_format_b,
-        "C": process_format_c,
-        "D": process_format_d
-    }
-
-    handler = format_handlers.get(data_format)
-    if handler:
-        handler(net, graph_data, node_records)
-
-    configure_network(net)
+    build_network(net, graph_data, cypher)
     return save_network(net)
 
-def add_node_if_absent(net, node_records, node_id, label=None, color="#97c2fc", shape="box"):
-    if node_id not in node_records:
-        net.add_node(node_id, label=label or node_id, color=color, shape=shape)
-        node_records[node_id] = True
-
-def process_format_a(net, data, node_records):
-    for item in data:
-        if isinstance(item, dict):
-            for value in item.values():
-                if isinstance(value, dict):
-                    node_id = str(value.get("name", uuid.uuid4()))
-                    add_node_if_absent(net, node_records, node_id, label=generate_attribute_label(value))
-
-def process_format_b(net, data, node_records):
-    if not data or not isinstance(data[0], dict):
-        return
-
-    keys = list(data[0].keys())[:2]
-    if len(keys) < 2:
-        return
-
-    field1, field2 = keys
-    for item in data:
-        node1 = str(item.get(field1, ""))
-        node2 = str(item.get(field2, ""))
-        if node1 and node2:
-            add_node_if_absent(net, node_records, node1, color="#97c2fc", shape="box")
-            add_node_if_absent(net, node_records, node2, color="#fc9797", shape="box")
-            net.add_edge(node1, node2, color="#666666")
-
-def process_format_c(net, data, node_records):
-    if not data or not isinstance(data[0], dict):
-        return
-
-    sample = data[0]
-    dict_field = next((k for k, v in sample.items() if isinstance(v, dict)), None)
-    if not dict_field:
-        return
-
-    for item in data:
-        dict_data = item.get(dict_field, {})
-        node1 = str(dict_data.get("name", uuid.uuid4()))
-        add_node_if_absent(net, node_records, node1, label=generate_attribute_label(dict_data))
-
-        other_keys = [k for k in item.keys() if k != dict_field]
-        if not other_keys:
-            continue
-
-        node2_field = other_keys[0]
-        node2 = str(item.get(node2_field, ""))
-        add_node_if_absent(net, node_records, node2, color="#fc9797", shape="diamond")
-
-        rel_field = next((k for k in other_keys if k != node2_field), None)
-        rel = str(item.get(rel_field, "")) if rel_field else ""
-        net.add_edge(node1, node2, label=rel, color="#666666")
-
-def process_format_d(net, data, node_records):
-    if not data or not isinstance(data[0], dict):
-        return
-
-    fields = list(data[0].keys())
-    if len(fields) < 3:
-        return
-
-    node1_field, node2_field, rel_field = fields[:3]
-
-    for item in data:
-        node1 = str(item.get(node1_field, ""))
-        node2 = str(item.get(node2_field, ""))
-        rel = str(item.get(rel_field, ""))
-        if node1 and node2:
-            add_node_if_absent(net, node_records, node1)
-            add_node_if_absent(net, node_records, node2)
-            net.add_edge(node1, node2, label=rel, color="#666666")
-
-def generate_attribute_label(node_data):
-    name = node_data.get("name", "Node")
-    attrs = "\n".join(f"{k}: {v}" for k, v in node_data.items() if k != "name")
-    return f"{name}\n{attrs}" if attrs else name
-
-def detect_data_format(data):
-    if not data or not isinstance(data, list) or not isinstance(data[0], dict):
-        return "A"
-
-    sample = data[0]
-    dict_fields = [k for k, v in sample.items() if isinstance(v, dict)]
-    if len(dict_fields) == 1 and len(sample) >= 3:
-        return "C"
-    elif len(dict_fields) == 0:
-        if len(sample) == 2:
-            return "B"
-        elif len(sample) >= 3:
-            return "D"
-    return "A"
+def build_network(net, graph_data, cypher=None):
+    converter = convert_result(graph_data, cypher, getattr(services.graph, "structured_schema", None))
+    converter.populate(net)
+    configure_network(net)
+    return converter
 
 def configure_network(net):
     net.toggle_physics(False)
@@ -355,6 +289,7 @@ def save_network(net):
     return f"/static/{filename}"
 
 def get_graph_html(data):
+    from pyvis.network import Network
     net = Network(height='500px', width='100%', notebook=False, directed=True)
     for item in data:
         r = item.get('r', {})
@@ -362,102 +297,386 @@ def get_graph_html(data):
         net.add_node(name, label=name)
     return net.generate_html()
 
-def graph_answer_token_stream(question: str, graph_data, cypher: str):
-    prompt_text = graph_response_prompt.format(question=question, graph_data=graph_data, cypher=cypher)
-    stream = client.chat.completions.create(
-        model      = "gpt-4o",
+def chat_token_stream(model: str, prompt_text: str, trace=None):
+    stream = services.client.chat.completions.create(
+        model      = model,
         messages   = [{"role": "user", "content": prompt_text}],
         temperature= 0,
         stream     = True,
+        stream_options = {"include_usage": True},
     )
     for chunk in stream:
+        if chunk.usage and trace:
+            trace.usage(chunk.usage)
         if chunk.choices and chunk.choices[0].delta.content:
             yield chunk.choices[0].delta.content
 
-def design_answer_token_stream(question: str, history: str):
-    prompt_text = design_qa_prompt.format(question=question, history=history)
+def graph_prompt(question: str, graph_data, cypher: str, trace=None):
+    context, stats = graph_context(graph_data)
+    if trace:
+        trace.context = stats
+    log.info("Graph context %d -> %d tokens (%d saved), %d of %d rows",
+             stats["raw_tokens"], stats["tokens"], stats["tokens_saved"], stats["rows_kept"], stats["rows"])
+    return graph_response_prompt.format(question=question, graph_data=context, cypher=cypher)
+
+def introspect_graph(graph):
+    graph.refresh_schema()
+    if not isinstance(graph, InMemoryGraph):
+        save_graph_schema(graph, graph_schema_key())
+    return cypher_cache.check_fingerprint(graph, force=True)
+
+def cypher_schema(question: str) -> str:
+    graph = services.graph
+    schema_service.refresh(graph, cypher_cache.check_fingerprint(graph), introspect_graph)
+    return schema_service.schema_for(question)
+
+def generate_cypher(question: str) -> str:
+    from langchain_community.chains.graph_qa.cypher import extract_cypher
+    cypher_chain = services.cypher_chain
+    generated = cypher_chain.cypher_generation_chain.run(
+        {"question": question, "schema": cypher_schema(question)}
+    )
+    return extract_cypher(generated)
 
-    stream = client.chat.completions.create(
-        model      = "o1",
-        messages   = [{"role": "user", "content": prompt_text}],
-        temperature= 0,
-        stream     = True
+def run_cypher(cypher: str):
+    if not cypher:
+        return []
+    # Generated Cypher is checked and bounded before it runs (read-only, LIMIT, timeout, paged).
+    with CypherCursor(services.graph, cypher) as cursor:
+        return cursor.fetch_all()
+
+def query_graph(question: str, trace=None):
+    cypher_cache.check_fingerprint(services.graph)
+    cached = cypher_cache.get(question)
+    if cached:
+        return cached["result"], cached["cypher"]
+    with traced(trace, "cypher_generation"):
+        generated = generate_cypher(question)
+    with traced(trace, "graph_query"):
+        graph_data = run_cypher(generated)
+    cypher = generated.replace("cypher", "").strip()
+    cypher_cache.put(question, cypher, graph_data)
+    return graph_data, cypher
+
+def lookup_kg_table(question: str):
+    kg_tables.refresh(services.graph, cypher_cache.check_fingerprint(services.graph))
+    return kg_tables.lookup(question)
+
+def llm_route(question: str) -> str:
+    resp_type = services.router_chain.invoke({"question": question}).content.strip().lower()
+    return resp_type.strip('"\' ')
+
+def route_question(question: str, trace=None) -> str:
+    return local_router.route(question, fallback=llm_route, trace=trace)
+
+def load_plan_problem():
+    kg_tables.refresh(services.graph, cypher_cache.check_fingerprint(services.graph))
+    problem = load_problem_from_views(kg_tables.views)
+    if not problem.operations:
+        problem = load_problem_from_csv()
+    return problem
+
+def design_answer_text(question: str, history: str) -> str:
+    # Plan candidates are scored as a whole, so they are requested without streaming.
+    resp = services.client.chat.completions.create(
+        model    = "o1",
+        messages = [{"role": "user", "content": design_qa_prompt.format(question=question, history=history)}],
     )
+    return resp.choices[0].message.content or ""
 
-    for chunk in stream:
-        if chunk.choices and chunk.choices[0].delta.content:
-            token = chunk.choices[0].delta.content
-            print(token, end="", flush=True)
-            yield token
+def lookup_plan(question: str, trace=None):
+    if not PLAN_LIBRARY_ENABLED:
+        return None
+    try:
+        problem = load_plan_problem()
+        plan_library.import_plans(problem)
+        plan = plan_library.lookup(problem, plan_request_from_question(question))
+        if trace:
+            trace.caches["plan_library"] = plan.kind if plan else "miss"
+        return plan
+    except Exception as e:
+        log.warning("Plan library lookup failed: %s", e)
+        return None
 
-def smart_qa_system(question: str) -> Generator[Tuple[str, Optional[str]], None, None]:
+def warm_start_history(history: str, library_plan) -> str:
+    # A stored plan for a similar request gives the model a feasible starting point to adapt.
+    if library_plan is None or library_plan.reusable:
+        return history
+    return (f"{history}\nReference plan, validated for a similar request; adapt it to the current request:\n"
+            f"{library_plan.markdown()}\n{library_plan.summary()}")
+
+def build_schedule(question: str, history: str = "", library_plan=None):
+    # The scheduler is instant and optimal, so it only reuses plans stored for exactly this request.
+    if library_plan and (library_plan.kind == "exact" or (library_plan.reusable and DESIGN_ENGINE != "scheduler")):
+        return library_plan
+    if DESIGN_ENGINE not in ("scheduler", "search"):
+        return None
+    problem = load_plan_problem()
+    if DESIGN_ENGINE == "scheduler":
+        return solve_plan(problem, question)
+    if not can_schedule(problem):
+        return None
+    generate = (lambda: design_answer_text(question, history)) if PLAN_SEARCH_LLM_CANDIDATES else None
+    seeds = [PlanCandidate(f"library: {library_plan.entry['source']}", library_plan.table())] if library_plan else []
+    return search_plan(problem, question, generate, seeds=seeds)
+
+def validate_plan(rows, question: str, plan_id=None):
+    # Phase 4 is recomputed from the saved rows instead of trusting the model's own checkmarks.
+    if not rows or len(rows) < 2:
+        return None
+    try:
+        request = plan_request_from_question(question)
+        problem = load_plan_problem()
+        report = PlanValidator(problem, request).validate(rows)
+        if plan_id:
+            services.plan_store.set_valid(plan_id, report["valid"])
+        if PLAN_LIBRARY_ENABLED:
+            plan_library.put(problem, request, rows, report, source=DESIGN_ENGINE)
+        return report, "\n\n" + format_report(report, request.quarters)
+    except Exception as e:
+        log.warning("Plan validation failed: %s", e)
+        return None
+
+class PlanCsvWriter:
+    # Opened lazily on the first row so a streamed plan is written while the answer is still generating;
+    # the complete table goes to the plan store on close, under the same unique plan id.
+    def __init__(self, trace=None, source=None):
+        self.trace = trace
+        self.source = source
+        self.plan_id = None
+        self.path = None
+        self.file = None
+        self.writer = None
+        self.rows = []
+        self.failed = False
+
+    def write(self, row):
+        self.rows.append(row)
+        if self.failed:
+            return
+        try:
+            if self.writer is None:
+                self.plan_id = new_plan_id()
+                os.makedirs(PLANS_DIR, exist_ok=True)
+                self.path = f"{PLANS_DIR}/assembly_plan_{self.plan_id}.csv"
+                self.file = open(self.path, "w", newline='', encoding="utf-8-sig")
+                self.writer = csv.writer(self.file)
+            self.writer.writerow(row)
+            self.file.flush()
+        except Exception as e:
+            log.warning("Write plan CSV failed: %s", e)
+            self.failed = True
+
+    def store(self):
+        try:
+            self.plan_id = services.plan_store.add(
+                self.rows, self.plan_id, session=self.trace.session_id if self.trace else None,
+                question=self.trace.question if self.trace else None, source=self.source,
+                csv_path=None if self.failed else self.path)
+        except Exception as e:
+            log.warning("Store plan failed: %s", e)
+            self.plan_id = None
+        if self.trace:
+            self.trace.plan_id = self.plan_id
+
+    def discard(self):
+        # The answer ended early: drop the partial CSV and store nothing.
+        if self.file:
+            self.file.close()
+            self.file = None
+        try:
+            if self.path and os.path.exists(self.path):
+                os.remove(self.path)
+        except OSError as e:
+            log.warning("Remove partial plan CSV failed: %s", e)
+        self.path = None
+        self.rows = []
+
+    def close(self):
+        if self.file:
+            self.file.close()
+        if self.rows:
+            self.store()
+        if self.failed:
+            return "\n⚠️ CSV generation failed."
+        if self.path is None:
+            return "\n⚠️ No formatting compliant Markdown table detected, CSV not saved."
+        if self.trace:
+            self.trace.plan = self.path
+        return f"\n\n✅ **The assembly plan has been saved as a CSV file:** `{self.path}`"
+
+def save_plan_csv(rows, trace=None, source=None):
+    writer = PlanCsvWriter(trace, source or DESIGN_ENGINE)
+    for row in rows or []:
+        writer.write(row)
+    return writer.close()
+
+class Call:
+    """A pipeline step that does I/O: the driver runs the backend function `name` with `args` and sends
+    back its result (the async driver awaits the async variant or runs it in a thread)."""
+
+    def __init__(self, name, *args):
+        self.name = name
+        self.args = args
+
+
+class Stream:
+    """An LLM answer streamed to the user: each token is passed to `on_token` and yielded with `graph`."""
+
+    def __init__(self, name, model, prompt, stage, on_token, graph=None):
+        self.name = name
+        self.model = model
+        self.prompt = prompt
+        self.stage = stage
+        self.on_token = on_token
+        self.graph = graph
+
+
+def qa_pipeline(question: str, session_id: Optional[str], trace):
+    """The QA pipeline shared by `smart_qa_system` and `smart_qa_system_async`.
+
+    Yields (text, graph_path) pairs for the user, and Call / Stream steps that the driver runs with
+    sync or async I/O; a failed step is thrown back in here, and closing the pipeline cancels it.
+    """
+    memory = memory_store.get(session_id)
     history = memory.load_memory_variables({}).get('history', '')
-    graph_html_path = None
-    answer_full = ""
+    answer_parts = []
+    facts = {}
+    status = "cancelled"
 
     try:
-        resp_type = router_chain.invoke({"question": question}).content.strip().lower()
-        resp_type = resp_type.strip('"\' ')
+        with trace.stage("route"):
+            resp_type = yield Call("route_question", question, trace)
+        trace.route = resp_type
 
         if resp_type == "graph":
 
-            cypher_output = cypher_chain.invoke({"query": question})
-            graph_data    = cypher_output.get("result", cypher_output)
-            cypher        = cypher_output.get("intermediate_steps", [{}])[0].get("query", "").replace("cypher", "").strip()
-
-            graph_html_path = generate_graph_html(graph_data)
+            with trace.stage("kg_lookup"):
+                kg_view = yield Call("lookup_kg_table", question)
+            if kg_view:
+                graph_data, cypher = kg_view["rows"], kg_view["cypher"]
+                facts[kg_view["family"]] = kg_view["answer"]
+            else:
+                graph_data, cypher = yield Call("query_graph", question, trace)
+            trace.cypher = cypher
 
-            answer_full = ""
+            with trace.stage("graph_html"):
+                graph_html_path = yield Call("generate_graph", graph_data, cypher)
 
             yield "", graph_html_path
-            for tok in graph_answer_token_stream(question, graph_data, cypher):
-                answer_full += tok
-                yield tok, graph_html_path
+            if kg_view and not KG_TABLES_SUMMARIZE:
+                answer_parts.append(kg_view["answer"])
+                yield kg_view["answer"], graph_html_path
+            else:
+                prompt_text = graph_prompt(question, graph_data, cypher, trace)
+                yield Stream("graph_answer", "gpt-4o", prompt_text, "summary", answer_parts.append, graph_html_path)
 
         else:
 
             yield "", None
 
-            for tok in design_answer_token_stream(question, history):
-                answer_full += tok
-                yield tok, None
+            with trace.stage("schedule"):
+                library_plan = yield Call("lookup_plan", question, trace)
+                schedule = yield Call("build_schedule", question, history, library_plan)
+            if schedule:
+                plan_text = f"**Phase 3. Plan Generation**\n\n{schedule.markdown()}\n\n{schedule.summary()}\n\n"
+                answer_parts.append(plan_text)
+                yield plan_text, None
+                prompt_text = design_explain_prompt.format(question=question, history=history, plan=plan_text)
+                yield Stream("design_explain", "gpt-4o", prompt_text, "summary", answer_parts.append)
+                cleaned_rows = schedule.table()
+                facts["latest plan"] = schedule.summary()
+                with trace.stage("csv_export"):
+                    csv_msg = save_plan_csv(cleaned_rows, trace)
+            else:
+                parser = Phase3TableParser()
+                csv_writer = PlanCsvWriter(trace, "llm")
 
-            csv_msg = ""
-            markdown_table = extract_phase3_table(answer_full)
-            if markdown_table:
+                def on_token(tok):
+                    answer_parts.append(tok)
+                    for row in parser.feed(tok):
+                        csv_writer.write(row)
+
+                prompt_text = design_qa_prompt.format(question=question,
+                                                      history=warm_start_history(history, library_plan))
                 try:
-                    cleaned_rows = clean_markdown_table(markdown_table)
-                    timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-                    os.makedirs("./plans", exist_ok=True)
-                    csv_path = f"./plans/assembly_plan_{timestamp}.csv"
-                    with open(csv_path, "w", newline='', encoding="utf-8-sig") as f:
-                        csv.writer(f).writerows(cleaned_rows)
-                    csv_msg = f"\n\n✅ **The assembly plan has been saved as a CSV file:** `{csv_path}`"
-                except Exception as e:
-                    csv_msg = "\n⚠️ CSV generation failed."
-            else:
-                csv_msg = "\n⚠️ No formatting compliant Markdown table detected, CSV not saved."
+                    yield Stream("design_answer", "o1", prompt_text, "design", on_token)
+                except BaseException:
+                    # Cancelled or failed mid-answer: a truncated table must not become a saved plan.
+                    csv_writer.discard()
+                    raise
+                with trace.stage("csv_export"):
+                    for row in parser.close():
+                        csv_writer.write(row)
+                    csv_msg = csv_writer.close()
+                cleaned_rows = parser.table()
 
             if csv_msg:
-                answer_full += csv_msg
+                answer_parts.append(csv_msg)
                 yield csv_msg, None
 
-        memory.save_context({"input": question}, {"output": answer_full})
+            with trace.stage("validation"):
+                validation = yield Call("validate_plan", cleaned_rows, question, trace.plan_id)
+            if validation:
+                answer_parts.append(validation[1])
+                facts.setdefault("latest plan", validation[1].strip())
+                yield validation[1], None
+
+        memory.save_context({"input": question}, {"output": "".join(answer_parts)}, facts)
+        status = "ok"
 
     except Exception as e:
+        status = "error"
         err = f"Sorry, there was an error while processing your issue：{e}"
-        print("【ERROR】", e)
+        log.exception("QA pipeline failed: %s", e)
         yield err, None
 
+    finally:
+        trace.finish(status)
+
+def smart_qa_system(question: str, session_id: Optional[str] = None) -> Generator[Tuple[str, Optional[str]], None, None]:
+    trace = Trace(question, metrics_sink, session_id)
+    pipeline = qa_pipeline(question, session_id, trace)
+    try:
+        step = next(pipeline)
+        while True:
+            try:
+                if isinstance(step, tuple):
+                    yield step
+                    result = None
+                elif isinstance(step, Stream):
+                    for tok in trace.stream(step.name, chat_token_stream(step.model, step.prompt, trace)):
+                        step.on_token(tok)
+                        yield tok, step.graph
+                    result = None
+                else:
+                    result = globals()[step.name](*step.args)
+            except Exception as e:
+                step = pipeline.throw(e)
+                continue
+            step = pipeline.send(result)
+    except StopIteration:
+        return
+    finally:
+        pipeline.close()
+
 if __name__ == "__main__":
+    configure_logging()
     print("The knowledge graph question answering system has been launched. Enter 'exit' or 'quit' to exit.")
     while True:
         try:
             user_input = input("\nUser query: ")
             if user_input.lower() in ['exit', 'quit']:
                 break
-            response = smart_qa_system(user_input)
-            print("\nAnswer:", response)
+            print("\nAnswer: ", end="", flush=True)
+            graph_path = None
+            # No session id: CLI plans have no owner, so every UI session can export them.
+            for tok, path in smart_qa_system(user_input):
+                print(tok, end="", flush=True)
+                graph_path = path or graph_path
+            print()
+            if graph_path:
+                print("Graph:", graph_path)
         except Exception as e:
             print(f"Error: {str(e)}")
             print("The system will continue to operate ...")
\ No newline at end of file
@@ -0,0 +1,230 @@
+"""Batch QA: runs a file of questions through smart_qa_system with parallel workers.
+
+Questions come from JSONL ({"id": ..., "question": ...} per line), CSV (a "question" column, optional
+"id") or text files (one question per file, like the recorded prompts); globs are expanded. Answers,
+Cypher, plan CSVs and timings are appended to the results file as each question finishes.
+
+    python batch_qa.py                                   # the prompts in Q&A_records
+    python batch_qa.py questions.jsonl --workers 4 --rate 0.5 --output results.jsonl
+    python batch_qa.py questions.csv --resume            # skip questions already answered
+"""
+import argparse
+import csv
+import glob
+import json
+import os
+import re
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+QA_RECORDS_DIR = os.path.join(current_dir, os.pardir, "Q&A_records")
+DEFAULT_INPUTS = [os.path.join(QA_RECORDS_DIR, "Case_*", "[Pp]rompt_case_*.txt")]
+
+BATCH_WORKERS = int(os.getenv("BATCH_WORKERS", "4"))
+# Questions started per second across all workers; 0 means no limit.
+BATCH_RATE = float(os.getenv("BATCH_RATE", "1"))
+
+
+def _question_id(path, index=None):
+    stem = os.path.splitext(os.path.basename(path))[0]
+    return stem if index is None else f"{stem}:{index}"
+
+
+def read_questions(path):
+    """(id, question) pairs from one JSONL, CSV or text file."""
+    ext = os.path.splitext(path)[1].lower()
+    with open(path, encoding="utf-8-sig") as f:
+        if ext == ".jsonl":
+            for n, line in enumerate(f, 1):
+                if not line.strip():
+                    continue
+                item = json.loads(line)
+                if isinstance(item, str):
+                    item = {"question": item}
+                yield str(item.get("id") or _question_id(path, n)), item["question"]
+        elif ext == ".csv":
+            for n, row in enumerate(csv.DictReader(f), 1):
+                question = row.get("question") or next(iter(row.values()), "")
+                if question and question.strip():
+                    yield str(row.get("id") or _question_id(path, n)), question.strip()
+        else:
+            text = f.read().strip()
+            if text:
+                yield _question_id(path), text
+
+
+def _natural_key(path):
+    # Case_2 before Case_10.
+    return [int(part) if part.isdigit() else part.lower() for part in re.split(r"(\d+)", path)]
+
+
+def load_questions(inputs):
+    questions, seen = [], set()
+    for pattern in inputs:
+        paths = sorted(glob.glob(pattern), key=_natural_key) or [pattern]
+        for path in paths:
+            for qid, question in read_questions(path):
+                if qid in seen:
+                    raise ValueError(f"Duplicate question id {qid!r} in {path}")
+                seen.add(qid)
+                questions.append((qid, question))
+    return questions
+
+
+def answered_ids(path):
+    """Ids with an "ok" result in an earlier run's results file."""
+    done = set()
+    if os.path.exists(path):
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    result = json.loads(line)
+                except ValueError:
+                    continue
+                if result.get("status") == "ok":
+                    done.add(result["id"])
+    return done
+
+
+class RateLimiter:
+    """Token bucket: at most `rate` acquisitions per second on average, bursts of up to `burst`."""
+
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        if self.rate <= 0:
+            return
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+def make_sink(path):
+    """A metrics sink that also keeps each batch request's trace, keyed by session id."""
+    from tracing import MetricsSink
+
+    class BatchSink(MetricsSink):
+        def __init__(self, path):
+            super().__init__(path=path)
+            self.traces = {}
+
+        def record(self, trace):
+            super().record(trace)
+            with self.lock:
+                self.traces[trace["session"]] = trace
+
+    return BatchSink(path)
+
+
+def run_question(backend, limiter, sink, qid, question):
+    limiter.acquire()
+    session_id = f"batch-{qid}"
+    start = time.perf_counter()
+    first = None
+    parts = []
+    graph_path = None
+    for tok, path in backend.smart_qa_system(question, session_id):
+        if first is None and tok:
+            first = time.perf_counter() - start
+        parts.append(tok)
+        graph_path = path or graph_path
+    trace = sink.traces.pop(session_id, {})
+    return {
+        "id": qid,
+        "question": question,
+        "route": trace.get("route"),
+        "status": trace.get("status", "error"),
+        "answer": "".join(parts),
+        "graph": graph_path,
+        "cypher": trace.get("cypher"),
+        "plan": trace.get("plan"),
+        "caches": trace.get("caches", {}),
+        "elapsed_s": round(time.perf_counter() - start, 4),
+        "ttft_s": round(first, 4) if first is not None else None,
+        "stages": trace.get("stages", {}),
+        "tokens_in": trace.get("tokens_in"),
+        "tokens_out": trace.get("tokens_out"),
+    }
+
+
+def run_batch(backend, questions, output, workers=BATCH_WORKERS, rate=BATCH_RATE):
+    from tracing import TRACE_PATH
+
+    # Every request shares the backend's Cypher cache, KG tables and plan library, so repeated and
+    # similar questions in a batch cost one LLM round trip.
+    sink = backend.metrics_sink = make_sink(TRACE_PATH)
+    limiter = RateLimiter(rate, burst=max(1, workers))
+    counts = {"ok": 0, "error": 0}
+    start = time.perf_counter()
+    with open(output, "a", encoding="utf-8") as out, ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(run_question, backend, limiter, sink, qid, question): qid
+                   for qid, question in questions}
+        for n, future in enumerate(as_completed(futures), 1):
+            qid = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                result = {"id": qid, "status": "error", "answer": f"{type(e).__name__}: {e}"}
+            status = "ok" if result["status"] == "ok" else "error"
+            counts[status] += 1
+            out.write(json.dumps(result, ensure_ascii=False) + "\n")
+            out.flush()
+            print(f"[{n}/{len(futures)}] {qid}: {result['status']} "
+                  f"{result.get('route') or '-'} {result.get('elapsed_s', 0):.1f} s", flush=True)
+    counts["elapsed_s"] = round(time.perf_counter() - start, 2)
+    counts["router"] = backend.local_router.stats()
+    counts["plan_library"] = backend.plan_library.stats()
+    return counts
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("inputs", nargs="*", help="JSONL, CSV or text files, or globs (default: Q&A_records prompts)")
+    parser.add_argument("--output", default="batch_results.jsonl", help="results are appended to this JSONL file")
+    parser.add_argument("--workers", type=int, default=BATCH_WORKERS)
+    parser.add_argument("--rate", type=float, default=BATCH_RATE, help="questions started per second, 0 for no limit")
+    parser.add_argument("--resume", action="store_true", help="skip ids with an ok result in --output")
+    args = parser.parse_args(argv)
+
+    questions = load_questions(args.inputs or DEFAULT_INPUTS)
+    if args.resume:
+        done = answered_ids(args.output)
+        questions = [(qid, q) for qid, q in questions if qid not in done]
+    if not questions:
+        print("No questions to run.")
+        return 0
+
+    sys.path.insert(0, current_dir)
+    from tracing import configure_logging
+    configure_logging()
+    import backend
+    counts = run_batch(backend, questions, args.output, args.workers, args.rate)
+    print(f"\n{counts['ok']} ok, {counts['error']} failed in {counts['elapsed_s']} s; results in {args.output}")
+    router = counts["router"]
+    saved = router["saved_seconds"]
+    print(f"router: {router['hit_rate']:.0%} answered locally ({router['rule_hits']} rule, "
+          f"{router['model_hits']} model, {router['fallbacks']} LLM)"
+          + (f", about {saved:.1f} s of LLM routing saved" if saved is not None else ""))
+    plans = counts["plan_library"]
+    print(f"plan library: {plans['exact']} exact, {plans['compatible']} compatible, {plans['near']} near, "
+          f"{plans['miss']} miss; {plans['size']} plans stored")
+    return 1 if counts["error"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
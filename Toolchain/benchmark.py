@@ -0,0 +1,369 @@
+"""Offline benchmark of smart_qa_system.
+
+Runs the real pipeline against the in-memory graph loaded from domain_KG.json and a fake chat
+model that replays the design answers recorded in Q&A_records, so it needs neither OpenAI nor Neo4j.
+
+    python benchmark.py --concurrency 1,4,8 --requests 40 --json bench.json
+    python benchmark.py --baseline bench.json --tolerance 0.25   # exit code 1 on regression
+    python benchmark.py --driver async                            # the async path the app serves
+"""
+import argparse
+import asyncio
+import glob
+import itertools
+import json
+import os
+import re
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+QA_RECORDS_DIR = os.path.join(current_dir, os.pardir, "Q&A_records")
+
+os.environ.setdefault("KG_BACKEND", "memory")
+os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+os.environ.setdefault("TRACE_PATH", "")
+
+PLAN_QUESTION = (
+    "Please help me design a complete aircraft fuselage joint plan that includes four 1/4 bodies, "
+    "using both automatic and manual methods."
+)
+
+# Graph questions outside the precomputed KG tables, with the Cypher the fake model "generates".
+FAKE_CYPHER = {
+    "What is the duration of each manual operation?":
+        "MATCH (o:Operation) WHERE o.op_type = 'Manual' RETURN o.name AS Operation, o.duration AS Duration",
+    "Show the operations that require the Station platform.":
+        "MATCH (o:Operation)-[r:requiresResource]->(res:Resource) WHERE res.name = 'Station platform' "
+        "RETURN o, r, res",
+    "Show the sub-process tree of the aircraft fuselage joint.":
+        "MATCH p=(a:Process)-[:hasSubprocess*1..3]->(b:Process) RETURN p",
+    "Which operations come before the inspection operation?":
+        "MATCH (o:Operation)-[:hasPredecessors*1..]->(p:Operation) WHERE o.name CONTAINS 'Inspection' "
+        "RETURN o, p",
+}
+
+WORKLOADS = {
+    "tables": [
+        "List all information of processes and their sub-processes.",
+        "List all information of operations.",
+        "List all information of resources.",
+        "List all predecessors of each operation.",
+    ],
+    "cypher": list(FAKE_CYPHER),
+    "design": [PLAN_QUESTION],
+}
+
+DEFAULT_CYPHER = "MATCH (o:Operation) RETURN o.name AS Operation LIMIT 25"
+
+PHASE1_HEADING = re.compile(r"^\s*(?:#+\s*)?(?:\*\*\s*)?Phase\s*1\b", re.IGNORECASE)
+LOG_LINE = re.compile(r"^(\d{4}-\d{2}-\d{2} |INFO:|输出)")
+
+
+def load_design_answers(records_dir=QA_RECORDS_DIR):
+    # Every recorded answer starts at its Phase 1 heading and runs until the next log line or answer.
+    answers = []
+    for path in sorted(glob.glob(os.path.join(records_dir, "Case_*", "Case_*.txt"))):
+        with open(path, encoding="utf-8", errors="replace") as f:
+            lines = f.read().split("\n")
+        current = None
+        for line in lines + [""]:
+            starts_answer = bool(PHASE1_HEADING.match(line))
+            if current is not None and (starts_answer or LOG_LINE.match(line)):
+                text = "\n".join(current).strip()
+                if re.search(r"Phase\s*3", text, re.IGNORECASE):
+                    answers.append(text)
+                current = None
+            if starts_answer:
+                current = []
+            if current is not None:
+                current.append(line)
+    return answers
+
+
+class FakeChatClient:
+    """Stands in for `OpenAI()`: replays recorded answers as a chunked token stream."""
+
+    def __init__(self, design_answers, chunk_chars=4, ttft=0.0, token_delay=0.0):
+        self.design_answers = itertools.cycle(design_answers or ["**Phase 3. Plan Generation**\n"])
+        self.chunk_chars = chunk_chars
+        self.ttft = ttft
+        self.token_delay = token_delay
+        self.lock = threading.Lock()
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def _answer(self, model, prompt):
+        if "Phase 3. **Plan Generation**" in prompt:
+            with self.lock:
+                return next(self.design_answers)
+        m = re.search(r"Knowledge Graph Query Results:(.*?)\n\*\*Response Guidelines", prompt, re.S)
+        results = m.group(1).strip() if m else prompt[-1500:]
+        return "Based on the knowledge graph results:\n\n" + "\n".join(
+            f"- {item.strip()}" for item in results[:2000].split("}, {"))
+
+    def create(self, model, messages, stream=False, **kwargs):
+        prompt = messages[-1]["content"]
+        text = self._answer(model, prompt)
+        if not stream:
+            return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=text))], usage=None)
+        return self._stream(prompt, text)
+
+    def _chunks(self, prompt, text):
+        chunks = 0
+        for i in range(0, len(text), self.chunk_chars):
+            chunks += 1
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=text[i:i + self.chunk_chars]))],
+                                  usage=None)
+        yield SimpleNamespace(choices=[], usage=SimpleNamespace(prompt_tokens=len(prompt) // 4, completion_tokens=chunks))
+
+    def _stream(self, prompt, text):
+        if self.ttft:
+            time.sleep(self.ttft)
+        for chunk in self._chunks(prompt, text):
+            if self.token_delay and chunk.choices:
+                time.sleep(self.token_delay)
+            yield chunk
+
+
+class FakeAsyncChatClient:
+    """Stands in for `AsyncOpenAI()` with the answers of a FakeChatClient; delays do not block the loop."""
+
+    def __init__(self, client):
+        self.client = client
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    async def create(self, model, messages, stream=False, **kwargs):
+        prompt = messages[-1]["content"]
+        text = self.client._answer(model, prompt)
+        if not stream:
+            return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=text))], usage=None)
+        return FakeAsyncStream(self.client, prompt, text)
+
+
+class FakeAsyncStream:
+    def __init__(self, client, prompt, text):
+        self.client = client
+        self.chunks = client._chunks(prompt, text)
+        self.started = False
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if not self.started:
+            self.started = True
+            if self.client.ttft:
+                await asyncio.sleep(self.client.ttft)
+        chunk = next(self.chunks, None)
+        if chunk is None:
+            raise StopAsyncIteration
+        if self.client.token_delay and chunk.choices:
+            await asyncio.sleep(self.client.token_delay)
+        return chunk
+
+    async def close(self):
+        self.chunks.close()
+
+
+def install_fakes(backend, args):
+    from cypher_cache import CypherCache
+    from plan_library import PlanLibrary
+    from plan_store import PlanStore
+
+    client = FakeChatClient(load_design_answers(), args.chunk_chars, args.ttft, args.token_delay)
+    backend.services.override("client", client)
+    backend.llm_route = lambda question: "graph"
+    backend.generate_cypher = lambda question: FAKE_CYPHER.get(question, DEFAULT_CYPHER)
+    backend.DESIGN_ENGINE = args.design_engine
+    import context_compactor
+    context_compactor.TOKEN_COUNT = args.token_count
+    context_compactor._encoding.cache_clear()
+    backend.cypher_cache = CypherCache(path=None, max_entries=0 if args.cold else 256)
+    backend.plan_library = PlanLibrary(path=None)
+    backend.services.override("plan_store", PlanStore(path=None))
+    backend.PLAN_LIBRARY_ENABLED = not args.cold
+    if args.cold:
+        backend.lookup_kg_table = lambda question: None
+    if args.driver == "async":
+        import async_backend
+
+        async def generate_cypher_async(question):
+            return backend.generate_cypher(question)
+
+        async def llm_route_async(question):
+            return "graph"
+
+        async_backend._client = FakeAsyncChatClient(client)
+        async_backend.generate_cypher_async = generate_cypher_async
+        async_backend.llm_route_async = llm_route_async
+
+
+def run_request(backend, question, session_id):
+    start = time.perf_counter()
+    first = None
+    for tok, _ in backend.smart_qa_system(question, session_id):
+        if first is None and tok:
+            first = time.perf_counter() - start
+    return time.perf_counter() - start, first
+
+
+async def run_request_async(async_backend, question, session_id):
+    start = time.perf_counter()
+    first = None
+    async for tok, _ in async_backend.smart_qa_system_async(question, session_id):
+        if first is None and tok:
+            first = time.perf_counter() - start
+    return time.perf_counter() - start, first
+
+
+async def run_requests_async(questions, concurrency, requests):
+    # The app's path: one event loop, `concurrency` requests in flight.
+    import async_backend
+
+    async_backend._semaphores.clear()  # bound to the previous level's loop
+    slots = asyncio.Semaphore(concurrency)
+
+    async def run(i):
+        async with slots:
+            return await run_request_async(async_backend, questions[i % len(questions)], f"bench-{i % concurrency}")
+
+    return await asyncio.gather(*(run(i) for i in range(requests)))
+
+
+def run_level(backend, questions, concurrency, requests, trace_memory=False, driver="sync"):
+    from tracing import MetricsSink, _percentiles
+
+    sink = backend.metrics_sink = MetricsSink(path="", prometheus_path="")
+    if trace_memory:
+        tracemalloc.start()
+    start = time.perf_counter()
+    if driver == "async":
+        results = asyncio.run(run_requests_async(questions, concurrency, requests))
+    else:
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            futures = [pool.submit(run_request, backend, questions[i % len(questions)], f"bench-{i % concurrency}")
+                       for i in range(requests)]
+            results = [f.result() for f in futures]
+    elapsed = time.perf_counter() - start
+    peak_mb = None
+    if trace_memory:
+        peak_mb = round(tracemalloc.get_traced_memory()[1] / 1e6, 2)
+        tracemalloc.stop()
+    return {
+        "concurrency": concurrency,
+        "requests": requests,
+        "errors": sink.counters["status_error"],
+        "context_tokens_saved": sink.counters["context_tokens_saved"],
+        "caches": sink.cache_stats(),
+        "rps": round(requests / elapsed, 2),
+        "latency": _percentiles(r[0] for r in results),
+        "first_token": _percentiles(r[1] for r in results if r[1] is not None),
+        "stages": sink.summary(),
+        "peak_traced_mb": peak_mb,
+        "max_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1) if resource else None,
+    }
+
+
+def print_report(results):
+    for name, levels in results.items():
+        print(f"\n== workload: {name}")
+        print(f"{'conc':>5} {'req':>5} {'err':>4} {'rps':>9} {'p50 ms':>9} {'p95 ms':>9} {'ttft p50':>9} {'rss MB':>8}")
+        for r in levels:
+            print(f"{r['concurrency']:>5} {r['requests']:>5} {r['errors']:>4} {r['rps']:>9} "
+                  f"{r['latency']['p50'] * 1000:>9.1f} {r['latency']['p95'] * 1000:>9.1f} "
+                  f"{r['first_token'].get('p50', 0) * 1000:>9.1f} {r['max_rss_mb'] or '-':>8}")
+        saved = levels[-1].get("context_tokens_saved")
+        if saved:
+            print(f"  graph context tokens saved: {saved} over {levels[-1]['requests']} requests")
+        for cache, stats in sorted(levels[-1].get("caches", {}).items()):
+            outcomes = ", ".join(f"{k} {v}" for k, v in sorted(stats.items())
+                                 if k not in ("hit_rate", "llm_seconds_saved"))
+            saved_s = stats.get("llm_seconds_saved")
+            print(f"  {cache} hit rate: {stats['hit_rate']:.0%} ({outcomes})"
+                  + (f", LLM routing saved {saved_s:.3f} s" if saved_s is not None else ""))
+        print("  stages (p50 / p95 ms, highest concurrency):")
+        for stage, stats in sorted(levels[-1]["stages"].items()):
+            if not stage.endswith(".tokens_per_s"):
+                print(f"    {stage:<26} {stats['p50'] * 1000:>9.2f} {stats['p95'] * 1000:>9.2f}")
+
+
+def compare(results, baseline, tolerance):
+    regressions = []
+    for name, levels in results.items():
+        old = {r["concurrency"]: r for r in baseline.get(name, [])}
+        for r in levels:
+            prev = old.get(r["concurrency"])
+            if not prev:
+                continue
+            if r["latency"]["p95"] > prev["latency"]["p95"] * (1 + tolerance):
+                regressions.append(f"{name} c={r['concurrency']}: p95 {prev['latency']['p95']:.4f}s -> "
+                                   f"{r['latency']['p95']:.4f}s")
+            if r["rps"] < prev["rps"] * (1 - tolerance):
+                regressions.append(f"{name} c={r['concurrency']}: rps {prev['rps']} -> {r['rps']}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workloads", default=",".join(WORKLOADS), help="comma separated: " + ", ".join(WORKLOADS))
+    parser.add_argument("--concurrency", default="1,4,8")
+    parser.add_argument("--requests", type=int, default=24, help="requests per concurrency level")
+    parser.add_argument("--design-engine", default="llm", choices=["llm", "scheduler", "search"])
+    parser.add_argument("--driver", default="sync", choices=["sync", "async"],
+                        help="smart_qa_system on a thread pool, or smart_qa_system_async as served by the app")
+    parser.add_argument("--cold", action="store_true", help="bypass the Cypher cache, KG tables and plan library")
+    parser.add_argument("--chunk-chars", type=int, default=4)
+    parser.add_argument("--token-count", default="chars", choices=["chars", "tiktoken"],
+                        help="how graph context tokens are counted; tiktoken may download its encoding")
+    parser.add_argument("--ttft", type=float, default=0.0, help="simulated seconds before the first token")
+    parser.add_argument("--token-delay", type=float, default=0.0, help="simulated seconds between tokens")
+    parser.add_argument("--trace-memory", action="store_true", help="report tracemalloc peak (slower)")
+    parser.add_argument("--json", help="write results to this file")
+    parser.add_argument("--baseline", help="compare with a previous --json result")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    args = parser.parse_args(argv)
+
+    json_path = os.path.abspath(args.json) if args.json else None
+    baseline_path = os.path.abspath(args.baseline) if args.baseline else None
+    sys.path.insert(0, current_dir)
+    workdir = tempfile.mkdtemp(prefix="qa_bench_")
+    os.chdir(workdir)  # graph HTML and plan CSVs are written relative to the working directory
+    from tracing import configure_logging
+    configure_logging()
+    import backend
+    install_fakes(backend, args)
+
+    levels = [int(c) for c in args.concurrency.split(",")]
+    results = {}
+    for name in args.workloads.split(","):
+        questions = WORKLOADS[name]
+        run_request(backend, questions[0], "warm-up")
+        results[name] = [run_level(backend, questions, c, args.requests, args.trace_memory, args.driver)
+                         for c in levels]
+    print_report(results)
+    print(f"\nartifacts: {workdir}")
+
+    if json_path:
+        with open(json_path, "w") as f:
+            json.dump(results, f, indent=2)
+    if baseline_path:
+        with open(baseline_path) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for line in regressions:
+            print("REGRESSION", line)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,197 @@
+import os
+import re
+from collections import Counter, OrderedDict
+from functools import lru_cache
+
+from tracing import get_logger
+
+# GRAPH_CONTEXT=compact sends graph results to the answer prompt as a deduplicated, dictionary-encoded
+# table cut to GRAPH_CONTEXT_TOKENS; GRAPH_CONTEXT=raw keeps the Python repr of the rows.
+GRAPH_CONTEXT = os.getenv("GRAPH_CONTEXT", "compact").lower()
+GRAPH_CONTEXT_TOKENS = int(os.getenv("GRAPH_CONTEXT_TOKENS", "3000"))
+# Values at least this long that occur more than once are replaced by a short id with one legend entry.
+CONTEXT_ALIAS_MIN_CHARS = int(os.getenv("CONTEXT_ALIAS_MIN_CHARS", "10"))
+TOKEN_MODEL = os.getenv("CONTEXT_TOKEN_MODEL", "gpt-4o")
+# CONTEXT_TOKEN_COUNT=tiktoken counts with the model's encoding; =chars estimates 4 characters per token
+# and never loads tiktoken. tiktoken downloads the encoding once into TIKTOKEN_CACHE_DIR, which defaults
+# to cache/tiktoken here so a server can be given the file ahead of time and run offline.
+TOKEN_COUNT = os.getenv("CONTEXT_TOKEN_COUNT", "tiktoken").lower()
+TIKTOKEN_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache", "tiktoken")
+
+log = get_logger("context")
+
+# "Station platform(2)" -> ("Station platform", "(2)"), for the resource lists stored as one string.
+COUNTED_ITEM = re.compile(r"^(.*?)(\(\d+\))?$", re.S)
+
+
+@lru_cache(maxsize=1)
+def _encoding():
+    if TOKEN_COUNT == "chars":
+        return None
+    os.environ.setdefault("TIKTOKEN_CACHE_DIR", TIKTOKEN_CACHE_DIR)
+    try:
+        import tiktoken
+        return tiktoken.encoding_for_model(TOKEN_MODEL)
+    except Exception as e:  # tiktoken missing, or its encoding file cannot be downloaded
+        log.warning("Token counts are estimated from characters: %s", e)
+        return None
+
+
+def count_tokens(text):
+    encoding = _encoding()
+    if encoding is None:
+        return (len(text) + 3) // 4
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def _prefix(column):
+    initial = re.sub(r"[^A-Za-z]", "", str(column))[:1].upper()
+    return initial or "V"
+
+
+def _items(text):
+    # Lists of counted items ("Station(1), Station platform(2)") are aliased item by item;
+    # anything else, including names that contain commas, is one value.
+    items = text.split(", ")
+    if len(items) > 1 and all(COUNTED_ITEM.match(item).group(2) for item in items):
+        return items
+    return [text]
+
+
+class ContextEncoder:
+    def __init__(self, min_chars=CONTEXT_ALIAS_MIN_CHARS):
+        self.min_chars = min_chars
+        self.counts = Counter()
+        self.aliases = {}
+        self.legend = OrderedDict()
+        self.next_id = Counter()
+        self.touched = []
+
+    # -- pass 1: count repeated values ---------------------------------------
+
+    def observe(self, value):
+        if isinstance(value, dict):
+            name = value.get("name")
+            if name is not None:
+                self.counts[str(name)] += 1
+            for key, item in value.items():
+                if key != "name" and isinstance(item, str):
+                    self.observe(item)
+        elif isinstance(value, (list, tuple)):
+            for item in value:
+                self.observe(item)
+        elif isinstance(value, str):
+            for item in _items(value):
+                self.counts[COUNTED_ITEM.match(item).group(1)] += 1
+
+    # -- pass 2: encode ------------------------------------------------------
+
+    def _alias(self, text, prefix, props=None):
+        alias = self.aliases.get(text)
+        if alias is None:
+            if len(text) < self.min_chars or (self.counts[text] < 2 and not props):
+                return text
+            self.next_id[prefix] += 1
+            alias = self.aliases[text] = f"{prefix}{self.next_id[prefix]}"
+            self.legend[alias] = text
+        if props:
+            # Node properties are listed once, next to the node's legend entry.
+            self.legend[alias] = f"{text} {{{props}}}"
+        self.touched.append(alias)
+        return alias
+
+    def _text(self, text, prefix):
+        parts = []
+        for item in _items(text):
+            name, count = COUNTED_ITEM.match(item).groups()
+            parts.append(self._alias(name, prefix) + (count or ""))
+        return ", ".join(parts)
+
+    def _node(self, node, prefix):
+        props = ", ".join(f"{k}: {self.encode(v, prefix)}" for k, v in node.items() if k != "name")
+        name = node.get("name")
+        if name is None:
+            return "{" + props + "}"
+        alias = self._alias(str(name), prefix, props)
+        if alias == str(name) and props:
+            return f"{name} {{{props}}}"
+        return alias
+
+    def encode(self, value, prefix="V"):
+        if value is None:
+            return ""
+        if isinstance(value, dict):
+            return self._node(value, prefix)
+        if isinstance(value, tuple) and len(value) == 3 and isinstance(value[1], str):
+            return f"{self.encode(value[0], 'N')} -[{value[1]}]-> {self.encode(value[2], 'N')}"
+        if isinstance(value, list):
+            if any(isinstance(item, dict) for item in value):
+                # A path alternates nodes and relationship types.
+                return " ".join(self.encode(item, "N") if isinstance(item, dict) else f"-[{item}]->"
+                                for item in value)
+            return "[" + "; ".join(self.encode(item, prefix) for item in value) + "]"
+        if isinstance(value, str):
+            return self._text(value, prefix)
+        if isinstance(value, float):
+            return f"{value:g}"
+        return str(value)
+
+
+def compact_graph_context(rows, budget=GRAPH_CONTEXT_TOKENS, min_chars=CONTEXT_ALIAS_MIN_CHARS):
+    """Render query rows as a deduplicated table with an id legend, cut to `budget` tokens.
+
+    Returns the text and a stats dict with the token counts of the raw repr and of the compact text.
+    """
+    rows = [row if isinstance(row, dict) else {"value": row} for row in rows or ()]
+    raw_tokens = count_tokens(str(rows))
+    columns = list(OrderedDict.fromkeys(key for row in rows for key in row))
+    encoder = ContextEncoder(min_chars)
+    for row in rows:
+        for value in row.values():
+            encoder.observe(value)
+
+    header = "Columns: " + " | ".join(map(str, columns))
+    used = count_tokens(header) + 16  # headings and the omission note
+    lines, seen, legend_used = [], set(), OrderedDict()
+    omitted = 0
+    for row in rows:
+        encoder.touched.clear()
+        line = " | ".join(encoder.encode(row.get(column), _prefix(column)) for column in columns)
+        if line in seen:
+            continue
+        new_entries = [(alias, encoder.legend[alias]) for alias in OrderedDict.fromkeys(encoder.touched)
+                       if alias not in legend_used]
+        cost = count_tokens(line) + sum(count_tokens(f"{alias} = {text}") for alias, text in new_entries)
+        if lines and used + cost > budget:
+            omitted += 1
+            continue
+        seen.add(line)
+        lines.append(line)
+        legend_used.update(new_entries)
+        used += cost
+
+    parts = [header]
+    if legend_used:
+        parts.append("Legend:\n" + "\n".join(f"{alias} = {text}" for alias, text in legend_used.items()))
+    parts.append(f"Rows ({len(lines)} unique of {len(rows)}):\n" + "\n".join(lines))
+    if omitted:
+        parts.append(f"... {omitted} more rows omitted to fit the context budget.")
+    text = "\n".join(parts)
+    tokens = count_tokens(text)
+    stats = {
+        "rows": len(rows),
+        "rows_kept": len(lines),
+        "raw_tokens": raw_tokens,
+        "tokens": tokens,
+        "tokens_saved": raw_tokens - tokens,
+    }
+    return text, stats
+
+
+def graph_context(rows, mode=GRAPH_CONTEXT, budget=GRAPH_CONTEXT_TOKENS):
+    if mode == "raw":
+        text = str(rows)
+        tokens = count_tokens(text)
+        return text, {"rows": len(rows or ()), "rows_kept": len(rows or ()), "raw_tokens": tokens,
+                      "tokens": tokens, "tokens_saved": 0}
+    return compact_graph_context(rows, budget)
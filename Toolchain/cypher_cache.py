@@ -0,0 +1,224 @@
+import atexit
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from tracing import get_logger
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+CYPHER_CACHE_PATH = os.path.join(current_dir, "cache", "cypher_cache.json")
+
+CYPHER_CACHE_SIZE = int(os.getenv("CYPHER_CACHE_SIZE", "256"))
+CYPHER_CACHE_TTL = float(os.getenv("CYPHER_CACHE_TTL", str(24 * 3600)))
+CYPHER_CACHE_SIMILARITY = float(os.getenv("CYPHER_CACHE_SIMILARITY", "0.85"))
+FINGERPRINT_INTERVAL = float(os.getenv("CYPHER_CACHE_FINGERPRINT_INTERVAL", "60"))
+# New entries are written to disk at most once per CYPHER_CACHE_SAVE_INTERVAL seconds and at exit;
+# 0 writes the file on every put.
+CYPHER_CACHE_SAVE_INTERVAL = float(os.getenv("CYPHER_CACHE_SAVE_INTERVAL", "30"))
+
+log = get_logger("cypher_cache")
+
+STOP_WORDS = {"a", "an", "the", "of", "all", "and", "please", "me", "each", "every", "to", "for", "in", "on"}
+# Ids such as S40_00010 and plain numbers; questions that differ in one of them ask about different things.
+ENTITY = re.compile(r"\b(?:\w+_\d\w*|\d+)\b")
+QUOTED = re.compile(r'"([^"]+)"|“([^”]+)”|(?:^|\s)[\'‘]([^\'’]+)[\'’]')
+
+
+def normalize_question(question):
+    text = question.lower().replace("-", " ")
+    text = re.sub(r"[^\w\s/]", " ", text)
+    return " ".join(text.split())
+
+
+def _singular(word):
+    if word.endswith("sses"):
+        return word[:-2]
+    if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+        return word[:-1]
+    return word
+
+
+def question_tokens(normalized):
+    return frozenset(_singular(w) for w in normalized.split() if w not in STOP_WORDS)
+
+
+def question_entities(question):
+    """Ids, numbers and quoted names in a question, which a near match must agree on exactly."""
+    found = {m.lower() for m in ENTITY.findall(question.replace("-", " "))}
+    for groups in QUOTED.findall(question):
+        name = normalize_question("".join(groups))
+        if name:
+            found.add(name)
+    return tuple(sorted(found))
+
+
+def jaccard(a, b):
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def graph_fingerprint(graph):
+    h = hashlib.sha1()
+    h.update(json.dumps(graph.get_structured_schema, sort_keys=True, default=str).encode())
+    for query in ("MATCH (n) RETURN count(n) AS nodes", "MATCH ()-[r]->() RETURN count(r) AS rels"):
+        try:
+            h.update(json.dumps(graph.query(query), sort_keys=True, default=str).encode())
+        except Exception as e:
+            log.warning("Graph fingerprint query failed: %s", e)
+    return h.hexdigest()[:16]
+
+
+class CypherCache:
+    def __init__(self, path=CYPHER_CACHE_PATH, max_entries=CYPHER_CACHE_SIZE, ttl=CYPHER_CACHE_TTL,
+                 similarity=CYPHER_CACHE_SIMILARITY, save_interval=CYPHER_CACHE_SAVE_INTERVAL):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.similarity = similarity
+        self.save_interval = save_interval
+        self.lock = threading.Lock()
+        self.save_lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.fingerprint = None
+        self.fingerprint_checked = 0.0
+        self.hits = {"exact": 0, "near": 0, "miss": 0}
+        self.dirty = False
+        self._timer = None
+        self.load()
+        if self.path:
+            atexit.register(self.save)
+
+    def load(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            log.warning("Load cypher cache failed: %s", e)
+            return
+        self.fingerprint = data.get("fingerprint")
+        for entry in data.get("entries", []):
+            entry["tokens"] = question_tokens(entry["question"])
+            entry["entities"] = tuple(entry.get("entities") or question_entities(entry["question"]))
+            self.entries[entry["question"]] = entry
+
+    def save(self):
+        """Writes the cache if it changed since the last save."""
+        if not self.path:
+            return
+        with self.lock:
+            self._timer = None
+            if not self.dirty:
+                return
+            self.dirty = False
+            data = {
+                "fingerprint": self.fingerprint,
+                "entries": [{k: v for k, v in e.items() if k != "tokens"} for e in self.entries.values()],
+            }
+        # Lookups do not wait for the disk; concurrent saves are written one after the other.
+        with self.save_lock:
+            try:
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                tmp_path = f"{self.path}.tmp"
+                with open(tmp_path, "w", encoding="utf-8") as f:
+                    json.dump(data, f, default=str)
+                os.replace(tmp_path, self.path)
+            except OSError as e:
+                log.warning("Save cypher cache failed: %s", e)
+
+    def _save_later(self):
+        with self.lock:
+            if not self.path or self._timer is not None:
+                return
+            if self.save_interval > 0:
+                self._timer = threading.Timer(self.save_interval, self.save)
+                self._timer.daemon = True
+                self._timer.start()
+                return
+        self.save()
+
+    def check_fingerprint(self, graph, force=False):
+        now = time.time()
+        if not force and self.fingerprint and now - self.fingerprint_checked < FINGERPRINT_INTERVAL:
+            return self.fingerprint
+        fingerprint = graph_fingerprint(graph)
+        with self.lock:
+            self.fingerprint_checked = now
+            changed = fingerprint != self.fingerprint
+            if changed:
+                self.fingerprint = fingerprint
+                self.entries.clear()
+                self.dirty = True
+        if changed:
+            # Results of the old graph must not be reloaded by the next process.
+            self.save()
+        return fingerprint
+
+    def _expired(self, entry, now):
+        return self.ttl and now - entry["created"] > self.ttl
+
+    def get(self, question):
+        key = normalize_question(question)
+        now = time.time()
+        with self.lock:
+            entry = self.entries.get(key)
+            kind = "exact"
+            if entry is None:
+                tokens = question_tokens(key)
+                entities = question_entities(question)
+                best, best_score = None, 0.0
+                for candidate in self.entries.values():
+                    # Similar wording about another operation or quantity is a different question.
+                    if candidate["entities"] != entities:
+                        continue
+                    score = jaccard(tokens, candidate["tokens"])
+                    if score > best_score:
+                        best, best_score = candidate, score
+                if best is not None and best_score >= self.similarity:
+                    entry, kind = best, "near"
+            if entry is not None and self._expired(entry, now):
+                del self.entries[entry["question"]]
+                entry = None
+            if entry is None:
+                self.hits["miss"] += 1
+                return None
+            self.entries.move_to_end(entry["question"])
+            entry["hits"] += 1
+            self.hits[kind] += 1
+            return entry
+
+    def put(self, question, cypher, result):
+        key = normalize_question(question)
+        with self.lock:
+            self.entries[key] = {
+                "question": key,
+                "tokens": question_tokens(key),
+                "entities": question_entities(question),
+                "cypher": cypher,
+                "result": result,
+                "created": time.time(),
+                "hits": 0,
+            }
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+            self.dirty = True
+        self._save_later()
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.dirty = True
+        self.save()
+
+    def stats(self):
+        with self.lock:
+            total = sum(self.hits.values())
+            return dict(self.hits, size=len(self.entries), fingerprint=self.fingerprint,
+                        hit_rate=(total - self.hits["miss"]) / total if total else 0.0)
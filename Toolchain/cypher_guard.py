@@ -0,0 +1,196 @@
+import os
+import re
+
+from tracing import get_logger
+
+# Generated Cypher is checked and bounded before it reaches the graph: write clauses are rejected,
+# unbounded variable-length patterns get CYPHER_MAX_HOPS, and at most CYPHER_MAX_ROWS rows are read,
+# CYPHER_PAGE_SIZE at a time, within CYPHER_TIMEOUT seconds.
+CYPHER_MAX_ROWS = int(os.getenv("CYPHER_MAX_ROWS", "300"))
+CYPHER_PAGE_SIZE = int(os.getenv("CYPHER_PAGE_SIZE", "100"))
+CYPHER_TIMEOUT = float(os.getenv("CYPHER_TIMEOUT", "20"))
+CYPHER_MAX_HOPS = int(os.getenv("CYPHER_MAX_HOPS", "6"))
+# Read-only procedures generated queries may CALL.
+CYPHER_ALLOWED_PROCEDURES = tuple(p.strip().lower() for p in os.getenv(
+    "CYPHER_ALLOWED_PROCEDURES", "db.labels,db.relationshipTypes,db.propertyKeys,db.schema.").split(",") if p.strip())
+
+WRITE_KEYWORDS = {"CREATE", "MERGE", "DELETE", "DETACH", "SET", "REMOVE", "DROP", "FOREACH", "LOAD",
+                  "TRANSACTIONS", "GRANT", "DENY", "REVOKE", "ALTER", "RENAME", "START", "STOP", "TERMINATE"}
+
+log = get_logger("cypher_guard")
+
+_STRING_OR_COMMENT = re.compile(r"'(?:\\.|[^'\\])*'|\"(?:\\.|[^\"\\])*\"|`[^`]*`|//[^\n]*|/\*.*?\*/", re.S)
+_WORD = re.compile(r"[A-Za-z_][A-Za-z0-9_]*")
+_REL_PATTERN = re.compile(r"<?-\s*\[([^\[\]]*)\]")
+_VAR_LENGTH = re.compile(r"\*\s*(\d+)?\s*(\.\.\s*(\d+)?)?")
+_DECLARED = re.compile(r"\bAS\s+([A-Za-z_]\w*)|[(\[]\s*([A-Za-z_]\w*)", re.I)
+
+
+class UnsafeCypherError(ValueError):
+    pass
+
+
+def _mask(cypher):
+    # Strings, quoted names and comments become blanks of the same length, so keywords inside them
+    # are ignored and positions still line up with the original text.
+    return _STRING_OR_COMMENT.sub(lambda m: m.group()[0] + " " * (len(m.group()) - 2) + m.group()[-1]
+                                  if m.group()[0] in "'\"`" else " " * len(m.group()), cypher)
+
+
+def _words(masked):
+    """Keywords with their position and nesting depth; property keys, labels and map keys are skipped."""
+    depth, pos = 0, 0
+    for match in _WORD.finditer(masked):
+        for ch in masked[pos:match.start()]:
+            depth += ch in "{(["
+            depth -= ch in "})]"
+        pos = match.start()
+        before = masked[:match.start()].rstrip()[-1:]
+        after = masked[match.end():].lstrip()[:1]
+        if before in (".", ":", "$") or after == ":":
+            continue
+        yield match.group().upper(), match.start(), match.end(), depth
+
+
+def check_read_only(cypher):
+    masked = _mask(cypher)
+    words = list(_words(masked))
+    # Variables and aliases may be named like keywords (RETURN o.name AS set); a real write clause
+    # that slips through this way still fails in the read-only session.
+    declared = {name.upper() for match in _DECLARED.finditer(masked) for name in match.groups() if name}
+    for word, start, end, _ in words:
+        if word in WRITE_KEYWORDS and word not in declared:
+            raise UnsafeCypherError(f"Generated Cypher was rejected: '{word}' would modify the graph")
+        if word == "CALL":
+            procedure = re.match(r"\s*([A-Za-z_][\w.]*)", masked[end:])
+            if procedure is None:
+                continue  # CALL { ... } subquery; its clauses are checked like the rest
+            name = procedure.group(1).lower()
+            if not name.startswith(CYPHER_ALLOWED_PROCEDURES):
+                raise UnsafeCypherError(f"Generated Cypher was rejected: procedure '{name}' is not allowed")
+    return words
+
+
+def bound_hops(cypher, max_hops=CYPHER_MAX_HOPS):
+    """Gives unbounded variable-length relationships (`*`, `*2..`, `*..`) an upper bound of `max_hops`."""
+    masked = _mask(cypher)
+    edits = []
+    for pattern in _REL_PATTERN.finditer(masked):
+        inner_start = pattern.start(1)
+        match = _VAR_LENGTH.search(pattern.group(1))
+        if match is None:
+            continue
+        low, dots, high = match.group(1), match.group(2), match.group(3)
+        if high or (low and not dots):
+            continue  # already bounded
+        edits.append((inner_start + match.start(), inner_start + match.end(), f"*{low or 1}..{max_hops}"))
+    for start, end, text in reversed(edits):
+        cypher = cypher[:start] + text + cypher[end:]
+    return cypher
+
+
+def add_limit(cypher, limit, words=None):
+    """Appends LIMIT to the final RETURN when it has none (not for UNION, where it would bind one branch)."""
+    words = words if words is not None else list(_words(_mask(cypher)))
+    top = [w for w, _, _, depth in words if depth == 0]
+    if "UNION" in top or "RETURN" not in top:
+        return cypher
+    last_return = len(top) - 1 - top[::-1].index("RETURN")
+    if "LIMIT" in top[last_return:]:
+        return cypher
+    return f"{cypher.rstrip().rstrip(';').rstrip()}\nLIMIT {limit}"
+
+
+def guard_cypher(cypher, max_rows=CYPHER_MAX_ROWS, max_hops=CYPHER_MAX_HOPS):
+    """The generated query made safe to run, or UnsafeCypherError. One row beyond `max_rows` is
+    requested so a truncated result can be told apart from one that fits exactly."""
+    cypher = cypher.strip().rstrip(";")
+    if not cypher:
+        return cypher
+    check_read_only(cypher)
+    cypher = bound_hops(cypher, max_hops)
+    return add_limit(cypher, max_rows + 1)
+
+
+class CypherCursor:
+    """Rows of a guarded query, at most `max_rows` of them.
+
+    On Neo4j the query runs in a read-only session with a server-side timeout and the driver fetches
+    `page_size` records at a time, so no more than `max_rows` rows are ever transferred. `afetch_all`
+    reads the same way through the async driver.
+    """
+
+    def __init__(self, graph, cypher, params=None, max_rows=CYPHER_MAX_ROWS, page_size=CYPHER_PAGE_SIZE,
+                 timeout=CYPHER_TIMEOUT):
+        self.graph = graph
+        self.cypher = guard_cypher(cypher, max_rows)
+        self.params = params or {}
+        self.max_rows = max_rows
+        self.page_size = page_size
+        self.timeout = timeout
+        self.rows_read = 0
+        self.truncated = False
+        self._session = None
+        self._records = None
+
+    def _session_options(self, database):
+        from neo4j import READ_ACCESS
+        return {"database": database, "default_access_mode": READ_ACCESS, "fetch_size": self.page_size}
+
+    def _query(self):
+        from neo4j import Query
+        return Query(self.cypher, timeout=self.timeout)
+
+    def _take(self):
+        # One row beyond max_rows is requested, so reaching it means the result was cut.
+        if self.rows_read >= self.max_rows:
+            self.truncated = True
+            log.warning("Cypher result cut at %d rows: %s", self.max_rows, self.cypher)
+            return False
+        self.rows_read += 1
+        return True
+
+    def _open(self):
+        driver = getattr(self.graph, "_driver", None)
+        if driver is None:
+            self._records = iter(self.graph.query(self.cypher, self.params))
+            return
+        self._session = driver.session(**self._session_options(getattr(self.graph, "_database", None)))
+        result = self._session.run(self._query(), self.params)
+        self._records = (record.data() for record in result)
+
+    def __iter__(self):
+        if self._records is None:
+            self._open()
+        try:
+            for row in self._records:
+                if not self._take():
+                    break
+                yield row
+        finally:
+            self.close()
+
+    def fetch_all(self):
+        return list(self)
+
+    async def afetch_all(self, driver, database=None):
+        """The rows read through an async Neo4j driver."""
+        rows = []
+        async with driver.session(**self._session_options(database)) as session:
+            result = await session.run(self._query(), self.params)
+            async for record in result:
+                if not self._take():
+                    break
+                rows.append(record.data())
+        return rows
+
+    def close(self):
+        if self._session is not None:
+            self._session.close()
+            self._session = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
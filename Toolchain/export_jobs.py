@@ -0,0 +1,190 @@
+import multiprocessing
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import BrokenExecutor, ProcessPoolExecutor, ThreadPoolExecutor
+
+from tracing import get_logger
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+MAIN_OWL = os.path.join(current_dir, "GOPPRRE.owl")
+PLANS_DIR = "./plans"
+MBSE_DIR = "./MBSE"
+SIM_DIR = "./Simulation"
+
+# Exports run as background jobs: EXPORT_WORKERS jobs at a time, each step in a spawned process
+# (EXPORT_POOL=process) so a large OWL merge holds neither the UI event loop nor the GIL.
+EXPORT_WORKERS = int(os.getenv("EXPORT_WORKERS", str(min(4, os.cpu_count() or 1))))
+EXPORT_POOL = os.getenv("EXPORT_POOL", "process").lower()
+EXPORT_JOB_HISTORY = int(os.getenv("EXPORT_JOB_HISTORY", "200"))
+
+log = get_logger("export")
+
+QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "failed"
+# Export kinds whose outputs an active job of the key's kind also produces.
+COVERS = {"mbse": {"mbse"}, "simulation": {"simulation"}, "all": {"mbse", "simulation", "all"}}
+
+
+# -- export steps; module-level so they can run in a worker process ----------
+
+def build_fragment(csv_path, frag_txt):
+    import csv2GOPPRRE
+    csv2GOPPRRE.build(csv_path, frag_txt)
+
+
+def merge_fragment(frag_txt, merged_owl, main_owl=MAIN_OWL):
+    import csv2GOPPRRE
+    try:
+        csv2GOPPRRE.merge_fragment(main_owl, frag_txt, merged_owl)
+    finally:
+        if os.path.exists(frag_txt):
+            os.remove(frag_txt)
+
+
+def owl_to_matlab(owl_path, m_path):
+    import GOPPRRE2sim
+    GOPPRRE2sim.owl_to_matlab(owl_path, m_path)
+
+
+def plan_suffix(plan_path):
+    name = os.path.basename(plan_path)
+    return name[len("assembly_plan_"):-len(".csv")]
+
+
+class ExportJob:
+    def __init__(self, kind, plan, steps):
+        self.id = uuid.uuid4().hex[:8]
+        self.kind = kind
+        self.plan = plan
+        self.steps = steps
+        self.step = 0
+        self.status = QUEUED
+        self.error = None
+        self.outputs = {}
+        self.created = time.time()
+        self.finished = None
+
+    @property
+    def active(self):
+        return self.status in (QUEUED, RUNNING)
+
+    def progress(self):
+        if self.status == DONE:
+            return 1.0
+        return self.step / len(self.steps) if self.steps else 0.0
+
+    def describe(self):
+        name = os.path.basename(self.plan)
+        if self.status == QUEUED:
+            return f"⏳ {name}: queued"
+        if self.status == RUNNING:
+            label = self.steps[self.step][0]
+            return f"⏳ {name}: step {self.step + 1}/{len(self.steps)}, {label}"
+        if self.status == FAILED:
+            return f"❌ {name}: {self.error}"
+        return "✅ " + ", ".join(self.outputs.values())
+
+
+class ExportQueue:
+    # `index` records the artifacts and lists pending plans (PlanStore); plans are named by their CSV path.
+    def __init__(self, index, workers=EXPORT_WORKERS, pool=EXPORT_POOL):
+        self.index = index
+        self.workers = workers
+        self.use_processes = pool == "process"
+        self.runner = ThreadPoolExecutor(workers, thread_name_prefix="export")
+        self.lock = threading.Lock()
+        self.jobs = OrderedDict()
+        self.plan_locks = {}
+        self._pool = None
+
+    def _step_pool(self):
+        with self.lock:
+            if self._pool is None:
+                # Spawned rather than forked: the app process runs Gradio, Neo4j and HTTP client threads.
+                self._pool = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"))
+            return self._pool
+
+    def _run_step(self, fn, args):
+        if not self.use_processes:
+            return fn(*args)
+        pool = self._step_pool()
+        try:
+            return pool.submit(fn, *args).result()
+        except BrokenExecutor as e:
+            # A dead worker breaks the whole pool; run the step here and start a new pool next time.
+            log.warning("Export pool failed, running step in process: %s", e)
+            with self.lock:
+                if self._pool is pool:
+                    self._pool = None
+            pool.shutdown(wait=False, cancel_futures=True)
+            return fn(*args)
+
+    def _steps(self, plan, kind, owl=None):
+        suffix = plan_suffix(plan)
+        steps = []
+        if kind in ("mbse", "all"):
+            os.makedirs(MBSE_DIR, exist_ok=True)
+            frag_txt = os.path.join(MBSE_DIR, f"owl_out_{suffix}.txt")
+            owl = os.path.join(MBSE_DIR, f"assembly_plan_MBSE_{suffix}.owl")
+            steps.append(("building the OWL fragment", build_fragment, (plan, frag_txt), None))
+            steps.append(("merging it into GOPPRRE.owl", merge_fragment, (frag_txt, owl), ("owl", owl)))
+        if kind in ("simulation", "all"):
+            os.makedirs(SIM_DIR, exist_ok=True)
+            m_path = os.path.join(SIM_DIR, os.path.basename(owl).replace(".owl", ".m"))
+            steps.append(("generating the MATLAB model", owl_to_matlab, (owl, m_path), ("model", m_path)))
+        return steps
+
+    def submit(self, plan, kind, owl=None):
+        """Queue the "mbse", "simulation" or "all" export of `plan`.
+
+        A job in progress for the same plan that already produces these outputs is reused; other jobs
+        for the plan wait for it, since they write the same fragment and OWL files.
+        """
+        with self.lock:
+            for job in self.jobs.values():
+                if job.active and job.plan == plan and kind in COVERS[job.kind]:
+                    return job
+            job = ExportJob(kind, plan, self._steps(plan, kind, owl))
+            self.jobs[job.id] = job
+            self.plan_locks.setdefault(plan, threading.Lock())
+            while len(self.jobs) > EXPORT_JOB_HISTORY:
+                oldest = next(iter(self.jobs.values()))
+                if oldest.active:
+                    break
+                self.jobs.popitem(last=False)
+        self.runner.submit(self._run, job)
+        return job
+
+    def batch(self):
+        """Queue every plan that is missing its OWL or MATLAB model."""
+        jobs = []
+        for entry in self.index.pending():
+            if entry["owl"] and os.path.exists(entry["owl"]):
+                jobs.append(self.submit(entry["plan"], "simulation", entry["owl"]))
+            else:
+                jobs.append(self.submit(entry["plan"], "all"))
+        return jobs
+
+    def _run(self, job):
+        with self.plan_locks[job.plan]:
+            self._run_steps(job)
+
+    def _run_steps(self, job):
+        job.status = RUNNING
+        start = time.monotonic()
+        try:
+            for job.step, (label, fn, args, artifact) in enumerate(job.steps):
+                self._run_step(fn, args)
+                if artifact:
+                    kind, path = artifact
+                    self.index.set_artifact(job.plan, kind, path)
+                    job.outputs[kind] = path
+            job.status = DONE
+        except Exception as e:
+            log.warning("Export %s of %s failed: %s", job.kind, job.plan, e)
+            job.error = str(e)
+            job.status = FAILED
+        job.finished = time.time()
+        log.info("Export %s of %s: %s in %.1f s", job.kind, job.plan, job.status, time.monotonic() - start)
@@ -0,0 +1,166 @@
+import os
+from collections import Counter, OrderedDict, defaultdict
+
+# GRAPH_LAYOUT=auto lays out views with at least GRAPH_LAYOUT_THRESHOLD nodes plus edges on the server;
+# "always" does it for every view and "off" leaves every view to the client-side physics.
+GRAPH_LAYOUT = os.getenv("GRAPH_LAYOUT", "auto").lower()
+GRAPH_LAYOUT_THRESHOLD = int(os.getenv("GRAPH_LAYOUT_THRESHOLD", "80"))
+GRAPH_HUB_DEGREE = int(os.getenv("GRAPH_HUB_DEGREE", "12"))
+GRAPH_MAX_INITIAL_EDGES = int(os.getenv("GRAPH_MAX_INITIAL_EDGES", "400"))
+X_GAP = 320
+Y_GAP = 70
+GROUP_GAP = 40
+
+LAYOUT_OPTIONS = {
+    "physics": False,
+    "edges": {"smooth": False},
+    "interaction": {"hideEdgesOnDrag": True, "tooltipDelay": 200},
+    "nodes": {"font": {"size": 14}},
+}
+
+
+def operation_groups(rows):
+    # Each operation is grouped under the most specific process (fewest operations) that lists it.
+    sizes = Counter(row["Process"] for row in rows)
+    groups = {}
+    for row in sorted(rows, key=lambda r: (sizes[r["Process"]], r["Process"])):
+        groups.setdefault(row["Operation"], row["Process"])
+    return groups
+
+
+def collapse_hubs(view, hub_degree=GRAPH_HUB_DEGREE, max_edges=GRAPH_MAX_INITIAL_EDGES):
+    """Move the edges of high-degree nodes out of the view; they are fetched when the hub is expanded."""
+    degree = Counter()
+    incident = defaultdict(list)
+    for index, edge in enumerate(view["edges"]):
+        degree[edge["from"]] += 1
+        degree[edge["to"]] += 1
+        incident[edge["from"]].append(index)
+        incident[edge["to"]].append(index)
+    hubs = set()
+    collapsed = [False] * len(view["edges"])
+    remaining = len(view["edges"])
+
+    def collapse(node):
+        nonlocal remaining
+        hubs.add(node)
+        for index in incident[node]:
+            if not collapsed[index]:
+                collapsed[index] = True
+                remaining -= 1
+
+    for node, d in degree.items():
+        if d >= hub_degree:
+            collapse(node)
+    # Collapse further hubs, largest first, until the initial payload is small enough.
+    for node, d in degree.most_common():
+        if remaining <= max_edges or d < 2:
+            break
+        if node not in hubs:
+            collapse(node)
+
+    detail = defaultdict(list)
+    kept = []
+    for index, edge in enumerate(view["edges"]):
+        edge.setdefault("id", f"e{index}")
+        ends = [node for node in (edge["from"], edge["to"]) if node in hubs]
+        if not ends:
+            kept.append(edge)
+        # An edge between two hubs is listed under both; the viewer skips ids it already shows.
+        for hub in dict.fromkeys(ends):
+            detail[hub].append(edge)
+    view["edges"] = kept
+
+    for node in view["nodes"]:
+        if node["id"] in detail:
+            node["collapsed"] = True
+            node["baseLabel"] = node["label"]
+            node["label"] = f"{node['label']}\n[+{len(detail[node['id']])} links]"
+            node["borderWidth"] = 3
+            node["title"] = "Click to expand"
+    return {hub: {"edges": edges} for hub, edges in detail.items()}
+
+
+def _drop_back_edges(nodes, successors):
+    # Iterative DFS; edges that close a cycle are ignored for layering.
+    state = {}
+    dag = defaultdict(list)
+    for root in nodes:
+        if root in state:
+            continue
+        state[root] = 1
+        stack = [(root, iter(successors[root]))]
+        while stack:
+            node, children = stack[-1]
+            child = next(children, None)
+            if child is None:
+                state[node] = 2
+                stack.pop()
+            elif state.get(child) != 1:
+                dag[node].append(child)
+                if child not in state:
+                    state[child] = 1
+                    stack.append((child, iter(successors[child])))
+    return dag
+
+
+def layered_positions(node_ids, edges, groups=None, reverse=False):
+    groups = groups or {}
+    successors = OrderedDict((n, []) for n in node_ids)
+    for edge in edges:
+        source, target = (edge["to"], edge["from"]) if reverse else (edge["from"], edge["to"])
+        if source in successors and target in successors and source != target:
+            successors[source].append(target)
+    dag = _drop_back_edges(list(successors), successors)
+
+    indegree = Counter()
+    predecessors = defaultdict(list)
+    for source, targets in dag.items():
+        for target in targets:
+            indegree[target] += 1
+            predecessors[target].append(source)
+    layer = {n: 0 for n in successors}
+    queue = [n for n in successors if not indegree[n]]
+    while queue:
+        node = queue.pop()
+        for target in dag[node]:
+            layer[target] = max(layer[target], layer[node] + 1)
+            indegree[target] -= 1
+            if not indegree[target]:
+                queue.append(target)
+
+    layers = defaultdict(list)
+    for node, index in layer.items():
+        layers[index].append(node)
+    positions = {}
+    for index in sorted(layers):
+        def barycenter(n):
+            ys = [positions[p][1] for p in predecessors[n] if p in positions]
+            return sum(ys) / len(ys) if ys else 0.0
+        members = sorted(layers[index], key=lambda n: (groups.get(n, ""), barycenter(n), str(n)))
+        y, previous_group = 0.0, None
+        for n in members:
+            if previous_group is not None and groups.get(n) != previous_group:
+                y += GROUP_GAP
+            positions[n] = (index * X_GAP, y)
+            y += Y_GAP
+            previous_group = groups.get(n)
+        offset = (y - Y_GAP) / 2
+        for n in members:
+            positions[n] = (positions[n][0], positions[n][1] - offset)
+    return positions
+
+
+def prepare_view(view, groups=None, reverse=False, mode=GRAPH_LAYOUT):
+    """Lays the view out server side and collapses hubs; returns the detail to serve on demand."""
+    if mode == "off" or (mode == "auto" and len(view["nodes"]) + len(view["edges"]) < GRAPH_LAYOUT_THRESHOLD):
+        return {}
+    groups = groups or {}
+    positions = layered_positions([n["id"] for n in view["nodes"]], view["edges"], groups, reverse)
+    detail = collapse_hubs(view)
+    for node in view["nodes"]:
+        node["x"], node["y"] = positions[node["id"]]
+        if node["id"] in groups:
+            node["title"] = node.get("title") or f"Process: {groups[node['id']]}"
+    view["options"] = LAYOUT_OPTIONS
+    return detail
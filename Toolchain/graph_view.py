@@ -0,0 +1,131 @@
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+
+GRAPH_VIEW_CACHE_SIZE = int(os.getenv("GRAPH_VIEW_CACHE_SIZE", "128"))
+GRAPH_VIEW_PREFIX = "graph:"
+
+# The one renderer every graph answer reuses; only the nodes/edges JSON changes between queries.
+# vis-network is loaded from the same CDN build that pyvis references.
+RENDERER_TEMPLATE = """<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<link rel="stylesheet" href="https://cdnjs.cloudflare.com/ajax/libs/vis-network/9.1.2/dist/dist/vis-network.min.css" integrity="sha512-WgxfT5LWjfszlPHXRmBWHkV2eceiWTOBvrKCNbdgDYTHrT2AeLCGbF4sZlZw3UMN3WtL0tGUoIAKsu8mllg/XA==" crossorigin="anonymous" referrerpolicy="no-referrer" />
+<script src="https://cdnjs.cloudflare.com/ajax/libs/vis-network/9.1.2/dist/vis-network.min.js" integrity="sha512-LnvoEWDFrqGHlHmDD2101OrLcbsfkrzoSpvtSQtxK3RMnRV0eOkhhBN2dXHKRrUU8p2DGRTk35n4O8nWSVe1mQ==" crossorigin="anonymous" referrerpolicy="no-referrer"></script>
+<style>html, body, #graph { margin: 0; width: 100%; height: 100%; }</style>
+</head>
+<body>
+<div id="graph"></div>
+<script>
+var view = __GRAPH_VIEW__;
+var nodes = new vis.DataSet(view.nodes), edges = new vis.DataSet(view.edges);
+var network = new vis.Network(document.getElementById("graph"), {nodes: nodes, edges: edges}, view.options);
+// Collapsed hubs fetch their edges from the server the first time they are clicked.
+network.on("click", function (params) {
+    var node = params.nodes.length ? nodes.get(params.nodes[0]) : null;
+    if (!node || !node.collapsed || !view.key) return;
+    nodes.update({id: node.id, collapsed: false, label: node.baseLabel, borderWidth: 1, title: ""});
+    fetch("graph-view/" + view.key + "/node/" + encodeURIComponent(node.id))
+        .then(function (r) { return r.json(); })
+        .then(function (d) {
+            // Edges between two hubs come with both; add each id once.
+            edges.add(d.edges.filter(function (e) { return !edges.get(e.id); }));
+        });
+});
+</script>
+</body>
+</html>"""
+
+
+def _srcdoc_escape(page):
+    # A single-quoted attribute only needs & and ' escaped, which keeps the JSON's double quotes as is.
+    return page.replace("&", "&amp;").replace("'", "&#39;")
+
+
+def content_hash(graph_data):
+    payload = json.dumps(graph_data, sort_keys=True, default=str, separators=(",", ":"))
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()[:16]
+
+
+class GraphBuilder:
+    """Collects nodes and edges through the subset of the pyvis `Network` API the format handlers use."""
+
+    def __init__(self, directed=True):
+        self.directed = directed
+        self.nodes = OrderedDict()
+        self.edges = []
+        self.options = {}
+
+    def add_node(self, node_id, label=None, color="#97c2fc", shape="dot", **kwargs):
+        if node_id not in self.nodes:
+            self.nodes[node_id] = dict(id=node_id, label=label or str(node_id), color=color, shape=shape, **kwargs)
+
+    def add_edge(self, source, to, **kwargs):
+        edge = {"from": source, "to": to}
+        if self.directed:
+            edge["arrows"] = "to"
+        edge.update(kwargs)
+        self.edges.append(edge)
+
+    def toggle_physics(self, status):
+        self.options["physics"] = {"enabled": status}
+
+    def set_options(self, options):
+        # Like pyvis, explicit options replace whatever was configured before.
+        self.options = json.loads(options)
+
+    def to_dict(self):
+        return {"nodes": list(self.nodes.values()), "edges": self.edges, "options": self.options}
+
+    def to_json(self):
+        return json.dumps(self.to_dict(), ensure_ascii=False, separators=(",", ":"), default=str)
+
+
+class GraphViewCache:
+    def __init__(self, max_entries=GRAPH_VIEW_CACHE_SIZE):
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.hits = 0
+
+    def __contains__(self, key):
+        with self.lock:
+            return key in self.entries
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries.move_to_end(key)
+                self.hits += 1
+            return entry
+
+    def put(self, key, view_json, detail=None):
+        with self.lock:
+            self.entries[key] = {"json": view_json, "html": None, "detail": detail or {}}
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def detail(self, key, node_id):
+        entry = self.get(key)
+        if entry is None or node_id not in entry["detail"]:
+            return None
+        return entry["detail"][node_id]
+
+    def render(self, ref, height=650):
+        key = ref[len(GRAPH_VIEW_PREFIX):] if ref.startswith(GRAPH_VIEW_PREFIX) else ref
+        entry = self.get(key)
+        if entry is None:
+            return None
+        if entry["html"] is None:
+            page = RENDERER_TEMPLATE.replace("__GRAPH_VIEW__", entry["json"].replace("</", "<\\/"))
+            entry["html"] = f"""
+    <div style='width: 100%; height: {height}px; border: 1px solid #ccc; overflow: hidden;'>
+        <iframe srcdoc='{_srcdoc_escape(page)}'
+                style="width: 100%; height: 100%; border: none;"></iframe>
+    </div>"""
+        return entry["html"]
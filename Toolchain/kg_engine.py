@@ -0,0 +1,1271 @@
+import json
+import os
+import re
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, List
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+KG_DUMP_PATH = os.path.join(current_dir, "domain_KG.json")
+
+# In-memory stand-in for Neo4jGraph. It loads the `domain_KG.json` export
+# (rows of n, r, m) into indexed adjacency lists and executes the read-only
+# Cypher subset that cypher_chain generates: MATCH / OPTIONAL MATCH with
+# label, property, typed and variable-length patterns, WHERE, WITH, UNWIND,
+# RETURN with aggregation, DISTINCT, ORDER BY, SKIP and LIMIT.
+
+TOKEN_RE = re.compile(
+    r"""
+    (?P<ws>\s+|//[^\n]*|/\*.*?\*/)
+    |(?P<str>'(?:[^'\\]|\\.)*'|"(?:[^"\\]|\\.)*")
+    |(?P<qname>`[^`]*`)
+    |(?P<num>\d+\.\d+(?:[eE][-+]?\d+)?|\d+(?:[eE][-+]?\d+)?)
+    |(?P<param>\$\w+)
+    |(?P<name>[A-Za-z_][A-Za-z0-9_]*)
+    |(?P<op><>|<=|>=|=~|->|<-|\.\.|!=|[-+*/%^=<>()\[\]{}:,.|;])
+    """,
+    re.VERBOSE | re.DOTALL,
+)
+
+KEYWORDS = {
+    "MATCH", "OPTIONAL", "WHERE", "WITH", "RETURN", "ORDER", "BY", "SKIP", "LIMIT", "UNWIND", "AS",
+    "DISTINCT", "AND", "OR", "XOR", "NOT", "IN", "CONTAINS", "STARTS", "ENDS", "IS", "NULL", "TRUE",
+    "FALSE", "ASC", "DESC", "ASCENDING", "DESCENDING", "CASE", "WHEN", "THEN", "ELSE", "END", "UNION",
+}
+WRITE_CLAUSES = {"CREATE", "MERGE", "DELETE", "DETACH", "SET", "REMOVE", "FOREACH", "LOAD", "DROP", "CALL"}
+AGGREGATES = {"count", "collect", "sum", "avg", "min", "max"}
+
+STRING_ESCAPES = {"n": "\n", "t": "\t", "r": "\r", "\\": "\\", "'": "'", '"': '"'}
+
+
+@dataclass(frozen=True)
+class NodeRef:
+    id: int
+
+
+@dataclass(frozen=True)
+class RelRef:
+    id: int
+
+
+@dataclass(frozen=True)
+class PathRef:
+    nodes: tuple
+    rels: tuple
+
+
+class CypherError(ValueError):
+    pass
+
+
+def _unescape(text):
+    return re.sub(r"\\(.)", lambda m: STRING_ESCAPES.get(m.group(1), m.group(1)), text[1:-1])
+
+
+def tokenize(query):
+    tokens = []
+    pos = 0
+    while pos < len(query):
+        m = TOKEN_RE.match(query, pos)
+        if not m:
+            raise CypherError(f"Unexpected character {query[pos]!r} at position {pos}")
+        kind = m.lastgroup
+        if kind != "ws":
+            text = m.group()
+            if kind == "str":
+                value = _unescape(text)
+            elif kind == "qname":
+                value = text[1:-1]
+            elif kind == "num":
+                value = float(text) if any(c in text for c in ".eE") else int(text)
+            elif kind == "param":
+                value = text[1:]
+            else:
+                value = text
+            tokens.append((kind, value, m.start(), m.end()))
+        pos = m.end()
+    tokens.append(("eof", None, len(query), len(query)))
+    return tokens
+
+
+class CypherParser:
+    def __init__(self, query):
+        self.query = query
+        self.tokens = tokenize(query)
+        self.pos = 0
+
+    # -- token helpers -------------------------------------------------------
+
+    def peek(self, offset=0):
+        return self.tokens[min(self.pos + offset, len(self.tokens) - 1)]
+
+    def next(self):
+        tok = self.tokens[self.pos]
+        self.pos += 1
+        return tok
+
+    def at_kw(self, *words, offset=0):
+        kind, value, _, _ = self.peek(offset)
+        return kind == "name" and value.upper() in words
+
+    def accept_kw(self, *words):
+        if self.at_kw(*words):
+            return self.next()[1].upper()
+        return None
+
+    def expect_kw(self, word):
+        if not self.accept_kw(word):
+            self.error(f"expected {word}")
+
+    def at_op(self, *ops, offset=0):
+        kind, value, _, _ = self.peek(offset)
+        return kind == "op" and value in ops
+
+    def accept_op(self, *ops):
+        if self.at_op(*ops):
+            return self.next()[1]
+        return None
+
+    def expect_op(self, op):
+        if not self.accept_op(op):
+            self.error(f"expected '{op}'")
+
+    def error(self, message):
+        _, value, start, _ = self.peek()
+        raise CypherError(f"Invalid Cypher near position {start} ({value!r}): {message}")
+
+    def identifier(self):
+        kind, value, _, _ = self.peek()
+        if kind == "qname" or (kind == "name" and value.upper() not in KEYWORDS):
+            self.next()
+            return value
+        self.error("expected identifier")
+
+    def symbolic_name(self):
+        kind, value, _, _ = self.peek()
+        if kind in ("name", "qname"):
+            self.next()
+            return value
+        self.error("expected name")
+
+    # -- clauses -------------------------------------------------------------
+
+    def parse(self):
+        if self.at_kw("CYPHER"):
+            self.next()
+        clauses = []
+        while self.peek()[0] != "eof":
+            if self.accept_op(";"):
+                continue
+            kind, value, _, _ = self.peek()
+            keyword = value.upper() if kind == "name" else None
+            if keyword in WRITE_CLAUSES:
+                raise CypherError(f"Write or procedure clause '{keyword}' is not supported by the in-memory graph")
+            if keyword == "OPTIONAL":
+                self.next()
+                self.expect_kw("MATCH")
+                clauses.append(self.parse_match(True))
+            elif keyword == "MATCH":
+                self.next()
+                clauses.append(self.parse_match(False))
+            elif keyword == "WITH":
+                self.next()
+                clauses.append(("with",) + self.parse_projection(allow_where=True))
+            elif keyword == "RETURN":
+                self.next()
+                clauses.append(("return",) + self.parse_projection(allow_where=False))
+            elif keyword == "UNWIND":
+                self.next()
+                expr = self.parse_expr()
+                self.expect_kw("AS")
+                clauses.append(("unwind", expr, self.identifier()))
+            elif keyword == "UNION":
+                raise CypherError("UNION is not supported by the in-memory graph")
+            else:
+                self.error("expected clause")
+        return clauses
+
+    def parse_match(self, optional):
+        patterns = [self.parse_pattern_part()]
+        while self.accept_op(","):
+            patterns.append(self.parse_pattern_part())
+        where = self.parse_expr() if self.accept_kw("WHERE") else None
+        return ("match", optional, patterns, where)
+
+    def parse_projection(self, allow_where):
+        distinct = bool(self.accept_kw("DISTINCT"))
+        star = bool(self.accept_op("*"))
+        items = []
+        if not star or self.accept_op(","):
+            while True:
+                start = self.peek()[2]
+                expr = self.parse_expr()
+                text = self.query[start:self.tokens[self.pos - 1][3]].strip()
+                alias = self.identifier() if self.accept_kw("AS") else text
+                items.append((expr, alias, text))
+                if not self.accept_op(","):
+                    break
+        order = []
+        if self.accept_kw("ORDER"):
+            self.expect_kw("BY")
+            while True:
+                start = self.peek()[2]
+                expr = self.parse_expr()
+                text = self.query[start:self.tokens[self.pos - 1][3]].strip()
+                desc = self.accept_kw("ASC", "ASCENDING", "DESC", "DESCENDING") in ("DESC", "DESCENDING")
+                order.append((expr, text, desc))
+                if not self.accept_op(","):
+                    break
+        skip = self.parse_expr() if self.accept_kw("SKIP") else None
+        limit = self.parse_expr() if self.accept_kw("LIMIT") else None
+        where = self.parse_expr() if allow_where and self.accept_kw("WHERE") else None
+        return distinct, star, items, order, skip, limit, where
+
+    # -- patterns ------------------------------------------------------------
+
+    def parse_pattern_part(self):
+        path_var = None
+        if self.peek()[0] in ("name", "qname") and self.at_op("=", offset=1):
+            path_var = self.identifier()
+            self.next()
+        return path_var, self.parse_pattern_chain()
+
+    def parse_pattern_chain(self):
+        elems = [self.parse_node_pattern()]
+        while self.at_op("-", "<-"):
+            elems.append(self.parse_rel_pattern())
+            elems.append(self.parse_node_pattern())
+        return elems
+
+    def parse_node_pattern(self):
+        self.expect_op("(")
+        var = None
+        if self.peek()[0] in ("name", "qname") and not self.at_op(":"):
+            var = self.identifier()
+        labels = []
+        while self.accept_op(":"):
+            labels.append(self.symbolic_name())
+        props = self.parse_map_literal() if self.at_op("{") else None
+        self.expect_op(")")
+        return var, tuple(labels), props
+
+    def parse_rel_pattern(self):
+        left = self.next()[1]
+        var, types, props, min_hops, max_hops = None, (), None, None, None
+        if self.accept_op("["):
+            if self.peek()[0] in ("name", "qname"):
+                var = self.identifier()
+            if self.accept_op(":"):
+                types = [self.symbolic_name()]
+                while self.accept_op("|"):
+                    self.accept_op(":")
+                    types.append(self.symbolic_name())
+                types = tuple(types)
+            if self.accept_op("*"):
+                min_hops, max_hops = 1, None
+                if self.peek()[0] == "num":
+                    min_hops = max_hops = self.next()[1]
+                if self.accept_op(".."):
+                    max_hops = self.next()[1] if self.peek()[0] == "num" else None
+            props = self.parse_map_literal() if self.at_op("{") else None
+            self.expect_op("]")
+        right = self.next()[1]
+        if left == "<-" and right == "-":
+            direction = "in"
+        elif left == "-" and right == "->":
+            direction = "out"
+        elif left == "-" and right == "-":
+            direction = "both"
+        else:
+            self.error("invalid relationship direction")
+        return var, types, props, direction, min_hops, max_hops
+
+    def parse_map_literal(self):
+        self.expect_op("{")
+        entries = []
+        if not self.at_op("}"):
+            while True:
+                key = self.symbolic_name()
+                self.expect_op(":")
+                entries.append((key, self.parse_expr()))
+                if not self.accept_op(","):
+                    break
+        self.expect_op("}")
+        return entries
+
+    # -- expressions ---------------------------------------------------------
+
+    def parse_expr(self):
+        left = self.parse_xor()
+        while self.accept_kw("OR"):
+            left = ("or", left, self.parse_xor())
+        return left
+
+    def parse_xor(self):
+        left = self.parse_and()
+        while self.accept_kw("XOR"):
+            left = ("xor", left, self.parse_and())
+        return left
+
+    def parse_and(self):
+        left = self.parse_not()
+        while self.accept_kw("AND"):
+            left = ("and", left, self.parse_not())
+        return left
+
+    def parse_not(self):
+        if self.accept_kw("NOT"):
+            return ("not", self.parse_not())
+        return self.parse_comparison()
+
+    def parse_comparison(self):
+        left = self.parse_additive()
+        while True:
+            op = self.accept_op("=", "<>", "!=", "<", ">", "<=", ">=", "=~")
+            if op:
+                left = ("bin", "<>" if op == "!=" else op, left, self.parse_additive())
+            elif self.accept_kw("IN"):
+                left = ("bin", "in", left, self.parse_additive())
+            elif self.accept_kw("CONTAINS"):
+                left = ("bin", "contains", left, self.parse_additive())
+            elif self.at_kw("STARTS", "ENDS"):
+                op = self.next()[1].lower()
+                self.expect_kw("WITH")
+                left = ("bin", op, left, self.parse_additive())
+            elif self.accept_kw("IS"):
+                negate = bool(self.accept_kw("NOT"))
+                self.expect_kw("NULL")
+                left = ("isnull", left, negate)
+            else:
+                return left
+
+    def parse_additive(self):
+        left = self.parse_multiplicative()
+        while True:
+            op = self.accept_op("+", "-")
+            if not op:
+                return left
+            left = ("bin", op, left, self.parse_multiplicative())
+
+    def parse_multiplicative(self):
+        left = self.parse_unary()
+        while True:
+            op = self.accept_op("*", "/", "%", "^")
+            if not op:
+                return left
+            left = ("bin", op, left, self.parse_unary())
+
+    def parse_unary(self):
+        if self.accept_op("-"):
+            return ("neg", self.parse_unary())
+        if self.accept_op("+"):
+            return self.parse_unary()
+        return self.parse_postfix()
+
+    def parse_postfix(self):
+        expr = self.parse_atom()
+        while True:
+            if self.accept_op("."):
+                expr = ("prop", expr, self.symbolic_name())
+            elif self.at_op("["):
+                self.next()
+                start = None if self.at_op("..") else self.parse_expr()
+                if self.accept_op(".."):
+                    end = None if self.at_op("]") else self.parse_expr()
+                    expr = ("slice", expr, start, end)
+                else:
+                    expr = ("index", expr, start)
+                self.expect_op("]")
+            elif self.at_op(":") and expr[0] == "var":
+                labels = []
+                while self.accept_op(":"):
+                    labels.append(self.symbolic_name())
+                expr = ("haslabels", expr, tuple(labels))
+            else:
+                return expr
+
+    def parse_atom(self):
+        kind, value, _, _ = self.peek()
+        if kind == "num" or kind == "str":
+            self.next()
+            return ("lit", value)
+        if kind == "param":
+            self.next()
+            return ("param", value)
+        if kind == "op" and value == "(":
+            saved = self.pos
+            try:
+                chain = self.parse_pattern_chain()
+                if len(chain) > 1:
+                    return ("pattern", [(None, chain)])
+            except CypherError:
+                pass
+            self.pos = saved
+            self.next()
+            expr = self.parse_expr()
+            self.expect_op(")")
+            return expr
+        if kind == "op" and value == "[":
+            return self.parse_list()
+        if kind == "op" and value == "{":
+            return ("map", self.parse_map_literal())
+        if kind == "name":
+            upper = value.upper()
+            if upper in ("TRUE", "FALSE"):
+                self.next()
+                return ("lit", upper == "TRUE")
+            if upper == "NULL":
+                self.next()
+                return ("lit", None)
+            if upper == "CASE":
+                self.next()
+                return self.parse_case()
+            if upper == "EXISTS" and self.at_op("{", offset=1):
+                self.next()
+                self.expect_op("{")
+                self.accept_kw("MATCH")
+                patterns = [self.parse_pattern_part()]
+                while self.accept_op(","):
+                    patterns.append(self.parse_pattern_part())
+                where = self.parse_expr() if self.accept_kw("WHERE") else None
+                self.expect_op("}")
+                return ("pattern", patterns, where)
+            if self.at_op("(", offset=1) or (self.at_op(".", offset=1) and self.peek(2)[0] == "name"
+                                             and self.at_op("(", offset=3)):
+                return self.parse_call()
+        if kind in ("name", "qname"):
+            name = self.identifier()
+            if self.at_op("{"):
+                return self.parse_map_projection(name)
+            return ("var", name)
+        self.error("expected expression")
+
+    def parse_call(self):
+        name = self.next()[1]
+        while self.accept_op("."):
+            name += "." + self.next()[1]
+        name = name.lower()
+        self.expect_op("(")
+        distinct = bool(self.accept_kw("DISTINCT"))
+        if name == "count" and self.accept_op("*"):
+            self.expect_op(")")
+            return ("agg", "count", False, None)
+        args = []
+        if not self.at_op(")"):
+            while True:
+                args.append(self.parse_expr())
+                if not self.accept_op(","):
+                    break
+        self.expect_op(")")
+        if name in AGGREGATES:
+            return ("agg", name, distinct, args[0] if args else None)
+        return ("call", name, args)
+
+    def parse_list(self):
+        self.expect_op("[")
+        if self.peek()[0] in ("name", "qname") and self.at_kw("IN", offset=1):
+            var = self.identifier()
+            self.expect_kw("IN")
+            source = self.parse_expr()
+            where = self.parse_expr() if self.accept_kw("WHERE") else None
+            proj = self.parse_expr() if self.accept_op("|") else None
+            self.expect_op("]")
+            return ("listcomp", var, source, where, proj)
+        items = []
+        if not self.at_op("]"):
+            while True:
+                items.append(self.parse_expr())
+                if not self.accept_op(","):
+                    break
+        self.expect_op("]")
+        return ("list", items)
+
+    def parse_map_projection(self, name):
+        self.expect_op("{")
+        entries = []
+        if not self.at_op("}"):
+            while True:
+                if self.accept_op("."):
+                    if self.accept_op("*"):
+                        entries.append(("*", None))
+                    else:
+                        key = self.symbolic_name()
+                        entries.append((key, ("prop", ("var", name), key)))
+                else:
+                    key = self.symbolic_name()
+                    if self.accept_op(":"):
+                        entries.append((key, self.parse_expr()))
+                    else:
+                        entries.append((key, ("var", key)))
+                if not self.accept_op(","):
+                    break
+        self.expect_op("}")
+        return ("mapproj", name, entries)
+
+    def parse_case(self):
+        base = None if self.at_kw("WHEN") else self.parse_expr()
+        branches = []
+        while self.accept_kw("WHEN"):
+            cond = self.parse_expr()
+            self.expect_kw("THEN")
+            branches.append((cond, self.parse_expr()))
+        default = self.parse_expr() if self.accept_kw("ELSE") else None
+        self.expect_kw("END")
+        return ("case", base, branches, default)
+
+
+def _freeze(value):
+    if isinstance(value, list):
+        return tuple(_freeze(v) for v in value)
+    if isinstance(value, dict):
+        return tuple(sorted((k, _freeze(v)) for k, v in value.items()))
+    return value
+
+
+def _sort_key(value):
+    if value is None:
+        return (9, 0)
+    if isinstance(value, bool):
+        return (3, value)
+    if isinstance(value, (int, float)):
+        return (2, value)
+    if isinstance(value, str):
+        return (1, value)
+    if isinstance(value, list):
+        return (4, tuple(_sort_key(v) for v in value))
+    return (5, repr(value))
+
+
+def _children(expr):
+    kind = expr[0]
+    if kind in ("lit", "var", "param", "pattern"):
+        return []
+    if kind == "list":
+        return expr[1]
+    if kind == "map":
+        return [value for _, value in expr[1]]
+    if kind == "mapproj":
+        return [value for _, value in expr[2] if value is not None]
+    if kind == "call":
+        return expr[2]
+    if kind == "agg":
+        return [expr[3]] if expr[3] is not None else []
+    if kind == "case":
+        parts = [expr[1]] + [e for branch in expr[2] for e in branch] + [expr[3]]
+        return [e for e in parts if e is not None]
+    if kind == "listcomp":
+        return [e for e in expr[2:] if e is not None]
+    if kind in ("bin",):
+        return [expr[2], expr[3]]
+    return [part for part in expr[1:] if isinstance(part, tuple)]
+
+
+def _has_aggregate(expr):
+    return expr[0] == "agg" or any(_has_aggregate(child) for child in _children(expr))
+
+
+def _format_props(props):
+    return ", ".join(f"{prop['property']}: {prop['type']}" for prop in props)
+
+
+def _property_type(value):
+    if isinstance(value, bool):
+        return "BOOLEAN"
+    if isinstance(value, int):
+        return "INTEGER"
+    if isinstance(value, float):
+        return "FLOAT"
+    if isinstance(value, list):
+        return "LIST"
+    return "STRING"
+
+
+class InMemoryGraph:
+    def __init__(self):
+        self.node_ids = []
+        self.node_labels = []
+        self.node_props = []
+        self.node_index = {}
+        self.rel_index = {}
+        self.rel_ids = []
+        self.rel_start = []
+        self.rel_end = []
+        self.rel_type = []
+        self.rel_props = []
+        self.label_index = {}
+        self.name_index = {}
+        self.type_index = {}
+        self.out_index = []
+        self.in_index = []
+        self.schema = ""
+        self.structured_schema = {}
+        self.parse_cache = OrderedDict()
+
+    @classmethod
+    def from_json(cls, path=KG_DUMP_PATH):
+        with open(path, encoding="utf-8-sig") as f:
+            records = json.loads(f.read(), strict=False)
+        graph = cls()
+        for record in records:
+            for key in ("n", "m"):
+                if record.get(key):
+                    graph.add_node(record[key])
+        for record in records:
+            if record.get("r"):
+                graph.add_relationship(record["r"])
+        graph.refresh_schema()
+        return graph
+
+    def add_node(self, node):
+        identity = node["identity"]
+        if identity in self.node_index:
+            return self.node_index[identity]
+        idx = len(self.node_ids)
+        self.node_index[identity] = idx
+        self.node_ids.append(identity)
+        self.node_labels.append(tuple(node.get("labels", ())))
+        props = dict(node.get("properties") or {})
+        self.node_props.append(props)
+        self.out_index.append({})
+        self.in_index.append({})
+        for label in self.node_labels[idx]:
+            self.label_index.setdefault(label, []).append(idx)
+        if "name" in props:
+            self.name_index.setdefault(props["name"], []).append(idx)
+        return idx
+
+    def add_relationship(self, rel):
+        if rel["identity"] in self.rel_index:
+            return
+        start = self.node_index[rel["start"]]
+        end = self.node_index[rel["end"]]
+        idx = len(self.rel_ids)
+        self.rel_index[rel["identity"]] = idx
+        self.rel_ids.append(rel["identity"])
+        self.rel_start.append(start)
+        self.rel_end.append(end)
+        self.rel_type.append(rel["type"])
+        self.rel_props.append(dict(rel.get("properties") or {}))
+        self.type_index.setdefault(rel["type"], []).append(idx)
+        self.out_index[start].setdefault(rel["type"], []).append(idx)
+        self.in_index[end].setdefault(rel["type"], []).append(idx)
+
+    # -- GraphStore interface (see as_graph_store) -----------------------------
+
+    @property
+    def get_schema(self) -> str:
+        return self.schema
+
+    @property
+    def get_structured_schema(self) -> Dict[str, Any]:
+        return self.structured_schema
+
+    def refresh_schema(self) -> None:
+        node_props = OrderedDict()
+        for labels, props in zip(self.node_labels, self.node_props):
+            for label in labels:
+                seen = node_props.setdefault(label, OrderedDict())
+                for key, value in props.items():
+                    seen.setdefault(key, _property_type(value))
+        rel_props = OrderedDict()
+        relationships = OrderedDict()
+        for start, end, rel_type, props in zip(self.rel_start, self.rel_end, self.rel_type, self.rel_props):
+            seen = rel_props.setdefault(rel_type, OrderedDict())
+            for key, value in props.items():
+                seen.setdefault(key, _property_type(value))
+            for start_label in self.node_labels[start]:
+                for end_label in self.node_labels[end]:
+                    relationships[(start_label, rel_type, end_label)] = True
+        self.structured_schema = {
+            "node_props": {
+                label: [{"property": k, "type": t} for k, t in props.items()]
+                for label, props in node_props.items() if props
+            },
+            "rel_props": {
+                rel_type: [{"property": k, "type": t} for k, t in props.items()]
+                for rel_type, props in rel_props.items() if props
+            },
+            "relationships": [{"start": s, "type": t, "end": e} for s, t, e in relationships],
+            "metadata": {"constraint": [], "index": []},
+        }
+        self.schema = "\n".join([
+            "Node properties:",
+            "\n".join(f"{label} {{{_format_props(props)}}}"
+                      for label, props in self.structured_schema["node_props"].items()),
+            "Relationship properties:",
+            "\n".join(f"{rel_type} {{{_format_props(props)}}}"
+                      for rel_type, props in self.structured_schema["rel_props"].items()),
+            "The relationships:",
+            "\n".join(f"(:{el['start']})-[:{el['type']}]->(:{el['end']})"
+                      for el in self.structured_schema["relationships"]),
+        ])
+
+    def add_graph_documents(self, graph_documents, include_source: bool = False) -> None:
+        raise NotImplementedError("The in-memory graph is read-only")
+
+    def query(self, query: str, params: dict = {}) -> List[Dict[str, Any]]:
+        clauses = self.parse(query)
+        rows = [{}]
+        for clause in clauses:
+            kind = clause[0]
+            if kind == "match":
+                rows = self._run_match(clause, rows, params)
+            elif kind == "unwind":
+                _, expr, var = clause
+                rows = [dict(row, **{var: item}) for row in rows
+                        for item in (self._as_list(self._eval(expr, row, params)))]
+            elif kind == "with":
+                rows = self._run_projection(clause, rows, params)
+            elif kind == "return":
+                return [{k: self._to_output(v) for k, v in row.items()}
+                        for row in self._run_projection(clause, rows, params)]
+        return []
+
+    def parse(self, query):
+        clauses = self.parse_cache.get(query)
+        if clauses is None:
+            clauses = CypherParser(query).parse()
+            self.parse_cache[query] = clauses
+            if len(self.parse_cache) > 256:
+                self.parse_cache.popitem(last=False)
+        return clauses
+
+    # -- matching ------------------------------------------------------------
+
+    def _run_match(self, clause, rows, params):
+        _, optional, patterns, where = clause
+        result = []
+        for row in rows:
+            matched = False
+            for binding in self._match_patterns(patterns, row, params):
+                if where is None or self._eval(where, binding, params) is True:
+                    matched = True
+                    result.append(binding)
+            if optional and not matched:
+                null_row = dict(row)
+                for var in self._pattern_vars(patterns):
+                    null_row.setdefault(var, None)
+                result.append(null_row)
+        return result
+
+    def _pattern_vars(self, patterns):
+        names = []
+        for path_var, elems in patterns:
+            if path_var:
+                names.append(path_var)
+            names.extend(elem[0] for elem in elems if elem[0])
+        return names
+
+    def _match_patterns(self, patterns, row, params):
+        states = [(row, frozenset())]
+        for path_var, elems in patterns:
+            states = [state for binding, used in states
+                      for state in self._match_chain(elems, path_var, binding, used, params)]
+        return [binding for binding, _ in states]
+
+    def _node_score(self, node_pat, binding):
+        var, labels, props = node_pat
+        if var and binding.get(var) is not None:
+            return 0
+        if props and any(key == "name" for key, _ in props):
+            return 1
+        if labels:
+            return 2 + min(len(self.label_index.get(label, ())) for label in labels) / (len(self.node_ids) + 1)
+        return 4
+
+    def _match_chain(self, elems, path_var, binding, used, params):
+        reverse = len(elems) > 1 and self._node_score(elems[-1], binding) < self._node_score(elems[0], binding)
+        if reverse:
+            flipped = {"in": "out", "out": "in", "both": "both"}
+            elems = [elem if i % 2 == 0 else elem[:3] + (flipped[elem[3]],) + elem[4:]
+                     for i, elem in enumerate(reversed(elems))]
+        for start in self._node_candidates(elems[0], binding, params):
+            bound = self._bind_node(elems[0], start, binding, params)
+            if bound is None:
+                continue
+            for result, result_used, nodes, rels in self._extend(elems, 1, start, bound, used, params):
+                if path_var:
+                    nodes = (start,) + nodes
+                    if reverse:
+                        nodes, rels = nodes[::-1], rels[::-1]
+                    result = dict(result, **{path_var: PathRef(nodes, rels)})
+                yield result, result_used
+
+    def _extend(self, elems, i, node, binding, used, params):
+        if i >= len(elems):
+            yield binding, used, (), ()
+            return
+        rel_pat, next_pat = elems[i], elems[i + 1]
+        var, types, props, direction, min_hops, max_hops = rel_pat
+        for rel_path, node_path in self._expand(node, types, direction, min_hops, max_hops, used):
+            end = node_path[-1] if node_path else node
+            if props and not all(self._props_match(self.rel_props[r], props, binding, params) for r in rel_path):
+                continue
+            rel_value = [RelRef(r) for r in rel_path] if min_hops is not None else RelRef(rel_path[0])
+            if var:
+                existing = binding.get(var)
+                if existing is not None and existing != rel_value:
+                    continue
+            bound = self._bind_node(next_pat, end, binding, params)
+            if bound is None:
+                continue
+            if var:
+                bound = dict(bound, **{var: rel_value})
+            for result, result_used, nodes, rels in self._extend(elems, i + 2, end, bound,
+                                                                 used | frozenset(rel_path), params):
+                yield result, result_used, node_path + nodes, rel_path + rels
+
+    def _expand(self, node, types, direction, min_hops, max_hops, used):
+        if min_hops is None:
+            for rel, end in self._step(node, types, direction, used):
+                yield (rel,), (end,)
+            return
+        stack = [(node, (), ())]
+        while stack:
+            current, rels, nodes = stack.pop()
+            if len(rels) >= min_hops:
+                yield rels, nodes
+            if max_hops is not None and len(rels) >= max_hops:
+                continue
+            for rel, end in self._step(current, types, direction, used):
+                if rel not in rels:
+                    stack.append((end, rels + (rel,), nodes + (end,)))
+
+    def _step(self, node, types, direction, used):
+        if direction in ("out", "both"):
+            index = self.out_index[node]
+            for rel_type in (types or index.keys()):
+                for rel in index.get(rel_type, ()):
+                    if rel not in used:
+                        yield rel, self.rel_end[rel]
+        if direction in ("in", "both"):
+            index = self.in_index[node]
+            for rel_type in (types or index.keys()):
+                for rel in index.get(rel_type, ()):
+                    if rel not in used and not (direction == "both" and self.rel_start[rel] == self.rel_end[rel]):
+                        yield rel, self.rel_start[rel]
+
+    def _node_candidates(self, node_pat, binding, params):
+        var, labels, props = node_pat
+        if var and binding.get(var) is not None:
+            value = binding[var]
+            return [value.id] if isinstance(value, NodeRef) else []
+        if props:
+            for key, expr in props:
+                if key == "name":
+                    return self.name_index.get(self._eval(expr, binding, params), [])
+        if labels:
+            return min((self.label_index.get(label, []) for label in labels), key=len)
+        return range(len(self.node_ids))
+
+    def _bind_node(self, node_pat, idx, binding, params):
+        var, labels, props = node_pat
+        if var:
+            existing = binding.get(var)
+            if existing is not None and existing != NodeRef(idx):
+                return None
+        if labels and not all(label in self.node_labels[idx] for label in labels):
+            return None
+        if props and not self._props_match(self.node_props[idx], props, binding, params):
+            return None
+        if var and binding.get(var) is None:
+            return dict(binding, **{var: NodeRef(idx)})
+        return binding
+
+    def _props_match(self, actual, expected, binding, params):
+        return all(actual.get(key) == self._eval(expr, binding, params) for key, expr in expected)
+
+    # -- projection ----------------------------------------------------------
+
+    def _run_projection(self, clause, rows, params):
+        _, distinct, star, items, order, skip, limit, where = clause
+        if star:
+            names = sorted({k for row in rows for k in row})
+            items = [(("var", name), name, name) for name in names] + list(items)
+        aggregate = any(_has_aggregate(expr) for expr, _, _ in items)
+        projected = []
+        if aggregate:
+            keys = [(expr, alias) for expr, alias, _ in items if not _has_aggregate(expr)]
+            groups = OrderedDict()
+            for row in rows:
+                group_key = tuple(_freeze(self._eval(expr, row, params)) for expr, _ in keys)
+                groups.setdefault(group_key, []).append(row)
+            if not groups and not keys:
+                groups[()] = []
+            for group in groups.values():
+                first = group[0] if group else {}
+                projected.append(({alias: self._eval(expr, first, params, group) for expr, alias, _ in items}, first))
+        else:
+            for row in rows:
+                projected.append(({alias: self._eval(expr, row, params) for expr, alias, _ in items}, row))
+
+        if distinct:
+            seen = set()
+            unique = []
+            for values, row in projected:
+                key = _freeze(list(values.values()))
+                if key not in seen:
+                    seen.add(key)
+                    unique.append((values, row))
+            projected = unique
+
+        if order:
+            by_text = {text: alias for _, alias, text in items}
+            for expr, text, desc in reversed(order):
+                def sort_value(entry, expr=expr, text=text):
+                    values, row = entry
+                    if text in by_text:
+                        return _sort_key(values[by_text[text]])
+                    return _sort_key(self._eval(expr, dict(row, **values), params))
+                projected.sort(key=sort_value, reverse=desc)
+
+        if skip is not None:
+            projected = projected[int(self._eval(skip, {}, params)):]
+        if limit is not None:
+            projected = projected[:int(self._eval(limit, {}, params))]
+
+        result = [values for values, _ in projected]
+        if where is not None:
+            result = [row for row in result if self._eval(where, row, params) is True]
+        return result
+
+    # -- evaluation ----------------------------------------------------------
+
+    def _as_list(self, value):
+        if value is None:
+            return []
+        return value if isinstance(value, list) else [value]
+
+    def _get_property(self, value, key):
+        if isinstance(value, NodeRef):
+            return self.node_props[value.id].get(key)
+        if isinstance(value, RelRef):
+            return self.rel_props[value.id].get(key)
+        if isinstance(value, dict):
+            return value.get(key)
+        if value is None:
+            return None
+        raise CypherError(f"Type mismatch: cannot read property '{key}' of {type(value).__name__}")
+
+    def _eval(self, expr, row, params, group=None):
+        kind = expr[0]
+        if kind == "lit":
+            return expr[1]
+        if kind == "var":
+            if expr[1] not in row:
+                raise CypherError(f"Variable `{expr[1]}` not defined")
+            return row[expr[1]]
+        if kind == "param":
+            return params.get(expr[1])
+        if kind == "prop":
+            return self._get_property(self._eval(expr[1], row, params, group), expr[2])
+        if kind == "agg":
+            return self._aggregate(expr, group if group is not None else [row], params)
+        if kind == "and":
+            left = self._eval(expr[1], row, params, group)
+            if left is False:
+                return False
+            right = self._eval(expr[2], row, params, group)
+            if right is False:
+                return False
+            return None if left is None or right is None else True
+        if kind == "or":
+            left = self._eval(expr[1], row, params, group)
+            if left is True:
+                return True
+            right = self._eval(expr[2], row, params, group)
+            if right is True:
+                return True
+            return None if left is None or right is None else False
+        if kind == "xor":
+            left = self._eval(expr[1], row, params, group)
+            right = self._eval(expr[2], row, params, group)
+            return None if left is None or right is None else left != right
+        if kind == "not":
+            value = self._eval(expr[1], row, params, group)
+            return None if value is None else not value
+        if kind == "neg":
+            value = self._eval(expr[1], row, params, group)
+            return None if value is None else -value
+        if kind == "bin":
+            return self._binary(expr[1], self._eval(expr[2], row, params, group),
+                                self._eval(expr[3], row, params, group))
+        if kind == "isnull":
+            value = self._eval(expr[1], row, params, group)
+            return (value is not None) if expr[2] else (value is None)
+        if kind == "list":
+            return [self._eval(item, row, params, group) for item in expr[1]]
+        if kind == "map":
+            return {key: self._eval(value, row, params, group) for key, value in expr[1]}
+        if kind == "mapproj":
+            target = row.get(expr[1])
+            result = {}
+            for key, value in expr[2]:
+                if key == "*":
+                    if isinstance(target, NodeRef):
+                        result.update(self.node_props[target.id])
+                    elif isinstance(target, RelRef):
+                        result.update(self.rel_props[target.id])
+                    elif isinstance(target, dict):
+                        result.update(target)
+                else:
+                    result[key] = self._eval(value, row, params, group)
+            return result
+        if kind == "index":
+            target = self._eval(expr[1], row, params, group)
+            index = self._eval(expr[2], row, params, group)
+            if target is None or index is None:
+                return None
+            if isinstance(index, str):
+                return self._get_property(target, index)
+            try:
+                return target[index]
+            except IndexError:
+                return None
+        if kind == "slice":
+            target = self._eval(expr[1], row, params, group)
+            start = self._eval(expr[2], row, params, group) if expr[2] else None
+            end = self._eval(expr[3], row, params, group) if expr[3] else None
+            return None if target is None else target[start:end]
+        if kind == "haslabels":
+            value = self._eval(expr[1], row, params, group)
+            if not isinstance(value, NodeRef):
+                return None
+            return all(label in self.node_labels[value.id] for label in expr[2])
+        if kind == "pattern":
+            patterns = expr[1]
+            where = expr[2] if len(expr) > 2 else None
+            return any(where is None or self._eval(where, binding, params) is True
+                       for binding in self._match_patterns(patterns, row, params))
+        if kind == "listcomp":
+            _, var, source, where, proj = expr
+            result = []
+            for item in self._as_list(self._eval(source, row, params, group)):
+                scope = dict(row, **{var: item})
+                if where is None or self._eval(where, scope, params) is True:
+                    result.append(self._eval(proj, scope, params) if proj else item)
+            return result
+        if kind == "case":
+            _, base, branches, default = expr
+            base_value = self._eval(base, row, params, group) if base else None
+            for cond, value in branches:
+                test = self._eval(cond, row, params, group)
+                if (base is None and test is True) or (base is not None and test == base_value):
+                    return self._eval(value, row, params, group)
+            return self._eval(default, row, params, group) if default else None
+        if kind == "call":
+            return self._call(expr[1], [self._eval(arg, row, params, group) for arg in expr[2]])
+        raise CypherError(f"Unsupported expression: {kind}")
+
+    def _aggregate(self, expr, group, params):
+        _, name, distinct, arg = expr
+        if arg is None:
+            return len(group)
+        values = [self._eval(arg, row, params) for row in group]
+        values = [v for v in values if v is not None]
+        if distinct:
+            seen = set()
+            unique = []
+            for value in values:
+                key = _freeze(value)
+                if key not in seen:
+                    seen.add(key)
+                    unique.append(value)
+            values = unique
+        if name == "count":
+            return len(values)
+        if name == "collect":
+            return values
+        if name == "sum":
+            return sum(values)
+        if name == "avg":
+            return sum(values) / len(values) if values else None
+        if name == "min":
+            return min(values, key=_sort_key) if values else None
+        if name == "max":
+            return max(values, key=_sort_key) if values else None
+        raise CypherError(f"Unknown aggregate function {name}")
+
+    def _binary(self, op, left, right):
+        if op == "=":
+            return None if left is None or right is None else left == right
+        if op == "<>":
+            return None if left is None or right is None else left != right
+        if op == "in":
+            if right is None:
+                return None
+            return any(_freeze(left) == _freeze(item) for item in right)
+        if left is None or right is None:
+            return None
+        if op in ("<", ">", "<=", ">="):
+            try:
+                return {"<": left < right, ">": left > right, "<=": left <= right, ">=": left >= right}[op]
+            except TypeError:
+                return None
+        if op == "=~":
+            return re.fullmatch(right, str(left)) is not None
+        if op == "contains":
+            return isinstance(left, str) and isinstance(right, str) and right in left
+        if op == "starts":
+            return isinstance(left, str) and isinstance(right, str) and left.startswith(right)
+        if op == "ends":
+            return isinstance(left, str) and isinstance(right, str) and left.endswith(right)
+        if op == "+":
+            if isinstance(left, list) or isinstance(right, list):
+                return self._as_list(left) + self._as_list(right)
+            if isinstance(left, str) or isinstance(right, str):
+                return f"{left}{right}"
+            return left + right
+        if op == "-":
+            return left - right
+        if op == "*":
+            return left * right
+        if op == "/":
+            if isinstance(left, int) and isinstance(right, int):
+                return int(left / right)
+            return left / right
+        if op == "%":
+            return left % right
+        if op == "^":
+            return float(left) ** right
+        raise CypherError(f"Unsupported operator {op}")
+
+    def _call(self, name, args):
+        value = args[0] if args else None
+        if name == "coalesce":
+            return next((arg for arg in args if arg is not None), None)
+        if name in ("exists",):
+            return value is not None and value is not False
+        if value is None and name not in ("range",):
+            return None
+        if name == "id":
+            return self.node_ids[value.id] if isinstance(value, NodeRef) else self.rel_ids[value.id]
+        if name == "elementid":
+            return str(self._call("id", args))
+        if name == "labels":
+            return list(self.node_labels[value.id])
+        if name == "type":
+            return self.rel_type[value.id]
+        if name == "properties":
+            if isinstance(value, NodeRef):
+                return dict(self.node_props[value.id])
+            if isinstance(value, RelRef):
+                return dict(self.rel_props[value.id])
+            return dict(value)
+        if name == "keys":
+            return list(self._call("properties", args).keys())
+        if name in ("size", "length"):
+            if isinstance(value, PathRef):
+                return len(value.rels)
+            if not isinstance(value, (str, list)):
+                raise CypherError(f"Type mismatch: {name}() expects a string, list or path, "
+                                  f"got {type(value).__name__}")
+            return len(value)
+        if name == "nodes":
+            return [NodeRef(n) for n in value.nodes]
+        if name == "relationships":
+            return [RelRef(r) for r in value.rels]
+        if name == "startnode":
+            return NodeRef(self.rel_start[value.id])
+        if name == "endnode":
+            return NodeRef(self.rel_end[value.id])
+        if name == "head":
+            return value[0] if value else None
+        if name == "last":
+            return value[-1] if value else None
+        if name == "tail":
+            return value[1:]
+        if name == "reverse":
+            return value[::-1]
+        if name == "tolower":
+            return value.lower()
+        if name == "toupper":
+            return value.upper()
+        if name == "trim":
+            return value.strip()
+        if name == "tostring":
+            return str(value).lower() if isinstance(value, bool) else str(value)
+        if name == "tointeger":
+            try:
+                return int(float(value))
+            except (TypeError, ValueError):
+                return None
+        if name == "tofloat":
+            try:
+                return float(value)
+            except (TypeError, ValueError):
+                return None
+        if name == "split":
+            return value.split(args[1])
+        if name == "replace":
+            return value.replace(args[1], args[2])
+        if name == "substring":
+            return value[args[1]:args[1] + args[2]] if len(args) > 2 else value[args[1]:]
+        if name == "left":
+            return value[:args[1]]
+        if name == "right":
+            return value[-args[1]:] if args[1] else ""
+        if name == "abs":
+            return abs(value)
+        if name == "round":
+            return float(round(value, args[1] if len(args) > 1 else 0))
+        if name == "range":
+            step = args[2] if len(args) > 2 else 1
+            return list(range(args[0], args[1] + (1 if step > 0 else -1), step))
+        raise CypherError(f"Unknown function '{name}'")
+
+    def _to_output(self, value):
+        if isinstance(value, NodeRef):
+            return dict(self.node_props[value.id])
+        if isinstance(value, RelRef):
+            return (dict(self.node_props[self.rel_start[value.id]]), self.rel_type[value.id],
+                    dict(self.node_props[self.rel_end[value.id]]))
+        if isinstance(value, PathRef):
+            result = [dict(self.node_props[value.nodes[0]])]
+            for rel, node in zip(value.rels, value.nodes[1:]):
+                result.extend([self.rel_type[rel], dict(self.node_props[node])])
+            return result
+        if isinstance(value, list):
+            return [self._to_output(v) for v in value]
+        if isinstance(value, dict):
+            return {k: self._to_output(v) for k, v in value.items()}
+        return value
+
+
+_graph_store_class = None
+
+
+def as_graph_store(graph):
+    """`graph` as a LangChain GraphStore, which GraphCypherQAChain requires. LangChain is imported here
+    rather than with this module, so loading the in-memory graph does not pay for it."""
+    global _graph_store_class
+    from langchain_community.graphs.graph_store import GraphStore
+    if isinstance(graph, GraphStore):
+        return graph
+    if _graph_store_class is None:
+        class InMemoryGraphStore(GraphStore):
+            def __init__(self, graph):
+                self.graph = graph
+
+            @property
+            def get_schema(self) -> str:
+                return self.graph.get_schema
+
+            @property
+            def get_structured_schema(self) -> Dict[str, Any]:
+                return self.graph.get_structured_schema
+
+            def query(self, query: str, params: dict = {}) -> List[Dict[str, Any]]:
+                return self.graph.query(query, params)
+
+            def refresh_schema(self) -> None:
+                self.graph.refresh_schema()
+
+            def add_graph_documents(self, graph_documents, include_source: bool = False) -> None:
+                self.graph.add_graph_documents(graph_documents, include_source)
+
+            def __getattr__(self, name):
+                return getattr(self.graph, name)
+
+        _graph_store_class = InMemoryGraphStore
+    return _graph_store_class(graph)
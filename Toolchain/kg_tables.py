@@ -0,0 +1,182 @@
+import os
+import threading
+from collections import OrderedDict
+
+from cypher_cache import normalize_question, question_tokens, jaccard
+
+KG_TABLES_SIMILARITY = float(os.getenv("KG_TABLES_SIMILARITY", "0.8"))
+
+# Canonical query families behind the example buttons in app.py.
+FAMILIES = OrderedDict([
+    ("processes", {
+        "cypher": "MATCH (p:Process)-[:hasSubprocess]->(s:Process) "
+                  "RETURN p.name AS Process, s.name AS SubProcess ORDER BY Process, SubProcess",
+        "questions": [
+            "List all information of processes and their sub-processes.",
+            "List all processes and their sub-processes.",
+            "List all processes.",
+            "Show all processes and sub-processes.",
+        ],
+    }),
+    ("operations", {
+        "cypher": "MATCH (o:Operation) RETURN o ORDER BY o.name",
+        "questions": [
+            "List all information of operations.",
+            "List all operations.",
+            "Show all operations.",
+            "List all information of all operations.",
+        ],
+    }),
+    ("process_operations", {
+        "cypher": "MATCH (p:Process)-[r]->(o:Operation) "
+                  "RETURN p.name AS Process, type(r) AS Relationship, o.name AS Operation ORDER BY Process, Operation",
+        "questions": [
+            "List all operations of each process.",
+            "List the operations of all processes.",
+            "Which operations belong to each process?",
+            "Show all processes and their operations.",
+        ],
+    }),
+    ("resources", {
+        "cypher": "MATCH (r:Resource) RETURN r ORDER BY r.name",
+        "questions": [
+            "List all information of resources.",
+            "List all resources.",
+            "Show all resources.",
+            "List all information of all resources.",
+        ],
+    }),
+    ("requirements", {
+        "cypher": "MATCH (o:Operation)-[r:requiresResource]->(res:Resource) "
+                  "RETURN o.name AS Operation, res.name AS Resource, r.number AS Number ORDER BY Operation, Resource",
+        "questions": [
+            "Search all relationships between operations and resources. List all names of operations, names of "
+            "resources, and number of need resources. Merge information according to the operation.",
+            "List all required resources of each operation.",
+            "List all resources required by each operation and their number.",
+            "List all relationships between operations and resources.",
+        ],
+    }),
+    ("predecessors", {
+        "cypher": "MATCH (o:Operation)-[:hasPredecessors]->(p:Operation) "
+                  "RETURN o.name AS Operation, p.name AS Predecessor ORDER BY Operation, Predecessor",
+        "questions": [
+            "List all predecessors of each operation.",
+            "List all predecessors.",
+            "Show the predecessors of all operations.",
+            "List all operations and their predecessors.",
+        ],
+    }),
+])
+
+
+def markdown_table(header, rows):
+    lines = ["| " + " | ".join(header) + " |", "|" + "---|" * len(header)]
+    for row in rows:
+        lines.append("| " + " | ".join("" if v is None else str(v) for v in row) + " |")
+    return "\n".join(lines)
+
+
+def _render_processes(views):
+    children = OrderedDict()
+    for row in views["processes"]:
+        children.setdefault(row["Process"], []).append(row["SubProcess"])
+    rows = [(process, ", ".join(subs)) for process, subs in children.items()]
+    return "**Processes and their sub-processes:**\n\n" + markdown_table(["Process", "Sub-processes"], rows)
+
+
+def _render_operations(views):
+    rows = [(o["o"].get("name"), o["o"].get("op_type"), o["o"].get("duration")) for o in views["operations"]]
+    return "**Operations:**\n\n" + markdown_table(["Operation", "Type", "Duration (min)"], rows)
+
+
+OPERATION_KINDS = {
+    "hasEssentialOperation": "essential",
+    "hasOptionalAutoOperation": "optional, automatic",
+    "hasOptionalManualOperation": "optional, manual",
+}
+
+
+def _render_process_operations(views):
+    merged = OrderedDict()
+    for row in views["process_operations"]:
+        kind = OPERATION_KINDS.get(row["Relationship"], row["Relationship"])
+        merged.setdefault(row["Process"], []).append(f"{row['Operation']} ({kind})")
+    rows = [(process, ", ".join(ops)) for process, ops in merged.items()]
+    return "**Operations of each process:**\n\n" + markdown_table(["Process", "Operations"], rows)
+
+
+def _render_resources(views):
+    rows = [(r["r"].get("name"), r["r"].get("cost_hour"), r["r"].get("calendar"), r["r"].get("number"))
+            for r in views["resources"]]
+    return "**Resources:**\n\n" + markdown_table(["Resource", "Cost (€/h)", "Calendar", "Quantity"], rows)
+
+
+def _render_requirements(views):
+    merged = OrderedDict()
+    for row in views["requirements"]:
+        merged.setdefault(row["Operation"], []).append(f"{row['Resource']} ({row['Number']})")
+    rows = [(op, ", ".join(resources)) for op, resources in merged.items()]
+    return "**Required resources of each operation:**\n\n" + markdown_table(
+        ["Operation", "Required Resources (number)"], rows)
+
+
+def _render_predecessors(views):
+    preds = OrderedDict((o["o"].get("name"), []) for o in views["operations"])
+    for row in views["predecessors"]:
+        preds.setdefault(row["Operation"], []).append(row["Predecessor"])
+    rows = [(op, ", ".join(p) if p else "None") for op, p in preds.items()]
+    return "**Predecessors of each operation:**\n\n" + markdown_table(["Operation", "Predecessor"], rows)
+
+
+RENDERERS = {
+    "processes": _render_processes,
+    "operations": _render_operations,
+    "process_operations": _render_process_operations,
+    "resources": _render_resources,
+    "requirements": _render_requirements,
+    "predecessors": _render_predecessors,
+}
+
+
+class KGTables:
+    def __init__(self, similarity=KG_TABLES_SIMILARITY):
+        self.similarity = similarity
+        self.lock = threading.Lock()
+        self.fingerprint = None
+        self.views = {}
+        self.rendered = {}
+        self.hits = 0
+        self.phrases = [(family, question_tokens(normalize_question(q)), normalize_question(q))
+                        for family, spec in FAMILIES.items() for q in spec["questions"]]
+
+    def refresh(self, graph, fingerprint):
+        if fingerprint == self.fingerprint and self.views:
+            return
+        views = {family: graph.query(spec["cypher"]) for family, spec in FAMILIES.items()}
+        rendered = {family: render(views) for family, render in RENDERERS.items()}
+        with self.lock:
+            self.views, self.rendered, self.fingerprint = views, rendered, fingerprint
+
+    def match(self, question):
+        key = normalize_question(question)
+        tokens = question_tokens(key)
+        best, best_score = None, 0.0
+        for family, phrase_tokens, phrase in self.phrases:
+            score = 1.0 if key == phrase else jaccard(tokens, phrase_tokens)
+            if score > best_score:
+                best, best_score = family, score
+        return best if best_score >= self.similarity else None
+
+    def lookup(self, question):
+        family = self.match(question)
+        with self.lock:
+            if family is None or family not in self.views:
+                return None
+            self.hits += 1
+            return {
+                "family": family,
+                "cypher": FAMILIES[family]["cypher"],
+                "rows": self.views[family],
+                "answer": self.rendered[family],
+            }
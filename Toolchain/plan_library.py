@@ -0,0 +1,244 @@
+import glob
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import asdict
+
+from plan_validator import PlanValidator, read_plan_csv, _column_index
+from scheduler import PlanRequest, op_code, plan_markdown, _format_number, AUTO_DONE, MANUAL_DONE
+from tracing import get_logger
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+PLAN_LIBRARY_PATH = os.path.join(current_dir, "cache", "plan_library.json")
+PLAN_LIBRARY_SIZE = int(os.getenv("PLAN_LIBRARY_SIZE", "64"))
+PLAN_LIBRARY_TTL = float(os.getenv("PLAN_LIBRARY_TTL", str(30 * 24 * 3600)))
+# Saved plan CSVs that seed an empty library; separated by os.pathsep.
+PLAN_LIBRARY_IMPORT = os.getenv("PLAN_LIBRARY_IMPORT", "./plans")
+
+log = get_logger("plan_library")
+
+
+def problem_fingerprint(problem):
+    """Hash of what a plan depends on: the operation set, durations, predecessors and resources."""
+    data = {
+        "operations": sorted((code, op.op_type, op.duration, sorted(op.resources.items()),
+                              sorted(op_code(p) for p in op.predecessors))
+                             for code, op in problem.operations.items()),
+        "resources": sorted((key, res.quantity, res.cost_hour) for key, res in problem.resources.items()),
+    }
+    return hashlib.sha1(json.dumps(data, default=str).encode("utf-8")).hexdigest()[:16]
+
+
+def request_key(request):
+    return (f"q{request.quarters}-p{request.max_manual_parallel}"
+            f"-a{int(request.require_auto)}-m{int(request.require_manual)}")
+
+
+def request_distance(a, b):
+    # Differences in the number of bodies matter most; the mode and the parallelism limit less.
+    return (4 * abs(a["quarters"] - b["quarters"]) + abs(a["max_manual_parallel"] - b["max_manual_parallel"])
+            + (a["require_auto"] != b["require_auto"]) + (a["require_manual"] != b["require_manual"]))
+
+
+def request_from_rows(rows):
+    """The request a saved plan answers, read from its completion operations."""
+    col = _column_index(rows[0])
+    body = [r for r in rows[1:] if len(r) > col.get("operation", 0)]
+    codes = [op_code(r[col["operation"]]) for r in body] if "operation" in col else []
+    auto = codes.count(AUTO_DONE)
+    manual_starts = [r[col["start"]] for r, c in zip(body, codes) if c == MANUAL_DONE and "start" in col]
+    parallel = max((manual_starts.count(s) for s in manual_starts), default=1)
+    return PlanRequest(quarters=auto + len(manual_starts), max_manual_parallel=max(parallel, 1),
+                       require_auto=auto > 0, require_manual=bool(manual_starts))
+
+
+class LibraryPlan:
+    """A stored plan, offering the `markdown` / `summary` / `table` interface of a `Schedule`."""
+
+    def __init__(self, entry, kind):
+        self.entry = entry
+        self.kind = kind
+
+    @property
+    def reusable(self):
+        return self.kind in ("exact", "compatible")
+
+    def table(self):
+        return self.entry["rows"]
+
+    def markdown(self):
+        return plan_markdown(self.entry["rows"])
+
+    def summary(self):
+        e = self.entry
+        how = {"exact": "the same request", "compatible": "a request it also satisfies",
+               "near": "a similar request"}[self.kind]
+        return (f"Total due time: {_format_number(e['makespan'])} min; total cost: {_format_number(e['cost'])} €; "
+                f"reused from the plan library (validated for {how}, {e['source']})")
+
+
+class PlanLibrary:
+    def __init__(self, path=PLAN_LIBRARY_PATH, max_entries=PLAN_LIBRARY_SIZE, ttl=PLAN_LIBRARY_TTL):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.fingerprint = None
+        self.imported = set()
+        self.imported_for = None  # fingerprint the saved CSVs were last imported under
+        self.hits = {"exact": 0, "compatible": 0, "near": 0, "miss": 0}
+        self.load()
+
+    def load(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            log.warning("Load plan library failed: %s", e)
+            return
+        self.fingerprint = data.get("fingerprint")
+        self.imported = set(data.get("imported", []))
+        for entry in data.get("entries", []):
+            self.entries[entry["key"]] = entry
+
+    def save(self):
+        if not self.path:
+            return
+        data = {"fingerprint": self.fingerprint, "imported": sorted(self.imported),
+                "entries": list(self.entries.values())}
+        try:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False, default=str)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            log.warning("Save plan library failed: %s", e)
+
+    def check_fingerprint(self, fingerprint):
+        # Plans validated against other durations or resource quantities are no longer trustworthy.
+        with self.lock:
+            if fingerprint == self.fingerprint:
+                return
+            stale = [key for key, e in self.entries.items() if e["fingerprint"] != fingerprint]
+            for key in stale:
+                del self.entries[key]
+            if self.fingerprint is not None:
+                log.info("KG data changed, %d stored plans invalidated", len(stale))
+            self.fingerprint = fingerprint
+            self.imported.clear()
+            self.save()
+
+    def _expired(self, entry, now):
+        return self.ttl and now - entry["created"] > self.ttl
+
+    def lookup(self, problem, request):
+        """Exact hit, a stored plan that also validates for `request`, or the nearest plan as a warm start."""
+        fingerprint = problem_fingerprint(problem)
+        self.check_fingerprint(fingerprint)
+        key = f"{fingerprint}:{request_key(request)}"
+        wanted = asdict(request)
+        now = time.time()
+        with self.lock:
+            for k in [k for k, e in self.entries.items() if self._expired(e, now)]:
+                del self.entries[k]
+            entry = self.entries.get(key)
+            candidates = sorted((e for e in self.entries.values() if e is not entry),
+                                key=lambda e: (request_distance(e["request"], wanted), e["makespan"], e["cost"]))
+        kind = "exact" if entry else None
+        if entry is None:
+            validator = PlanValidator(problem, request)
+            for candidate in candidates:
+                if candidate["request"]["quarters"] != request.quarters:
+                    continue
+                if validator.validate(candidate["rows"])["valid"]:
+                    entry, kind = candidate, "compatible"
+                    break
+        if entry is None and candidates:
+            entry, kind = candidates[0], "near"
+        with self.lock:
+            self.hits[kind or "miss"] += 1
+            if entry is None:
+                return None
+            if entry["key"] in self.entries:
+                self.entries.move_to_end(entry["key"])
+            entry["hits"] += 1
+        return LibraryPlan(entry, kind)
+
+    def put(self, problem, request, rows, report, source="generated"):
+        if not report.get("valid") or not rows or len(rows) < 2:
+            return None
+        fingerprint = problem_fingerprint(problem)
+        self.check_fingerprint(fingerprint)
+        key = f"{fingerprint}:{request_key(request)}"
+        with self.lock:
+            previous = self.entries.get(key)
+            # Keep the faster (then cheaper) plan for a request.
+            if previous and (previous["makespan"], previous["cost"]) <= (report["makespan"], report["recomputed_cost"]):
+                self.entries.move_to_end(key)
+                return previous
+            entry = self.entries[key] = {
+                "key": key,
+                "fingerprint": fingerprint,
+                "request": asdict(request),
+                "rows": [[str(c) for c in row] for row in rows],
+                "makespan": report["makespan"],
+                "cost": report["recomputed_cost"],
+                "source": source,
+                "created": time.time(),
+                "hits": 0,
+            }
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+            self.save()
+        return entry
+
+    def import_plans(self, problem, patterns=PLAN_LIBRARY_IMPORT):
+        """Validate saved assembly_plan_*.csv files once and add the valid ones.
+
+        Runs once per process and KG fingerprint; plans generated afterwards are added by `put`.
+        """
+        fingerprint = problem_fingerprint(problem)
+        self.check_fingerprint(fingerprint)
+        if self.imported_for == fingerprint:
+            return 0
+        added = 0
+        for directory in filter(None, patterns.split(os.pathsep)):
+            for path in sorted(glob.glob(os.path.join(directory, "assembly_plan_*.csv"))):
+                real = os.path.realpath(path)
+                if real in self.imported:
+                    continue
+                self.imported.add(real)
+                try:
+                    rows = read_plan_csv(path)
+                    request = request_from_rows(rows)
+                    report = PlanValidator(problem, request).validate(rows)
+                except Exception as e:
+                    log.warning("Import plan %s failed: %s", path, e)
+                    continue
+                if self.put(problem, request, rows, report, source=os.path.basename(path)):
+                    added += 1
+        self.imported_for = fingerprint
+        if added:
+            with self.lock:
+                self.save()
+            log.info("Imported %d saved plans into the plan library", added)
+        return added
+
+    def invalidate(self):
+        with self.lock:
+            self.entries.clear()
+            self.imported.clear()
+            self.imported_for = None
+            self.save()
+
+    def stats(self):
+        with self.lock:
+            return dict(self.hits, size=len(self.entries), fingerprint=self.fingerprint)
@@ -0,0 +1,208 @@
+import itertools
+import multiprocessing
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, BrokenExecutor, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from threading import Lock
+
+from plan_stream import Phase3TableParser
+from plan_validator import PlanValidator
+from scheduler import PlanScheduler, plan_request_from_question, plan_markdown, _format_number
+from tracing import get_logger
+
+# DESIGN_ENGINE=search: heuristic schedules and PLAN_SEARCH_LLM_CANDIDATES model plans are scored
+# side by side; whatever has been scored when PLAN_SEARCH_BUDGET seconds are up is used.
+PLAN_SEARCH_LLM_CANDIDATES = int(os.getenv("PLAN_SEARCH_LLM_CANDIDATES", "2"))
+PLAN_SEARCH_BUDGET = float(os.getenv("PLAN_SEARCH_BUDGET", "90"))
+PLAN_SCORE_WORKERS = int(os.getenv("PLAN_SCORE_WORKERS", str(min(4, os.cpu_count() or 1))))
+# "process" scores in a spawned process pool; "thread" keeps scoring in this process.
+PLAN_SCORE_POOL = os.getenv("PLAN_SCORE_POOL", "process").lower()
+
+log = get_logger("plan_search")
+
+_pool = None
+_pool_lock = Lock()
+
+
+def score_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            if PLAN_SCORE_POOL == "process":
+                # Spawned rather than forked: the app process runs Gradio, Neo4j and HTTP client threads.
+                _pool = ProcessPoolExecutor(PLAN_SCORE_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+            else:
+                _pool = ThreadPoolExecutor(PLAN_SCORE_WORKERS, thread_name_prefix="plan-score")
+        return _pool
+
+
+def _discard_pool(pool):
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def score_plan(problem, request, rows):
+    report = PlanValidator(problem, request).validate(rows)
+    return {
+        "valid": report["valid"],
+        "violations": len(report["violations"]),
+        "failed_checks": [name for name, ok in report["checks"].items() if not ok],
+        "makespan": report["makespan"],
+        # The cost the rows would really incur, not the figure a model wrote into them.
+        "cost": report["recomputed_cost"],
+    }
+
+
+def plan_rows_from_answer(text):
+    parser = Phase3TableParser()
+    parser.feed(text + "\n")
+    parser.close()
+    return parser.table()
+
+
+class PlanCandidate:
+    def __init__(self, source, rows, description=""):
+        self.source = source
+        self.rows = rows
+        self.description = description
+        self.score = None
+
+    def rank(self):
+        s = self.score
+        return (not s["valid"], s["violations"], s["makespan"], s["cost"])
+
+
+def pareto_front(candidates):
+    """Scored candidates no other candidate beats on both due time and cost, fastest first."""
+    front, best_cost = [], None
+    for c in sorted(candidates, key=lambda c: (c.score["makespan"], c.score["cost"])):
+        if best_cost is None or c.score["cost"] < best_cost:
+            front.append(c)
+            best_cost = c.score["cost"]
+    return front
+
+
+class PlanSearchResult:
+    """Best-of-N outcome; offers the `markdown` / `summary` / `table` interface of a `Schedule`."""
+
+    def __init__(self, best, front, scored, failed, timed_out, elapsed):
+        self.best = best
+        self.front = front
+        self.scored = scored
+        self.failed = failed
+        self.timed_out = timed_out
+        self.elapsed = elapsed
+
+    def table(self):
+        return self.best.rows
+
+    def markdown(self):
+        lines = ["| Candidate | Total due time (min) | Total cost (€) | Constraint violations |", "|---|---|---|---|"]
+        shown = self.front if self.best in self.front else [self.best] + self.front
+        for c in shown:
+            marker = " (selected)" if c is self.best else ""
+            lines.append(f"| {c.source}{marker} | {_format_number(c.score['makespan'])} | "
+                         f"{_format_number(c.score['cost'])} | {c.score['violations']} |")
+        among = "feasible candidates" if self.best.score["valid"] else "candidates (none is feasible)"
+        return f"{plan_markdown(self.best.rows)}\n\n**Time vs. cost trade-offs among the {among}:**\n\n" + "\n".join(lines)
+
+    def summary(self):
+        feasible = sum(1 for c in self.scored if c.score["valid"])
+        cut = ", time budget reached" if self.timed_out else ""
+        best = self.best
+        description = best.description or (f"Total due time: {_format_number(best.score['makespan'])} min; "
+                                           f"total cost: {_format_number(best.score['cost'])} €; from {best.source}")
+        return (f"{description}; best of {len(self.scored)} scored candidates "
+                f"({feasible} feasible{cut}, {self.elapsed:.1f} s)")
+
+
+class PlanSearch:
+    def __init__(self, problem, request, budget=PLAN_SEARCH_BUDGET, pool=None):
+        self.problem = problem
+        self.request = request
+        self.budget = budget
+        self.pool = pool
+
+    def heuristic_candidates(self):
+        for schedule in PlanScheduler(self.problem).candidates(self.request):
+            batches = "+".join(map(str, schedule.manual_batches)) or "-"
+            order = "auto first" if schedule.auto_first else "manual first"
+            source = f"scheduler: {schedule.auto_quarters} auto, manual batches {batches}, {order}"
+            yield PlanCandidate(source, schedule.table(), schedule.summary())
+
+    def run(self, generate=None, llm_candidates=PLAN_SEARCH_LLM_CANDIDATES, seeds=()):
+        """Score heuristic schedules and `llm_candidates` plans from `generate()` until the budget is spent."""
+        start = time.monotonic()
+        deadline = start + self.budget
+        pool = self.pool or score_pool()
+        scoring, scored, failed = {}, [], 0
+
+        def submit(candidate):
+            scoring[pool.submit(score_plan, self.problem, self.request, candidate.rows)] = candidate
+
+        for candidate in itertools.chain(seeds, self.heuristic_candidates()):
+            submit(candidate)
+        llm_pool, answers = None, {}
+        if generate and llm_candidates:
+            llm_pool = ThreadPoolExecutor(llm_candidates, thread_name_prefix="plan-llm")
+            answers = {llm_pool.submit(generate): i for i in range(1, llm_candidates + 1)}
+
+        timed_out = False
+        try:
+            while scoring or answers:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    timed_out = True
+                    break
+                done, _ = wait(list(scoring) + list(answers), timeout=remaining, return_when=FIRST_COMPLETED)
+                for future in done:
+                    if future in answers:
+                        index = answers.pop(future)
+                        try:
+                            rows = plan_rows_from_answer(future.result())
+                        except Exception as e:
+                            log.warning("Plan candidate llm#%d failed: %s", index, e)
+                            rows = None
+                        if rows and len(rows) > 1:
+                            submit(PlanCandidate(f"llm #{index}", rows))
+                        else:
+                            failed += 1
+                    else:
+                        candidate = scoring.pop(future)
+                        try:
+                            candidate.score = future.result()
+                            scored.append(candidate)
+                        except BrokenExecutor as e:
+                            # A dead worker breaks the whole pool; score here and start a new pool next time.
+                            log.warning("Plan scoring pool failed, scoring in process: %s", e)
+                            if pool is not self.pool:
+                                _discard_pool(pool)
+                            candidate.score = score_plan(self.problem, self.request, candidate.rows)
+                            scored.append(candidate)
+                        except Exception as e:
+                            log.warning("Scoring %s failed: %s", candidate.source, e)
+                            failed += 1
+        finally:
+            for future in scoring:
+                future.cancel()
+            if llm_pool:
+                # Model calls still running are abandoned; their results are no longer waited for.
+                llm_pool.shutdown(wait=False, cancel_futures=True)
+
+        if not scored:
+            return None
+        best = min(scored, key=PlanCandidate.rank)
+        feasible = [c for c in scored if c.score["valid"]]
+        front = pareto_front(feasible or scored)
+        elapsed = time.monotonic() - start
+        log.info("Plan search: %d scored, %d failed, best %s (%.1f s%s)", len(scored), failed, best.source,
+                 elapsed, ", timed out" if timed_out else "")
+        return PlanSearchResult(best, front, scored, failed, timed_out, elapsed)
+
+
+def search_plan(problem, question="", generate=None, budget=PLAN_SEARCH_BUDGET,
+                llm_candidates=PLAN_SEARCH_LLM_CANDIDATES, seeds=()):
+    return PlanSearch(problem, plan_request_from_question(question), budget).run(generate, llm_candidates, seeds)
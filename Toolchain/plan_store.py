@@ -0,0 +1,335 @@
+import datetime
+import os
+import sqlite3
+import sys
+import threading
+import time
+import uuid
+
+import numpy as np
+
+from export_jobs import PLANS_DIR, MBSE_DIR, SIM_DIR, plan_suffix
+from plan_validator import _column_index, _to_float, read_plan_csv
+from scheduler import PLAN_HEADER, op_code, normalize_type, parse_resource_list
+from tracing import configure_logging, get_logger, _percentiles
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+PLAN_STORE_PATH = os.getenv("PLAN_STORE_PATH", os.path.join(current_dir, "cache", "plans.sqlite"))
+
+log = get_logger("plan_store")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS plans (
+    id TEXT PRIMARY KEY,
+    session TEXT,
+    question TEXT,
+    source TEXT,
+    created REAL NOT NULL,
+    operations INTEGER NOT NULL,
+    makespan REAL,
+    cost REAL,
+    valid INTEGER,
+    csv TEXT,
+    owl TEXT,
+    model TEXT
+);
+CREATE INDEX IF NOT EXISTS plans_created ON plans (created);
+CREATE INDEX IF NOT EXISTS plans_session ON plans (session, created);
+CREATE INDEX IF NOT EXISTS plans_csv ON plans (csv);
+CREATE TABLE IF NOT EXISTS operations (id INTEGER PRIMARY KEY, code TEXT UNIQUE NOT NULL, name TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS resources (id INTEGER PRIMARY KEY, name TEXT UNIQUE NOT NULL);
+CREATE TABLE IF NOT EXISTS plan_rows (
+    plan_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    step TEXT,
+    operation_id INTEGER NOT NULL,
+    automatic INTEGER NOT NULL,
+    duration REAL,
+    start REAL,
+    finish REAL,
+    cost REAL,
+    PRIMARY KEY (plan_id, seq)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS row_resources (
+    plan_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    slot INTEGER NOT NULL,
+    resource_id INTEGER NOT NULL,
+    quantity INTEGER NOT NULL,
+    PRIMARY KEY (plan_id, seq, slot)
+) WITHOUT ROWID;
+"""
+
+def new_plan_id():
+    # Sorts by creation time; the random part keeps plans saved in the same second apart.
+    return f"{datetime.datetime.now():%Y%m%d_%H%M%S}_{uuid.uuid4().hex[:6]}"
+
+
+def _number(text):
+    value = _to_float(text)
+    return None if np.isnan(value) else value
+
+
+def typed_rows(rows):
+    """Plan table rows (header first, as written to the CSV) as dicts with numbers and resource counts."""
+    if not rows or len(rows) < 2:
+        return []
+    col = _column_index(rows[0])
+    cell = lambda r, key: r[col[key]] if key in col and col[key] < len(r) else ""
+    typed = []
+    for r in rows[1:]:
+        if not any(str(c).strip() for c in r):
+            continue
+        typed.append({
+            # Order labels are kept as written: parallel steps are numbered 17a, 17b.
+            "step": str(cell(r, "order")).strip() or str(len(typed) + 1),
+            "code": op_code(cell(r, "operation")),
+            "operation": str(cell(r, "operation")).strip(),
+            "automatic": normalize_type(cell(r, "type")) == "Automatic",
+            "resources": parse_resource_list(cell(r, "resources")),
+            "duration": _number(cell(r, "duration")),
+            "start": _number(cell(r, "start")),
+            "finish": _number(cell(r, "end")),
+            "cost": _number(cell(r, "cost")),
+        })
+    return typed
+
+
+def _format_number(value):
+    if value is None:
+        return ""
+    return int(value) if float(value).is_integer() else round(value, 2)
+
+
+class PlanStore:
+    """Saved assembly plans as typed rows in SQLite, with their owner and exported artifacts.
+
+    Operations and resources are stored once and referenced by id, so thousands of plans stay small and
+    makespan, cost or resource usage can be aggregated in SQL instead of re-parsing CSV files. The plan
+    CSV, MBSE OWL and MATLAB model paths are kept per plan, replacing directory listings in the exports.
+    """
+
+    def __init__(self, path=PLAN_STORE_PATH):
+        self.path = path or ":memory:"
+        self.lock = threading.Lock()
+        created = self.path == ":memory:" or not os.path.exists(self.path)
+        if self.path != ":memory:":
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self.db = sqlite3.connect(self.path, check_same_thread=False)
+        self.db.row_factory = sqlite3.Row
+        if self.path != ":memory:":
+            self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.executescript(SCHEMA)
+        self._load_ids()
+        if created and path:
+            self.import_csv_dir()
+
+    def _load_ids(self):
+        self.operation_ids = {row["code"]: row["id"] for row in self.db.execute("SELECT id, code FROM operations")}
+        self.resource_ids = {row["name"]: row["id"] for row in self.db.execute("SELECT id, name FROM resources")}
+
+    def _operation_id(self, code, name):
+        if code not in self.operation_ids:
+            self.db.execute("INSERT OR IGNORE INTO operations (code, name) VALUES (?, ?)", (code, name))
+            self.operation_ids[code] = self.db.execute("SELECT id FROM operations WHERE code = ?", (code,)).fetchone()[0]
+        return self.operation_ids[code]
+
+    def _resource_id(self, name):
+        if name not in self.resource_ids:
+            self.db.execute("INSERT OR IGNORE INTO resources (name) VALUES (?)", (name,))
+            self.resource_ids[name] = self.db.execute("SELECT id FROM resources WHERE name = ?", (name,)).fetchone()[0]
+        return self.resource_ids[name]
+
+    def add(self, rows, plan_id=None, session=None, question=None, source=None, csv_path=None, created=None):
+        """Stores the plan table `rows` and returns its id; tables without rows are not stored."""
+        typed = typed_rows(rows)
+        if not typed:
+            return None
+        plan_id = plan_id or new_plan_id()
+        starts = [r["start"] for r in typed if r["start"] is not None]
+        finishes = [r["finish"] for r in typed if r["finish"] is not None]
+        makespan = max(finishes) - min(starts) if starts and finishes else None
+        costs = [r["cost"] for r in typed if r["cost"] is not None]
+        with self.lock:
+            try:
+                self._insert(plan_id, typed, (session, question, source, created or time.time(), len(typed),
+                                              makespan, sum(costs) if costs else None, csv_path))
+            except sqlite3.Error:
+                self._load_ids()  # ids handed out in the rolled-back transaction are gone
+                raise
+        return plan_id
+
+    def _insert(self, plan_id, typed, fields):
+        with self.db:
+            self.db.execute(
+                "INSERT OR REPLACE INTO plans (id, session, question, source, created, operations, makespan, cost, csv)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", (plan_id,) + fields)
+            self.db.execute("DELETE FROM plan_rows WHERE plan_id = ?", (plan_id,))
+            self.db.execute("DELETE FROM row_resources WHERE plan_id = ?", (plan_id,))
+            self.db.executemany(
+                "INSERT INTO plan_rows VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [(plan_id, seq, r["step"], self._operation_id(r["code"], r["operation"]), r["automatic"],
+                  r["duration"], r["start"], r["finish"], r["cost"]) for seq, r in enumerate(typed)])
+            self.db.executemany(
+                "INSERT INTO row_resources VALUES (?, ?, ?, ?, ?)",
+                [(plan_id, seq, slot, self._resource_id(name), qty)
+                 for seq, r in enumerate(typed) for slot, (name, qty) in enumerate(r["resources"].items())])
+
+    def set_valid(self, plan_id, valid):
+        with self.lock, self.db:
+            self.db.execute("UPDATE plans SET valid = ? WHERE id = ?", (int(bool(valid)), plan_id))
+
+    def get(self, plan_id):
+        with self.lock:
+            row = self.db.execute("SELECT * FROM plans WHERE id = ?", (plan_id,)).fetchone()
+        return dict(row) if row else None
+
+    def table(self, plan_id):
+        """The plan as table rows under PLAN_HEADER, as the scheduler writes them."""
+        with self.lock:
+            rows = self.db.execute(
+                "SELECT r.seq, r.step, o.name, r.automatic, r.duration, r.start, r.finish, r.cost"
+                " FROM plan_rows r JOIN operations o ON o.id = r.operation_id WHERE r.plan_id = ? ORDER BY r.seq",
+                (plan_id,)).fetchall()
+            usage = {}
+            for seq, name, qty in self.db.execute(
+                    "SELECT u.seq, s.name, u.quantity FROM row_resources u JOIN resources s ON s.id = u.resource_id"
+                    " WHERE u.plan_id = ? ORDER BY u.seq, u.slot", (plan_id,)):
+                usage.setdefault(seq, []).append(f"{name} ({qty})")
+        return [PLAN_HEADER] + [
+            [r["step"], r["name"], "Automatic" if r["automatic"] else "Manual", ", ".join(usage.get(r["seq"], [])),
+             _format_number(r["duration"]), _format_number(r["start"]), _format_number(r["finish"]),
+             _format_number(r["cost"])] for r in rows]
+
+    def plans(self, session=None, limit=50):
+        """Newest plans first, optionally only those of `session`."""
+        query, params = "SELECT * FROM plans", []
+        if session is not None:
+            query, params = query + " WHERE session = ?", [session]
+        with self.lock:
+            rows = self.db.execute(query + " ORDER BY created DESC LIMIT ?", params + [limit]).fetchall()
+        return [dict(r) for r in rows]
+
+    def stats(self, session=None, valid=None, since=None):
+        """Makespan and cost distributions over the stored plans."""
+        clauses, params = [], []
+        for column, value in (("session = ?", session), ("valid = ?", valid), ("created >= ?", since)):
+            if value is not None:
+                clauses.append(column)
+                params.append(int(value) if isinstance(value, bool) else value)
+        where = " WHERE " + " AND ".join(clauses) if clauses else ""
+        with self.lock:
+            rows = self.db.execute(f"SELECT makespan, cost FROM plans{where}", params).fetchall()
+        makespans = [r["makespan"] for r in rows if r["makespan"] is not None]
+        costs = [r["cost"] for r in rows if r["cost"] is not None]
+        return {
+            "plans": len(rows),
+            "makespan": _percentiles(makespans) if makespans else None,
+            "cost": _percentiles(costs) if costs else None,
+        }
+
+    def resource_usage(self, session=None):
+        """Busy minutes per resource (quantity x duration), summed over the stored plans."""
+        where, params = ("WHERE p.session = ?", [session]) if session is not None else ("", [])
+        with self.lock:
+            rows = self.db.execute(
+                "SELECT s.name, SUM(u.quantity * r.duration) FROM row_resources u"
+                " JOIN plan_rows r ON r.plan_id = u.plan_id AND r.seq = u.seq"
+                " JOIN resources s ON s.id = u.resource_id JOIN plans p ON p.id = u.plan_id"
+                f" {where} GROUP BY s.name ORDER BY 2 DESC", params).fetchall()
+        return {name: minutes for name, minutes in rows}
+
+    def export_csv(self, plan_id, path):
+        import csv
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "w", newline="", encoding="utf-8-sig") as f:
+            csv.writer(f).writerows(self.table(plan_id))
+        with self.lock, self.db:
+            self.db.execute("UPDATE plans SET csv = ? WHERE id = ?", (path, plan_id))
+        return path
+
+    # -- artifacts, keyed by the plan CSV the exports read --------------------
+
+    def set_artifact(self, plan, kind, path):
+        column = {"owl": "owl", "model": "model"}[kind]
+        with self.lock, self.db:
+            # A new OWL makes the old model stale.
+            extra = ", model = NULL" if kind == "owl" else ""
+            self.db.execute(f"UPDATE plans SET {column} = ?{extra} WHERE csv = ?", (path, plan))
+
+    def _entries(self, where="", params=()):
+        with self.lock:
+            rows = self.db.execute(f"SELECT id, session, csv, owl, model, created FROM plans {where}",
+                                   params).fetchall()
+        return [{"id": r["id"], "session": r["session"], "plan": r["csv"], "owl": r["owl"], "model": r["model"],
+                 "created": r["created"]} for r in rows]
+
+    def _present(self, entry, kind):
+        path = entry.get(kind)
+        return bool(path) and os.path.exists(path)
+
+    def latest(self, needs="plan", session=None):
+        """Newest plan whose `needs` artifact ("plan", "owl" or "model") is on disk. With `session`, plans
+        of that session come first, then plans without an owner: imported CSVs and plans made through the
+        backend CLI. Plans of other sessions, including batch_qa's per-question sessions, are not used."""
+        groups = [("", ())] if session is None else [("WHERE session = ?", (session,)),
+                                                     ("WHERE session IS NULL", ())]
+        for where, params in groups:
+            for entry in self._entries(f"{where} ORDER BY created DESC", params):
+                if needs == "plan" and not self._present(entry, "plan") and entry["plan"]:
+                    # The CSV is an export of the stored rows; write it again if it was removed.
+                    self.export_csv(entry["id"], entry["plan"])
+                if self._present(entry, needs):
+                    return entry
+        return None
+
+    def pending(self):
+        """Plans with a missing OWL or MATLAB model, oldest first."""
+        return [e for e in self._entries("WHERE csv IS NOT NULL ORDER BY created")
+                if self._present(e, "plan") and not (self._present(e, "owl") and self._present(e, "model"))]
+
+    def import_csv_dir(self, plans_dir=PLANS_DIR, mbse_dir=MBSE_DIR, sim_dir=SIM_DIR):
+        """One-time import of plan CSVs (and their exports) saved before the store existed."""
+        if not os.path.isdir(plans_dir):
+            return 0
+        added = 0
+        for name in sorted(os.listdir(plans_dir)):
+            if not (name.startswith("assembly_plan_") and name.endswith(".csv")):
+                continue
+            plan = os.path.join(plans_dir, name)
+            try:
+                plan_id = self.add(read_plan_csv(plan), plan_id=plan_suffix(plan), source="import", csv_path=plan,
+                                   created=os.path.getmtime(plan))
+            except (OSError, ValueError) as e:
+                log.warning("Import plan %s failed: %s", plan, e)
+                continue
+            if plan_id is None:
+                continue
+            added += 1
+            owl = os.path.join(mbse_dir, f"assembly_plan_MBSE_{plan_suffix(plan)}.owl")
+            model = os.path.join(sim_dir, f"assembly_plan_MBSE_{plan_suffix(plan)}.m")
+            if os.path.exists(owl):
+                self.set_artifact(plan, "owl", owl)
+                if os.path.exists(model):
+                    self.set_artifact(plan, "model", model)
+        if added:
+            log.info("Imported %d saved plan CSVs into the plan store", added)
+        return added
+
+    def close(self):
+        with self.lock:
+            self.db.close()
+
+
+if __name__ == "__main__":
+    # Plan distributions: python plan_store.py [session]
+    configure_logging()
+    store = PlanStore()
+    session = sys.argv[1] if len(sys.argv) > 1 else None
+    stats = store.stats(session=session)
+    print(f"{stats['plans']} plans")
+    for name in ("makespan", "cost"):
+        if stats[name]:
+            print(f"  {name:<9} p50 {stats[name]['p50']:>10} p95 {stats[name]['p95']:>10} mean {stats[name]['mean']:>10}")
+    for resource, minutes in list(store.resource_usage(session).items())[:10]:
+        print(f"  {resource:<40} {minutes:>10.0f} min")
@@ -0,0 +1,68 @@
+import re
+
+PHASE3_HEADING = re.compile(r"^\s*(?:#+\s*)?(?:\*\*\s*)?Phase\s*3\b", re.IGNORECASE)
+PHASE4_HEADING = re.compile(r"^\s*(?:#+\s*)?(?:\*\*\s*)?Phase\s*4\b", re.IGNORECASE)
+SEPARATOR_LINE = re.compile(r"^\s*\|?[\s:\-|]+\|?\s*$")
+TOTAL_LINE = re.compile(r"^\s*\|?\s*\**\s*Total", re.IGNORECASE)
+
+
+def split_cells(line):
+    return [c.strip() for c in line.strip().strip("|").split("|")]
+
+
+class Phase3TableParser:
+    """Parses the Phase 3 Markdown table out of a token stream, one completed line at a time."""
+
+    def __init__(self):
+        self.buffer = ""
+        self.state = "search"  # search -> phase3 -> table -> done
+        self.header = None
+        self.rows = []
+
+    def feed(self, token):
+        self.buffer += token
+        if "\n" not in token:
+            return []
+        *lines, self.buffer = self.buffer.split("\n")
+        emitted = []
+        for line in lines:
+            emitted += self._line(line)
+        return emitted
+
+    def close(self):
+        line, self.buffer = self.buffer, ""
+        emitted = self._line(line) if line else []
+        self.state = "done"
+        return emitted
+
+    def _line(self, line):
+        if self.state == "done":
+            return []
+        if self.state == "search":
+            if PHASE3_HEADING.match(line):
+                self.state = "phase3"
+            return []
+        if PHASE4_HEADING.match(line):
+            self.state = "done"
+            return []
+        if not line.strip().startswith("|"):
+            # The first table of the phase ends at its first non-table line.
+            if self.state == "table" and line.strip():
+                self.state = "done"
+            return []
+        self.state = "table"
+        if SEPARATOR_LINE.match(line) or TOTAL_LINE.match(line):
+            return []
+        cells = split_cells(line)
+        if self.header is None:
+            self.header = cells
+            return []
+        cells = (cells + [""] * len(self.header))[:max(len(self.header), len(cells))]
+        self.rows.append(cells)
+        # The header is only emitted together with the first row it describes.
+        return [self.header, cells] if len(self.rows) == 1 else [cells]
+
+    def table(self):
+        if self.header is None or not self.rows:
+            return None
+        return [self.header] + self.rows
@@ -0,0 +1,279 @@
+import csv
+import re
+
+import numpy as np
+
+from scheduler import (
+    PlanRequest, parse_resource_list, op_code, normalize_type,
+    JIG_IN, SETUP, JIG_OUT, AUTO_SETUP, AUTO_TEARDOWN, CLEANUP, INSPECTION, AUTO_DONE, MANUAL_DONE,
+)
+
+# Operations that run once per series; a single earlier occurrence satisfies them as a predecessor.
+SHARED_OPERATIONS = {JIG_IN, SETUP, AUTO_SETUP, CLEANUP, INSPECTION}
+
+COLUMN_PATTERNS = {
+    "order": r"order",
+    "operation": r"operation",
+    "type": r"type",
+    "resources": r"resource",
+    "duration": r"duration",
+    "start": r"start",
+    "end": r"end",
+    "cost": r"cost",
+}
+
+CHECK_LABELS = [
+    ("quarters_completed", "Completed {quarters} joints of 1/4 body"),
+    ("constraints", "Meets all constraints"),
+    ("shared_operations", "Shared operations correctly positioned"),
+    ("resource_capacity", "The required resources at the current moment do not exceed the total number of resources"),
+]
+
+
+def _to_float(text):
+    m = re.search(r"[-+]?\d+(?:\.\d+)?", str(text).replace(",", ""))
+    return float(m.group()) if m else np.nan
+
+
+def _column_index(header):
+    index = {}
+    for key, pattern in COLUMN_PATTERNS.items():
+        for i, name in enumerate(header):
+            if re.search(pattern, name, re.IGNORECASE) and i not in index.values():
+                index[key] = i
+                break
+    return index
+
+
+def read_plan_csv(path):
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        return [row for row in csv.reader(f) if row]
+
+
+class PlanValidator:
+    def __init__(self, problem, request=None, tolerance=0.05):
+        self.problem = problem
+        self.request = request or PlanRequest()
+        self.tolerance = tolerance
+        self.resource_names = list(problem.resources)
+        self.resource_index = {name: i for i, name in enumerate(self.resource_names)}
+        self.capacity = np.array([problem.resources[n].quantity for n in self.resource_names], dtype=float)
+        self.rates = np.array([problem.resources[n].cost_hour for n in self.resource_names], dtype=float)
+        self.manual_chain = set(problem.chain(MANUAL_DONE))
+        self.auto_chain = set(problem.chain(AUTO_DONE, exclude={AUTO_SETUP}))
+
+    def parse(self, rows):
+        header, body = rows[0], [r for r in rows[1:] if any(str(c).strip() for c in r)]
+        col = _column_index(header)
+        n = len(body)
+        cell = lambda r, key: r[col[key]] if key in col and col[key] < len(r) else ""
+        plan = {
+            "order": [str(cell(r, "order")).strip() for r in body],
+            "codes": [op_code(cell(r, "operation")) for r in body],
+            "auto": np.array([normalize_type(cell(r, "type")) == "Automatic" for r in body], dtype=bool),
+            "start": np.array([_to_float(cell(r, "start")) for r in body], dtype=float),
+            "end": np.array([_to_float(cell(r, "end")) for r in body], dtype=float),
+            "duration": np.array([_to_float(cell(r, "duration")) for r in body], dtype=float),
+            "cost": np.array([_to_float(cell(r, "cost")) for r in body], dtype=float),
+            "usage": np.zeros((n, len(self.resource_names)), dtype=float),
+            "unknown": [],
+        }
+        for i, r in enumerate(body):
+            for name, qty in parse_resource_list(cell(r, "resources")).items():
+                j = self.resource_index.get(name.lower())
+                if j is None:
+                    plan["unknown"].append((i, name))
+                else:
+                    plan["usage"][i, j] += qty
+        return plan
+
+    def validate(self, rows):
+        plan = self.parse(rows)
+        violations = []
+        checks = {}
+        add = lambda check, i, message: violations.append(
+            {"check": check, "order": plan["order"][i] if i is not None else None, "message": message})
+
+        checks["quarters_completed"] = self._check_quarters(plan, add)
+        checks["precedence"] = self._check_precedence(plan, add)
+        checks["resource_capacity"], peak = self._check_capacity(plan, add)
+        checks["automatic_serial"], checks["manual_auto_exclusive"], checks["manual_parallel"] = \
+            self._check_exclusivity(plan, add)
+        checks["shared_operations"] = self._check_shared(plan, add)
+        checks["durations"], checks["cost"], recomputed_cost = self._check_durations_and_cost(plan, add)
+        checks["constraints"] = all(checks[k] for k in (
+            "precedence", "automatic_serial", "manual_auto_exclusive", "manual_parallel"))
+
+        makespan = float(np.nanmax(plan["end"]) - np.nanmin(plan["start"])) if len(plan["codes"]) else 0.0
+        return {
+            "valid": not violations,
+            "checks": checks,
+            "violations": violations,
+            "makespan": makespan,
+            "cost": round(float(np.nansum(plan["cost"])), 2),
+            "recomputed_cost": recomputed_cost,
+            "peak_usage": {self.problem.resources[n].name: float(p) for n, p in zip(self.resource_names, peak)},
+        }
+
+    def validate_many(self, plans):
+        return [self.validate(rows) for rows in plans]
+
+    def _check_quarters(self, plan, add):
+        done = sum(1 for c in plan["codes"] if c in (AUTO_DONE, MANUAL_DONE))
+        if done != self.request.quarters:
+            add("quarters_completed", None, f"{done} quarter joints completed, expected {self.request.quarters}")
+            return False
+        return True
+
+    def _check_precedence(self, plan, add):
+        ok = True
+        codes = np.array(plan["codes"], dtype=object)
+        for code in dict.fromkeys(plan["codes"]):
+            op = self.problem.operations.get(code)
+            if op is None:
+                continue
+            rows = np.flatnonzero(codes == code)
+            rows = rows[np.argsort(plan["start"][rows], kind="stable")]
+            for pred in op.predecessors:
+                pred_code = op_code(pred)
+                pred_ends = np.sort(plan["end"][codes == pred_code])
+                done = np.searchsorted(pred_ends, plan["start"][rows], side="right")
+                needed = np.ones(len(rows)) if pred_code in SHARED_OPERATIONS else np.arange(1, len(rows) + 1)
+                for i in rows[done < needed]:
+                    ok = False
+                    add("precedence", i, f"{code} starts before its predecessor {pred_code} has completed")
+        return ok
+
+    def _check_capacity(self, plan, add):
+        n = len(plan["codes"])
+        if not n:
+            return True, np.zeros(len(self.resource_names))
+        times = np.concatenate([plan["end"], plan["start"]])
+        # Releases sort before acquisitions at the same instant.
+        kinds = np.concatenate([np.zeros(n), np.ones(n)])
+        deltas = np.concatenate([-plan["usage"], plan["usage"]])
+        order = np.lexsort((kinds, times))
+        level = np.cumsum(deltas[order], axis=0)
+        peak = level.max(axis=0)
+        ok = True
+        for j in np.flatnonzero(peak > self.capacity):
+            ok = False
+            over = order[np.flatnonzero(level[:, j] > self.capacity[j])[0]] % n
+            add("resource_capacity", over,
+                f"{self.problem.resources[self.resource_names[j]].name} needs {peak[j]:g}, "
+                f"only {self.capacity[j]:g} available")
+        return ok, peak
+
+    def _check_exclusivity(self, plan, add):
+        start, end, auto = plan["start"], plan["end"], plan["auto"]
+        overlap = (np.maximum(start[:, None], start[None, :]) < np.minimum(end[:, None], end[None, :]))
+        np.fill_diagonal(overlap, False)
+        codes = np.array(plan["codes"], dtype=object)
+        same_op = codes[:, None] == codes[None, :]
+
+        auto_pairs = np.argwhere(np.triu(overlap & auto[:, None] & auto[None, :]))
+        for i, j in auto_pairs:
+            add("automatic_serial", j, f"automatic operations {codes[i]} and {codes[j]} overlap")
+
+        mixed_pairs = np.argwhere(overlap & ~auto[:, None] & auto[None, :])
+        for i, j in mixed_pairs:
+            add("manual_auto_exclusive", i, f"manual {codes[i]} runs in parallel with automatic {codes[j]}")
+
+        manual = ~auto
+        different = np.argwhere(np.triu(overlap & manual[:, None] & manual[None, :] & ~same_op))
+        for i, j in different:
+            add("manual_parallel", j, f"different manual operations {codes[i]} and {codes[j]} run in parallel")
+        concurrency = (overlap & manual[:, None] & manual[None, :]).sum(axis=1) + 1
+        too_many = np.flatnonzero(manual & (concurrency > self.request.max_manual_parallel))
+        for i in too_many:
+            add("manual_parallel", i, f"more than {self.request.max_manual_parallel} manual operations in parallel")
+        return not len(auto_pairs), not len(mixed_pairs), not len(different) and not len(too_many)
+
+    def _check_shared(self, plan, add):
+        if not plan["codes"]:
+            return False
+        first_rows, steps = {}, []
+        for i in np.argsort(plan["start"], kind="stable"):
+            step = re.sub(r"[a-zA-Z]+$", "", plan["order"][i]) or str(i)
+            if step not in first_rows:
+                first_rows[step] = i
+                steps.append(plan["codes"][i])
+        rows = list(first_rows.values())
+        ok = True
+
+        def fail(pos, message):
+            nonlocal ok
+            ok = False
+            add("shared_operations", rows[pos] if pos is not None and pos < len(rows) else None, message)
+
+        for code in (JIG_IN, SETUP, JIG_OUT):
+            if plan["codes"].count(code) != 1:
+                fail(None, f"{code} must be executed exactly once")
+        if steps[0] != JIG_IN:
+            fail(0, f"the first operation must be {JIG_IN}")
+        if len(steps) < 2 or steps[1] != SETUP:
+            fail(1, f"the second operation must be {SETUP}")
+        if steps[-1] != JIG_OUT:
+            fail(len(steps) - 1, f"the last operation must be {JIG_OUT}")
+
+        for pos, code in enumerate(steps):
+            follows = steps[pos + 1:pos + 3]
+            if code == AUTO_TEARDOWN and follows != [CLEANUP, INSPECTION]:
+                fail(pos, f"{AUTO_TEARDOWN} must be followed by {CLEANUP} then {INSPECTION}")
+            if code == MANUAL_DONE and (pos + 1 >= len(steps) or steps[pos + 1] not in self.manual_chain) \
+                    and follows != [CLEANUP, INSPECTION]:
+                fail(pos, f"the final {MANUAL_DONE} must be followed by {CLEANUP} then {INSPECTION}")
+
+        in_series = False
+        for pos, code in enumerate(steps):
+            if code == AUTO_SETUP:
+                if in_series:
+                    fail(pos, f"{AUTO_SETUP} repeated inside an automatic series")
+                in_series = True
+            elif code in self.auto_chain and not in_series:
+                fail(pos, f"automatic series must start with {AUTO_SETUP}")
+            elif code == AUTO_TEARDOWN:
+                if not in_series:
+                    fail(pos, f"{AUTO_TEARDOWN} without a preceding {AUTO_SETUP}")
+                in_series = False
+            elif code not in self.auto_chain and in_series:
+                fail(pos, f"automatic series must end with {AUTO_TEARDOWN}")
+                in_series = False
+        if in_series:
+            fail(len(steps) - 1, f"automatic series must end with {AUTO_TEARDOWN}")
+        return ok
+
+    def _check_durations_and_cost(self, plan, add):
+        expected = np.array([self.problem.operations[c].duration if c in self.problem.operations else np.nan
+                             for c in plan["codes"]], dtype=float)
+        tol = self.tolerance
+        bad_duration = np.flatnonzero(~np.isnan(expected) & (np.abs(plan["duration"] - expected) > tol))
+        for i in bad_duration:
+            add("durations", i, f"{plan['codes'][i]} lasts {expected[i]:g} min, not {plan['duration'][i]:g}")
+        bad_span = np.flatnonzero(np.abs((plan["end"] - plan["start"]) - plan["duration"]) > tol)
+        for i in bad_span:
+            add("durations", i, f"{plan['codes'][i]} end - start does not equal its duration")
+        for i, name in plan["unknown"]:
+            add("cost", i, f"unknown resource {name}")
+
+        recomputed = np.where(np.isnan(expected), plan["duration"], expected) / 60 * (plan["usage"] @ self.rates)
+        bad_cost = np.flatnonzero(np.abs(recomputed - plan["cost"]) > max(tol, 0.01) + 0.005)
+        for i in bad_cost:
+            add("cost", i, f"{plan['codes'][i]} costs {recomputed[i]:.2f} €, not {plan['cost'][i]:g}")
+        duration_ok = not len(bad_duration) and not len(bad_span)
+        cost_ok = not len(bad_cost) and not plan["unknown"]
+        return duration_ok, cost_ok, round(float(recomputed.sum()), 2)
+
+
+def format_report(report, quarters=4):
+    lines = ["**Validation Report (computed):**"]
+    for key, label in CHECK_LABELS:
+        lines.append(f"▪ [{'✓' if report['checks'].get(key) else '✗'}] {label.format(quarters=quarters)}")
+    lines.append(f"▪ Due time: {report['makespan']:g} min; reported cost: {report['cost']:g} €; "
+                 f"recomputed cost: {report['recomputed_cost']:g} €")
+    for violation in report["violations"][:10]:
+        order = f"[{violation['order']}] " if violation["order"] else ""
+        lines.append(f"  ✗ {order}{violation['message']}")
+    if len(report["violations"]) > 10:
+        lines.append(f"  ... {len(report['violations']) - 10} more violations")
+    return "\n".join(lines)
@@ -0,0 +1,261 @@
+import hashlib
+import json
+from collections import OrderedDict
+from functools import lru_cache
+
+from kg_engine import CypherParser, CypherError
+
+# Column roles of a query result:
+#   node  - a node map, e.g. RETURN o
+#   rel   - a relationship (start, type, end) tuple, e.g. RETURN r
+#   path  - an alternating [node, type, node, ...] list, e.g. RETURN p
+#   key   - a scalar that identifies a node, e.g. o.name AS Operation
+#   label - a scalar that names the edge between the row's nodes, e.g. type(r)
+#   attr  - any other scalar; shown on the node of the same variable (or the row's first node)
+NODE_COLOR = "#97c2fc"
+TARGET_COLOR = "#fc9797"
+EDGE_COLOR = "#666666"
+IDENTITY_KEY = "name"
+
+
+def node_id(props, label=None):
+    # Nameless nodes get an id derived from their properties, so the same result always renders the same graph.
+    name = props.get(IDENTITY_KEY)
+    if name is not None:
+        return str(name)
+    payload = json.dumps(props, sort_keys=True, default=str, separators=(",", ":"))
+    return f"{label or 'node'}:{hashlib.sha1(payload.encode('utf-8')).hexdigest()[:12]}"
+
+
+def attribute_label(props):
+    name = props.get(IDENTITY_KEY, "Node")
+    attrs = "\n".join(f"{k}: {v}" for k, v in props.items() if k != IDENTITY_KEY)
+    return f"{name}\n{attrs}" if attrs else str(name)
+
+
+def identity_keys(structured_schema):
+    """Label -> property that names its nodes, from the KG property schema."""
+    keys = {}
+    for label, props in (structured_schema or {}).get("node_props", {}).items():
+        names = [p["property"] for p in props]
+        if IDENTITY_KEY in names:
+            keys[label] = IDENTITY_KEY
+        elif names:
+            keys[label] = names[0]
+    return keys
+
+
+class Column:
+    __slots__ = ("name", "role", "var", "label")
+
+    def __init__(self, name, role, var=None, label=None):
+        self.name = name
+        self.role = role
+        self.var = var
+        self.label = label
+
+    def __repr__(self):
+        return f"Column({self.name!r}, {self.role!r}, var={self.var!r}, label={self.label!r})"
+
+
+def _pattern_variables(clauses):
+    nodes, rels, paths = {}, set(), set()
+    for clause in clauses:
+        if clause[0] != "match":
+            continue
+        for path_var, elems in clause[2]:
+            if path_var:
+                paths.add(path_var)
+            for index, elem in enumerate(elems):
+                if not elem[0]:
+                    continue
+                if index % 2:
+                    rels.add(elem[0])
+                else:
+                    labels = nodes.setdefault(elem[0], ())
+                    nodes[elem[0]] = labels or elem[1]
+    return nodes, rels, paths
+
+
+@lru_cache(maxsize=256)
+def _return_columns(cypher, keys):
+    clauses = CypherParser(cypher).parse()
+    returns = [c for c in clauses if c[0] == "return"]
+    if not returns or returns[-1][2]:  # no RETURN, or RETURN *
+        return None
+    nodes, rels, paths = _pattern_variables(clauses)
+    keys = dict(keys)
+    columns = []
+    for expr, alias, _ in returns[-1][3]:
+        kind = expr[0]
+        if kind == "var":
+            var = expr[1]
+            role = "rel" if var in rels else "path" if var in paths else "node"
+            label = nodes.get(var, ())[:1]
+            columns.append(Column(alias, role, var, label[0] if label else None))
+        elif kind == "prop" and expr[1][0] == "var":
+            var, prop = expr[1][1], expr[2]
+            if var in rels:
+                columns.append(Column(alias, "label", var))
+                continue
+            label = (nodes.get(var) or (None,))[0]
+            role = "key" if prop == keys.get(label, IDENTITY_KEY) else "attr"
+            columns.append(Column(alias, role, var, label))
+        elif kind == "call" and expr[1].lower() == "type":
+            columns.append(Column(alias, "label"))
+        else:
+            columns.append(Column(alias, "attr"))
+    return tuple(columns)
+
+
+class ResultSchema:
+    """Roles of the result columns, read from the query's RETURN clause when there is one."""
+
+    def __init__(self, columns=None):
+        self.columns = OrderedDict((c.name, c) for c in columns or ())
+
+    @classmethod
+    def from_cypher(cls, cypher, structured_schema=None):
+        if not cypher:
+            return cls()
+        keys = tuple(sorted(identity_keys(structured_schema).items()))
+        try:
+            return cls(_return_columns(cypher, keys))
+        except CypherError:
+            return cls()
+
+    def column(self, name, value):
+        # Columns the RETURN clause does not describe are inferred from their first non-null value,
+        # following the old positional convention: two node columns, then an edge label, then attributes.
+        column = self.columns.get(name)
+        if column is None:
+            if isinstance(value, dict):
+                role = "node"
+            elif isinstance(value, tuple) and len(value) == 3:
+                role = "rel"
+            elif isinstance(value, list):
+                role = "path"
+            else:
+                roles = [c.role for c in self.columns.values()]
+                entities = sum(r in ("node", "key") for r in roles)
+                role = "key" if entities < 2 else "label" if "label" not in roles else "attr"
+            column = self.columns[name] = Column(name, role)
+        return column
+
+
+class ResultConverter:
+    """Turns query rows into nodes and edges in one pass over the rows."""
+
+    def __init__(self, schema=None):
+        self.schema = schema or ResultSchema()
+        self.nodes = OrderedDict()
+        self.attrs = {}
+        self.edges = OrderedDict()
+
+    def _node(self, props, label=None, color=NODE_COLOR):
+        nid = node_id(props, label)
+        if nid not in self.nodes:
+            self.nodes[nid] = {"label": attribute_label(props), "color": color, "shape": "box"}
+        return nid
+
+    def _key(self, value, color):
+        nid = str(value)
+        if nid not in self.nodes:
+            self.nodes[nid] = {"label": nid, "color": color, "shape": "box"}
+        return nid
+
+    def _edge(self, source, target, label=""):
+        self.edges.setdefault((source, target, label), None)
+
+    def add_row(self, row):
+        if not isinstance(row, dict):
+            if isinstance(row, (tuple, list)):
+                row = {str(i): v for i, v in enumerate(row)}
+            else:
+                return
+        entities, by_var, attrs, labels = [], {}, [], []
+        linked = False
+        for name, value in row.items():
+            if value is None:
+                continue
+            column = self.schema.column(name, value)
+            # The value's own shape wins over the column role, so mixed-shape rows still convert.
+            if isinstance(value, dict):
+                nid = self._node(value, column.label, TARGET_COLOR if entities else NODE_COLOR)
+                entities.append(nid)
+                by_var[column.var or name] = nid
+            elif isinstance(value, tuple) and len(value) == 3 and isinstance(value[1], str):
+                start, rel_type, end = value
+                self._edge(self._node(start), self._node(end), rel_type)
+                linked = True
+            elif isinstance(value, list) and any(isinstance(item, (dict, tuple)) for item in value):
+                linked |= self._add_path(value)
+            elif column.role in ("key", "node") and not isinstance(value, list):
+                nid = self._key(value, TARGET_COLOR if entities else NODE_COLOR)
+                entities.append(nid)
+                if column.var:
+                    by_var[column.var] = nid
+            elif column.role == "label":
+                labels.append(str(value))
+            else:
+                attrs.append((column, value))
+
+        if not entities and not linked and attrs:
+            # Grouping rows such as RETURN o.op_type, count(o) still get a node for their first value.
+            column, value = attrs.pop(0)
+            entities.append(self._key(value, NODE_COLOR))
+        for column, value in attrs:
+            target = by_var.get(column.var) or (entities[0] if entities else None)
+            if target is not None:
+                self.attrs.setdefault(target, OrderedDict())[column.name] = value
+        if not linked and len(entities) > 1:
+            label = " / ".join(labels)
+            for target in entities[1:]:
+                if target != entities[0]:
+                    self._edge(entities[0], target, label)
+
+    def _add_path(self, items):
+        previous, rel_type, linked = None, "", False
+        for item in items:
+            if isinstance(item, dict):
+                nid = self._node(item)
+                if previous is not None:
+                    self._edge(previous, nid, rel_type)
+                    linked = True
+                previous, rel_type = nid, ""
+            elif isinstance(item, str):
+                rel_type = item
+            elif isinstance(item, tuple) and len(item) == 3:
+                self._edge(self._node(item[0]), self._node(item[2]), item[1])
+                linked = True
+        return linked
+
+    def convert(self, rows):
+        for row in rows or ():
+            self.add_row(row)
+        return self
+
+    def node_label(self, nid):
+        label = self.nodes[nid]["label"]
+        extra = self.attrs.get(nid)
+        if extra:
+            label += "\n" + "\n".join(f"{k}: {v}" for k, v in extra.items())
+        return label
+
+    def edge_types(self):
+        return {label for _, _, label in self.edges if label}
+
+    def populate(self, net):
+        """Adds the converted graph to a pyvis `Network` or a `GraphBuilder`."""
+        for nid, node in self.nodes.items():
+            net.add_node(nid, label=self.node_label(nid), color=node["color"], shape=node["shape"])
+        for source, target, label in self.edges:
+            if label:
+                net.add_edge(source, target, label=label, color=EDGE_COLOR)
+            else:
+                net.add_edge(source, target, color=EDGE_COLOR)
+        return net
+
+
+def convert_result(rows, cypher=None, structured_schema=None):
+    return ResultConverter(ResultSchema.from_cypher(cypher, structured_schema)).convert(rows)
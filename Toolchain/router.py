@@ -0,0 +1,237 @@
+import glob
+import hashlib
+import json
+import math
+import os
+import re
+import threading
+import time
+from collections import Counter
+
+from tracing import get_logger
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+QA_RECORDS_DIR = os.path.join(current_dir, os.pardir, "Q&A_records")
+ROUTER_CACHE_PATH = os.path.join(current_dir, "cache", "router_model.json")
+
+ROUTER_THRESHOLD = float(os.getenv("ROUTER_THRESHOLD", "0.9"))
+
+log = get_logger("router")
+
+# Domain terms taken from the classification rules of `router_prompt`.
+GRAPH_PATTERNS = [
+    r"^\s*(list|search|show|find|query|retrieve|get|give me|which|what|who|how many|count)\b",
+    r"\b(process(es)?|sub-?process(es)?|operations?|resources?|required resources?|predecessors?)\b",
+    r"\b(relationships?|information|properties|names? of)\b",
+]
+DESIGN_PATTERNS = [
+    r"\b(design|plan|planning|schedul\w*|optimi[sz]\w*|synthes\w*)\b",
+    r"\b(generate|create|build|propose)\b.*\b(plan|schedule|sequence)\b",
+    r"\b(joint plan|assembly plan|four 1/4 bod(y|ies)|constraints?)\b",
+]
+
+# Seed questions for the graph route: the example buttons in app.py and
+# paraphrases of the retrieval terms listed in `router_prompt`.
+GRAPH_SEED_QUESTIONS = [
+    "List all information of processes and their sub-processes.",
+    "List all information of operations.",
+    "List all information of resources.",
+    "Search all relationships between operations and resources. List all names of operations, "
+    "names of resources, and number of need resources. Merge information according to the operation.",
+    "List all predecessors of each operation.",
+    "Which resources are required by the operation?",
+    "What is the duration of each operation?",
+    "Show the sub-processes of the upper orbital joint process.",
+    "How many mechanical operators are available?",
+    "What is the cost per hour of each resource?",
+    "Which operations are manual and which are automatic?",
+    "Find the predecessor of the inspection operation.",
+    "List the required resources and their number for each operation.",
+]
+
+
+def _tokenize(text):
+    words = re.findall(r"[a-z0-9]+(?:/[0-9]+)?", text.lower())
+    return words + [f"{a}_{b}" for a, b in zip(words, words[1:])]
+
+
+def _rule_scores(question):
+    text = question.lower()
+    graph_hits = sum(1 for p in GRAPH_PATTERNS if re.search(p, text))
+    design_hits = sum(1 for p in DESIGN_PATTERNS if re.search(p, text))
+    return graph_hits, design_hits
+
+
+def _load_training_corpus():
+    samples = [(q, "graph") for q in GRAPH_SEED_QUESTIONS]
+    for path in sorted(glob.glob(os.path.join(QA_RECORDS_DIR, "Case_*", "*rompt*.txt"))):
+        with open(path, encoding="utf-8", errors="ignore") as f:
+            samples.append((f.read(), "design"))
+    return samples
+
+
+def _corpus_fingerprint(samples):
+    h = hashlib.sha1()
+    for text, label in samples:
+        h.update(label.encode())
+        h.update(text.encode("utf-8", errors="ignore"))
+    return h.hexdigest()
+
+
+class NaiveBayesRouter:
+    def __init__(self):
+        self.labels = ("graph", "design")
+        self.doc_counts = Counter()
+        self.word_counts = {label: Counter() for label in self.labels}
+        self.fingerprint = None
+
+    def fit(self, samples):
+        for text, label in samples:
+            self.learn(text, label)
+        return self
+
+    def learn(self, text, label):
+        if label not in self.labels:
+            return
+        self.doc_counts[label] += 1
+        self.word_counts[label].update(_tokenize(text))
+
+    def predict(self, text):
+        vocab = set(self.word_counts["graph"]) | set(self.word_counts["design"])
+        tokens = [tok for tok in _tokenize(text) if tok in vocab]
+        total_docs = sum(self.doc_counts.values())
+        if not tokens or not total_docs:
+            return "graph", 0.0
+        log_probs = {}
+        for label in self.labels:
+            counts = self.word_counts[label]
+            denom = sum(counts.values()) + len(vocab)
+            lp = math.log((self.doc_counts[label] + 1) / (total_docs + len(self.labels)))
+            for tok in tokens:
+                lp += math.log((counts[tok] + 1) / denom)
+            log_probs[label] = lp
+        best = max(log_probs, key=log_probs.get)
+        norm = max(log_probs.values())
+        z = sum(math.exp(v - norm) for v in log_probs.values())
+        return best, math.exp(log_probs[best] - norm) / z
+
+    def to_dict(self):
+        return {
+            "fingerprint": self.fingerprint,
+            "doc_counts": dict(self.doc_counts),
+            "word_counts": {k: dict(v) for k, v in self.word_counts.items()},
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        model = cls()
+        model.fingerprint = data.get("fingerprint")
+        model.doc_counts = Counter(data.get("doc_counts", {}))
+        for label in model.labels:
+            model.word_counts[label] = Counter(data.get("word_counts", {}).get(label, {}))
+        return model
+
+
+def load_router_model(cache_path=ROUTER_CACHE_PATH):
+    samples = _load_training_corpus()
+    fingerprint = _corpus_fingerprint(samples)
+    if os.path.exists(cache_path):
+        try:
+            with open(cache_path, encoding="utf-8") as f:
+                model = NaiveBayesRouter.from_dict(json.load(f))
+            if model.fingerprint == fingerprint:
+                return model
+        except (OSError, ValueError):
+            pass
+    model = NaiveBayesRouter().fit(samples)
+    model.fingerprint = fingerprint
+    save_router_model(model, cache_path)
+    return model
+
+
+def save_router_model(model, cache_path=ROUTER_CACHE_PATH):
+    try:
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        with open(cache_path, "w", encoding="utf-8") as f:
+            json.dump(model.to_dict(), f)
+    except OSError as e:
+        log.warning("Save router model failed: %s", e)
+
+
+class LocalRouter:
+    def __init__(self, model=None, threshold=ROUTER_THRESHOLD):
+        self.model = model or load_router_model()
+        self.threshold = threshold
+        self.lock = threading.Lock()
+        self.counts = Counter()
+        self.local_seconds = 0.0
+        self.llm_seconds = 0.0
+
+    def classify(self, question):
+        graph_hits, design_hits = _rule_scores(question)
+        if design_hits and not graph_hits:
+            return "design", "rule"
+        if graph_hits and not design_hits:
+            return "graph", "rule"
+        # Fallbacks teach the model under the same lock; predicting while it learns would iterate
+        # Counters that are growing.
+        with self.lock:
+            label, confidence = self.model.predict(question)
+        if confidence >= self.threshold:
+            return label, "model"
+        return None, "fallback"
+
+    def _local(self, question, trace):
+        start = time.perf_counter()
+        label, source = self.classify(question)
+        elapsed = time.perf_counter() - start
+        if label:
+            with self.lock:
+                self.counts[source] += 1
+                self.local_seconds += elapsed
+            if trace:
+                trace.caches["router"] = source
+        return label
+
+    def _record_fallback(self, question, label, elapsed, trace):
+        if trace:
+            trace.caches["router"] = "fallback"
+        with self.lock:
+            self.counts["fallback"] += 1
+            self.llm_seconds += elapsed
+            if label in self.model.labels:
+                self.model.learn(question, label)
+
+    def route(self, question, fallback, trace=None):
+        label = self._local(question, trace)
+        if label:
+            return label
+        start = time.perf_counter()
+        label = fallback(question)
+        self._record_fallback(question, label, time.perf_counter() - start, trace)
+        return label
+
+    async def aroute(self, question, fallback, trace=None):
+        label = self._local(question, trace)
+        if label:
+            return label
+        start = time.perf_counter()
+        label = await fallback(question)
+        self._record_fallback(question, label, time.perf_counter() - start, trace)
+        return label
+
+    def stats(self):
+        with self.lock:
+            local_hits = self.counts["rule"] + self.counts["model"]
+            total = local_hits + self.counts["fallback"]
+            avg_llm = self.llm_seconds / self.counts["fallback"] if self.counts["fallback"] else None
+            return {
+                "requests": total,
+                "rule_hits": self.counts["rule"],
+                "model_hits": self.counts["model"],
+                "fallbacks": self.counts["fallback"],
+                "hit_rate": local_hits / total if total else 0.0,
+                "avg_local_ms": 1000 * self.local_seconds / local_hits if local_hits else 0.0,
+                "avg_llm_ms": 1000 * avg_llm if avg_llm is not None else None,
+                "saved_seconds": local_hits * avg_llm - self.local_seconds if avg_llm is not None else None,
+            }
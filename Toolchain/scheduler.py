@@ -0,0 +1,297 @@
+import csv
+import os
+import re
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+CASE_STUDY_DIR = os.path.join(current_dir, os.pardir, "Case_study")
+OPERATION_CSV_PATH = os.path.join(CASE_STUDY_DIR, "operation_information_table.csv")
+RESOURCE_CSV_PATH = os.path.join(CASE_STUDY_DIR, "Resource_information_table.csv")
+
+PLAN_HEADER = ["Order", "Operation", "Type", "Required Resources", "Duration (min)",
+               "Start Time (min)", "End Time (min)", "Cost (€)"]
+
+# Operation codes named in the nine plan constraints of the `plan_btn` prompt.
+JIG_IN = "S40_00001"
+SETUP = "S40_01001"
+JIG_OUT = "S40_00002"
+AUTO_SETUP = "S40_02001"
+AUTO_TEARDOWN = "S40_04014"
+CLEANUP = "S40_02002"
+INSPECTION = "S40_02003"
+AUTO_DONE = "S40_04012"
+MANUAL_DONE = "S40_04013"
+
+NUMBER_WORDS = {"one": 1, "two": 2, "three": 3, "four": 4, "five": 5, "six": 6}
+
+
+def op_code(name):
+    m = re.search(r"(S\d+_\d+)", name or "")
+    return m.group(1) if m else (name or "").strip()
+
+
+def normalize_type(op_type):
+    return "Automatic" if str(op_type).strip().lower().startswith("auto") else "Manual"
+
+
+@dataclass
+class Resource:
+    name: str
+    cost_hour: float
+    quantity: int
+    calendar: str = ""
+
+
+@dataclass
+class Operation:
+    name: str
+    op_type: str
+    duration: float
+    resources: Dict[str, int] = field(default_factory=dict)
+    predecessors: List[str] = field(default_factory=list)
+
+    @property
+    def code(self):
+        return op_code(self.name)
+
+
+@dataclass
+class PlanRequest:
+    quarters: int = 4
+    max_manual_parallel: int = 2
+    require_auto: bool = True
+    require_manual: bool = True
+
+
+class PlanProblem:
+    def __init__(self, operations, resources):
+        self.operations = OrderedDict((op.code, op) for op in operations)
+        self.resources = OrderedDict((res.name.lower(), res) for res in resources)
+
+    def resource(self, name):
+        return self.resources.get(name.lower())
+
+    def hourly_rate(self, op):
+        return sum(qty * self.resource(name).cost_hour for name, qty in op.resources.items()
+                   if self.resource(name))
+
+    def cost(self, op):
+        return op.duration / 60 * self.hourly_rate(op)
+
+    def fits(self, op, copies=1):
+        for name, qty in op.resources.items():
+            res = self.resource(name)
+            if res is not None and qty * copies > res.quantity:
+                return False
+        return True
+
+    def chain(self, done_code, exclude=()):
+        # Ancestors of a completion operation along hasPredecessors, in execution order.
+        ordered, seen = [], set()
+
+        def visit(code):
+            if code in seen or code in exclude or code not in self.operations:
+                return
+            seen.add(code)
+            for pred in self.operations[code].predecessors:
+                visit(op_code(pred))
+            ordered.append(code)
+
+        visit(done_code)
+        return ordered
+
+
+def _parse_number(text):
+    m = re.search(r"[-+]?\d+(?:[.,]\d+)?", str(text))
+    return float(m.group().replace(",", ".")) if m else 0.0
+
+
+def parse_resource_list(text):
+    resources = OrderedDict()
+    for name, qty in re.findall(r"([^,()]+?)\s*\((\d+)\)", text or ""):
+        resources[name.strip()] = resources.get(name.strip(), 0) + int(qty)
+    return resources
+
+
+def load_problem_from_views(views):
+    resources = [
+        Resource(r["r"]["name"], r["r"].get("cost_hour") or 0, r["r"].get("number") or 0, r["r"].get("calendar", ""))
+        for r in views.get("resources", [])
+    ]
+    requirements, predecessors = {}, {}
+    for row in views.get("requirements", []):
+        requirements.setdefault(row["Operation"], OrderedDict())[row["Resource"]] = row["Number"]
+    for row in views.get("predecessors", []):
+        predecessors.setdefault(row["Operation"], []).append(row["Predecessor"])
+    operations = [
+        Operation(o["o"]["name"], normalize_type(o["o"].get("op_type")), o["o"].get("duration") or 0,
+                  requirements.get(o["o"]["name"], OrderedDict()), predecessors.get(o["o"]["name"], []))
+        for o in views.get("operations", [])
+    ]
+    return PlanProblem(operations, resources)
+
+
+def load_problem_from_csv(operation_csv=OPERATION_CSV_PATH, resource_csv=RESOURCE_CSV_PATH, encoding="cp1252"):
+    with open(resource_csv, encoding=encoding, newline="") as f:
+        resources = [
+            Resource(row["Resource name"].strip(), _parse_number(row["Cost"]), int(_parse_number(row["Quantity"])),
+                     row["Calendar"].strip())
+            for row in csv.DictReader(f)
+        ]
+    with open(operation_csv, encoding=encoding, newline="") as f:
+        rows = list(csv.DictReader(f))
+    names = {row["No."].strip(): row["Operation name"].strip() for row in rows}
+    operations = []
+    for row in rows:
+        preds = [names[p.strip()] for p in row["Processor"].split(",") if p.strip() in names]
+        operations.append(Operation(row["Operation name"].strip(), normalize_type(row["Type"]),
+                                    _parse_number(row["Duration"]), parse_resource_list(row["Required resources"]),
+                                    preds))
+    return PlanProblem(operations, resources)
+
+
+def plan_request_from_question(question):
+    text = question.lower()
+    request = PlanRequest()
+    m = re.search(r"\b(\d+|" + "|".join(NUMBER_WORDS) + r")\s+1/4\s+bod", text)
+    if m:
+        request.quarters = int(m.group(1)) if m.group(1).isdigit() else NUMBER_WORDS[m.group(1)]
+    m = re.search(r"at most\s+(\d+|" + "|".join(NUMBER_WORDS) + r")\s+sets? of manual", text)
+    if m:
+        request.max_manual_parallel = int(m.group(1)) if m.group(1).isdigit() else NUMBER_WORDS[m.group(1)]
+    if re.search(r"\b(only|purely)\s+manual|manual(ly)?\s+only", text):
+        request.require_auto, request.require_manual = False, True
+    elif re.search(r"\b(only|purely)\s+automatic|automatic(ally)?\s+only", text):
+        request.require_auto, request.require_manual = True, False
+    elif not re.search(r"both\s+automatic\s+and\s+manual|both\s+manual\s+and\s+automatic", text):
+        request.require_auto = request.require_manual = False
+    return request
+
+
+def _batch_splits(count, max_parallel):
+    # Ordered ways to run `count` manual quarters in batches of at most `max_parallel`.
+    if count == 0:
+        yield ()
+        return
+    for size in range(min(count, max_parallel), 0, -1):
+        for rest in _batch_splits(count - size, max_parallel):
+            yield (size,) + rest
+
+
+class Schedule:
+    def __init__(self, problem, steps, auto_quarters, manual_batches, auto_first):
+        self.problem = problem
+        self.auto_quarters = auto_quarters
+        self.manual_batches = manual_batches
+        self.auto_first = auto_first
+        self.rows = []
+        clock = 0
+        for index, (code, copies) in enumerate(steps, start=1):
+            op = problem.operations[code]
+            end = clock + op.duration
+            resources = ", ".join(f"{name} ({qty})" for name, qty in op.resources.items())
+            for copy in range(copies):
+                self.rows.append({
+                    "Order": f"{index}{chr(ord('a') + copy)}" if copies > 1 else str(index),
+                    "Operation": op.name,
+                    "Type": op.op_type,
+                    "Required Resources": resources,
+                    "Duration (min)": op.duration,
+                    "Start Time (min)": clock,
+                    "End Time (min)": end,
+                    "Cost (€)": round(problem.cost(op), 2),
+                })
+            clock = end
+        self.makespan = clock
+        self.cost = round(sum(row["Cost (€)"] for row in self.rows), 2)
+
+    def table(self):
+        return [PLAN_HEADER] + [[_format_number(row[h]) for h in PLAN_HEADER] for row in self.rows]
+
+    def markdown(self):
+        return plan_markdown(self.table())
+
+    def summary(self):
+        methods = []
+        if self.auto_quarters:
+            methods.append(f"{self.auto_quarters} automatic (in series)")
+        if self.manual_batches:
+            methods.append(f"{sum(self.manual_batches)} manual (batches {'+'.join(map(str, self.manual_batches))})")
+        return (f"Total due time: {_format_number(self.makespan)} min; total cost: {_format_number(self.cost)} €; "
+                f"1/4 bodies: {', '.join(methods)}")
+
+
+def plan_markdown(rows):
+    lines = ["| " + " | ".join(map(str, rows[0])) + " |", "|" + "---|" * len(rows[0])]
+    lines += ["| " + " | ".join(map(str, row)) + " |" for row in rows[1:]]
+    return "\n".join(lines)
+
+
+def _format_number(value):
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+
+class PlanScheduler:
+    def __init__(self, problem):
+        self.problem = problem
+        self.auto_chain = problem.chain(AUTO_DONE, exclude={AUTO_SETUP})
+        self.manual_chain = problem.chain(MANUAL_DONE)
+
+    def _auto_block(self, quarters):
+        if not quarters:
+            return []
+        steps = [(AUTO_SETUP, 1)]
+        for _ in range(quarters):
+            steps += [(code, 1) for code in self.auto_chain]
+        return steps + [(AUTO_TEARDOWN, 1), (CLEANUP, 1), (INSPECTION, 1)]
+
+    def _manual_block(self, batches):
+        if not batches:
+            return []
+        steps = []
+        for size in batches:
+            for code in self.manual_chain:
+                if self.problem.fits(self.problem.operations[code], size):
+                    steps.append((code, size))
+                else:
+                    steps += [(code, 1)] * size
+        return steps + [(CLEANUP, 1), (INSPECTION, 1)]
+
+    def candidates(self, request=None):
+        request = request or PlanRequest()
+        low = 1 if request.require_manual and request.require_auto else 0
+        auto_options = range(low, request.quarters + 1 - low)
+        if request.require_auto and not request.require_manual:
+            auto_options = [request.quarters]
+        elif request.require_manual and not request.require_auto:
+            auto_options = [0]
+        for auto_quarters in auto_options:
+            for batches in _batch_splits(request.quarters - auto_quarters, request.max_manual_parallel):
+                for auto_first in ((True, False) if auto_quarters and batches else (True,)):
+                    blocks = [self._auto_block(auto_quarters), self._manual_block(batches)]
+                    if not auto_first:
+                        blocks.reverse()
+                    steps = [(JIG_IN, 1), (SETUP, 1)] + blocks[0] + blocks[1] + [(JIG_OUT, 1)]
+                    yield Schedule(self.problem, steps, auto_quarters, batches, auto_first)
+
+    def solve(self, request=None):
+        best = None
+        for schedule in self.candidates(request):
+            if best is None or (schedule.makespan, schedule.cost) < (best.makespan, best.cost):
+                best = schedule
+        return best
+
+
+def can_schedule(problem):
+    required = {JIG_IN, SETUP, JIG_OUT, AUTO_SETUP, AUTO_TEARDOWN, CLEANUP, INSPECTION, AUTO_DONE, MANUAL_DONE}
+    return required.issubset(problem.operations)
+
+
+def solve_plan(problem, question="") -> Optional[Schedule]:
+    if not can_schedule(problem):
+        return None
+    return PlanScheduler(problem).solve(plan_request_from_question(question))
@@ -0,0 +1,176 @@
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+
+from cypher_cache import normalize_question, question_tokens
+from tracing import get_logger
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+SCHEMA_SERVICE_PATH = os.path.join(current_dir, "cache", "schema_service.json")
+# SCHEMA_PRUNING=0 sends the whole filtered schema with every Cypher-generation prompt.
+SCHEMA_PRUNING = os.getenv("SCHEMA_PRUNING", "1") == "1"
+
+# Ontology bookkeeping that never helps to answer a question.
+EXCLUDED_SCHEMA_TYPES = [
+    "Class", "Relationship", "_GraphConfig", "SCO_RESTRICTION",
+    "DOMAIN", "RANGE", "isSubClassOf", "isSubPropertyOf", "hasOptionalAutoOperation",
+    "hasOptionalManualOperation"
+]
+
+# Question families: words that select them (singular, lower case), then the labels and
+# relationship types their Cypher needs.
+SCHEMA_FAMILIES = OrderedDict([
+    ("resources", {
+        "words": {"resource", "require", "required", "requirement", "need", "crane", "tooling", "calendar",
+                  "cost", "quantity", "number"},
+        "labels": {"Operation", "Resource"},
+        "relationships": {"requiresResource"},
+    }),
+    ("predecessors", {
+        "words": {"predecessor", "successor", "precede", "before", "after", "sequence", "order"},
+        "labels": {"Operation"},
+        "relationships": {"hasPredecessors"},
+    }),
+    ("processes", {
+        "words": {"process", "subprocess", "sub", "stage", "step"},
+        "labels": {"Process", "Operation"},
+        "relationships": {"hasSubprocess", "hasEssentialOperation"},
+    }),
+    ("operations", {
+        "words": {"operation", "duration", "type", "manual", "automatic", "essential"},
+        "labels": {"Operation", "Process"},
+        "relationships": {"hasEssentialOperation"},
+    }),
+])
+
+log = get_logger("schema")
+
+
+def filter_schema(structured_schema, exclude=EXCLUDED_SCHEMA_TYPES):
+    """The structured schema without excluded labels and relationship types, in a stable order."""
+    excluded = set(exclude)
+    node_props = {label: props for label, props in sorted(structured_schema.get("node_props", {}).items())
+                  if label not in excluded}
+    rel_props = {rel: props for rel, props in sorted(structured_schema.get("rel_props", {}).items())
+                 if rel not in excluded}
+    relationships = sorted(
+        ({"start": r["start"], "type": r["type"], "end": r["end"]}
+         for r in structured_schema.get("relationships", ())
+         if not excluded & {r["start"], r["type"], r["end"]}),
+        key=lambda r: (r["type"], r["start"], r["end"]))
+    return {"node_props": node_props, "rel_props": rel_props, "relationships": relationships}
+
+
+def schema_version(schema):
+    return hashlib.sha1(json.dumps(schema, sort_keys=True, default=str).encode("utf-8")).hexdigest()[:12]
+
+
+def _props(props):
+    return ", ".join(f"{p['property']}: {p['type']}" for p in props)
+
+
+def format_schema(schema, labels=None, relationships=None):
+    """The schema text of GraphCypherQAChain, limited to `labels` and `relationships` when given."""
+    rels = [r for r in schema["relationships"]
+            if relationships is None or (r["type"] in relationships and {r["start"], r["end"]} <= labels)]
+    if labels is not None:
+        labels = labels | {r["start"] for r in rels} | {r["end"] for r in rels}
+    nodes = [f"{label} {{{_props(props)}}}" for label, props in schema["node_props"].items()
+             if labels is None or label in labels]
+    rel_types = {r["type"] for r in rels}
+    rel_props = [f"{rel} {{{_props(props)}}}" for rel, props in schema["rel_props"].items()
+                 if relationships is None or rel in rel_types]
+    return ("Node properties are the following:\n" + ",".join(nodes) +
+            "\nRelationship properties are the following:\n" + ",".join(rel_props) +
+            "\nThe relationships are the following:\n" +
+            ",".join(f"(:{r['start']})-[:{r['type']}]->(:{r['end']})" for r in rels))
+
+
+def question_families(question):
+    normalized = normalize_question(question)
+    tokens = question_tokens(normalized)
+    squashed = normalized.replace(" ", "")
+    families = []
+    for name, family in SCHEMA_FAMILIES.items():
+        # Relationship types written out in the question ("hasPredecessors") select their family too.
+        if tokens & family["words"] or any(rel.lower() in squashed for rel in family["relationships"]):
+            families.append(name)
+    return families
+
+
+class SchemaService:
+    """Filtered KG schema, versioned by content hash, with per-family pruned texts for Cypher prompts.
+
+    The schema is re-read only when the graph fingerprint changes; the pruned texts are rebuilt
+    only when that changes the schema version.
+    """
+
+    def __init__(self, path=SCHEMA_SERVICE_PATH, pruning=SCHEMA_PRUNING):
+        self.path = path
+        self.pruning = pruning
+        self.lock = threading.Lock()
+        self.fingerprint = None
+        self.version = None
+        self.schema = None
+        self.texts = {}
+        self.saved_fingerprint = self.load()
+
+    def load(self):
+        if not self.path or not os.path.exists(self.path):
+            return None
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                return json.load(f).get("fingerprint")
+        except (OSError, ValueError) as e:
+            log.warning("Load schema service state failed: %s", e)
+            return None
+
+    def save(self):
+        if not self.path:
+            return
+        try:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"fingerprint": self.fingerprint, "version": self.version}, f)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            log.warning("Save schema service state failed: %s", e)
+
+    def refresh(self, graph, fingerprint, introspect=None):
+        """Re-reads the schema when `fingerprint` changed. When the graph changed since the schema was
+        last read, `introspect(graph)` re-queries the database and returns the fingerprint after it."""
+        if fingerprint == self.fingerprint and self.schema is not None:
+            return self.version
+        with self.lock:
+            if fingerprint == self.fingerprint and self.schema is not None:
+                return self.version
+            known = self.fingerprint or self.saved_fingerprint
+            if introspect and known and fingerprint != known:
+                fingerprint = introspect(graph) or fingerprint
+            schema = filter_schema(graph.get_structured_schema)
+            version = schema_version(schema)
+            if version != self.version:
+                self.schema, self.version, self.texts = schema, version, {}
+                log.info("KG schema version %s: %d labels, %d relationship patterns", version,
+                         len(schema["node_props"]), len(schema["relationships"]))
+            self.fingerprint = fingerprint
+            self.save()
+            return self.version
+
+    def schema_for(self, question):
+        families = tuple(question_families(question)) if self.pruning else ()
+        text = self.texts.get(families)
+        if text is None:
+            if families:
+                labels = set().union(*(SCHEMA_FAMILIES[f]["labels"] for f in families))
+                rels = set().union(*(SCHEMA_FAMILIES[f]["relationships"] for f in families))
+                text = format_schema(self.schema, labels, rels)
+                if not any(r["type"] in rels for r in self.schema["relationships"]):
+                    text = format_schema(self.schema)  # the families do not fit this graph
+            else:
+                text = format_schema(self.schema)
+            self.texts[families] = text
+        return text
@@ -0,0 +1,132 @@
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from tracing import get_logger
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+GRAPH_SCHEMA_CACHE_PATH = os.path.join(current_dir, "cache", "graph_schema.json")
+GRAPH_SCHEMA_CACHE_TTL = float(os.getenv("GRAPH_SCHEMA_CACHE_TTL", str(24 * 3600)))
+# SERVICES_WARMUP=1 builds the default services in the background when the app starts;
+# a comma-separated list names the services to build instead.
+SERVICES_WARMUP = os.getenv("SERVICES_WARMUP", "0")
+
+log = get_logger("services")
+
+
+class ServiceContainer:
+    """Named clients and chains, each built on first use; construction times form the startup profile."""
+
+    def __init__(self):
+        self._factories = OrderedDict()
+        self._values = {}
+        self._locks = {}
+        self._lock = threading.Lock()
+        self.timings = OrderedDict()
+
+    def provider(self, name, warm=True):
+        def register(factory):
+            self._factories[name] = (factory, warm)
+            return factory
+        return register
+
+    def __contains__(self, name):
+        return name in self._factories
+
+    def __getattr__(self, name):
+        if name.startswith("_") or name not in self._factories:
+            raise AttributeError(name)
+        return self.get(name)
+
+    def get(self, name):
+        try:
+            return self._values[name]
+        except KeyError:
+            pass
+        with self._lock:
+            lock = self._locks.setdefault(name, threading.Lock())
+        with lock:
+            if name not in self._values:
+                start = time.perf_counter()
+                value = self._factories[name][0]()
+                self.timings[name] = time.perf_counter() - start
+                self._values[name] = value
+                log.info("Service %s ready in %.2f s", name, self.timings[name])
+        return self._values[name]
+
+    def ready(self, name):
+        return name in self._values
+
+    def override(self, name, value):
+        # For tests and the benchmark: a fake client instead of the real one.
+        self._values[name] = value
+
+    def reset(self, name=None):
+        for key in [name] if name else list(self._values):
+            self._values.pop(key, None)
+            self.timings.pop(key, None)
+
+    def warm_up(self, names=None):
+        """Builds `names` (default: every service registered with warm=True) and returns the profile."""
+        for name in names or [n for n, (_, warm) in self._factories.items() if warm]:
+            try:
+                self.get(name)
+            except Exception as e:
+                log.warning("Warm-up of %s failed: %s", name, e)
+        return self.profile()
+
+    def warm_up_in_background(self, names=None):
+        thread = threading.Thread(target=self.warm_up, args=(names,), name="services-warmup", daemon=True)
+        thread.start()
+        return thread
+
+    def profile(self):
+        return {name: round(seconds, 3) for name, seconds in self.timings.items()}
+
+
+def _read_schema_cache(path):
+    if path and os.path.exists(path):
+        try:
+            with open(path, encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            log.warning("Load graph schema cache failed: %s", e)
+    return {}
+
+
+def load_graph_schema(graph, key, path=GRAPH_SCHEMA_CACHE_PATH, ttl=GRAPH_SCHEMA_CACHE_TTL):
+    """Sets `graph.schema` / `graph.structured_schema` from the on-disk cache, or introspects the
+    graph once and caches the result under `key`."""
+    entry = _read_schema_cache(path).get(key)
+    if entry and not (ttl and time.time() - entry["created"] > ttl):
+        graph.structured_schema = entry["structured_schema"]
+        graph.schema = entry["schema"]
+        return False
+    graph.refresh_schema()
+    save_graph_schema(graph, key, path)
+    return True
+
+
+def save_graph_schema(graph, key, path=GRAPH_SCHEMA_CACHE_PATH):
+    cache = _read_schema_cache(path)
+    cache[key] = {"structured_schema": graph.structured_schema, "schema": graph.schema, "created": time.time()}
+    if path:
+        try:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(cache, f, ensure_ascii=False, default=str)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            log.warning("Save graph schema cache failed: %s", e)
+
+
+def warmup_names(setting=SERVICES_WARMUP):
+    """None for the default warm-up set, a list of service names, or [] when warm-up is off."""
+    if setting in ("", "0"):
+        return []
+    if setting == "1":
+        return None
+    return [name.strip() for name in setting.split(",") if name.strip()]
@@ -0,0 +1,94 @@
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+
+SESSION_MEMORY_MODE = os.getenv("SESSION_MEMORY_MODE", "transcript").lower()
+SESSION_MEMORY_WINDOW = int(os.getenv("SESSION_MEMORY_WINDOW", "10"))
+SESSION_MEMORY_MAX_SESSIONS = int(os.getenv("SESSION_MEMORY_MAX_SESSIONS", "256"))
+SESSION_MEMORY_TTL = float(os.getenv("SESSION_MEMORY_TTL", str(2 * 3600)))
+# In facts mode earlier answers are cut to this many characters; the tables they carried live in `facts`.
+SESSION_FACT_ANSWER_CHARS = int(os.getenv("SESSION_FACT_ANSWER_CHARS", "300"))
+
+DEFAULT_SESSION = "default"
+
+
+class SessionMemory:
+    """Conversation window of one Gradio session, shaped like ConversationBufferWindowMemory."""
+
+    def __init__(self, window=SESSION_MEMORY_WINDOW, mode=SESSION_MEMORY_MODE):
+        self.mode = mode
+        self.turns = deque(maxlen=window)
+        self.facts = OrderedDict()
+        self.lock = threading.Lock()
+        self.touched = time.time()
+
+    def load_memory_variables(self, inputs=None):
+        with self.lock:
+            if self.mode != "facts":
+                lines = [f"Human: {q}\nAI: {a}" for q, a in self.turns]
+                return {"history": "\n".join(lines)}
+            parts = [f"{key}:\n{value}" for key, value in self.facts.items()]
+            for question, answer in self.turns:
+                if len(answer) > SESSION_FACT_ANSWER_CHARS:
+                    answer = answer[:SESSION_FACT_ANSWER_CHARS] + " ..."
+                parts.append(f"Human: {question}\nAI: {answer}")
+            return {"history": "\n".join(parts)}
+
+    def save_context(self, inputs, outputs, facts=None):
+        with self.lock:
+            self.turns.append((inputs.get("input", ""), outputs.get("output", "")))
+            for key, value in (facts or {}).items():
+                # Newer facts replace older ones under the same key and move to the end.
+                self.facts.pop(key, None)
+                self.facts[key] = value
+
+    def clear(self):
+        with self.lock:
+            self.turns.clear()
+            self.facts.clear()
+
+
+class SessionMemoryStore:
+    def __init__(self, max_sessions=SESSION_MEMORY_MAX_SESSIONS, ttl=SESSION_MEMORY_TTL,
+                 window=SESSION_MEMORY_WINDOW, mode=SESSION_MEMORY_MODE):
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self.window = window
+        self.mode = mode
+        self.lock = threading.Lock()
+        self.sessions = OrderedDict()
+
+    def _evict(self, now):
+        while self.sessions:
+            session_id, memory = next(iter(self.sessions.items()))
+            if len(self.sessions) > self.max_sessions or (self.ttl and now - memory.touched > self.ttl):
+                del self.sessions[session_id]
+            else:
+                break
+
+    def get(self, session_id=None):
+        session_id = session_id or DEFAULT_SESSION
+        now = time.time()
+        with self.lock:
+            memory = self.sessions.get(session_id)
+            if memory is None or (self.ttl and now - memory.touched > self.ttl):
+                memory = self.sessions[session_id] = SessionMemory(self.window, self.mode)
+            memory.touched = now
+            self.sessions.move_to_end(session_id)
+            self._evict(now)
+            return memory
+
+    def clear(self, session_id=None):
+        with self.lock:
+            memory = self.sessions.pop(session_id or DEFAULT_SESSION, None)
+        if memory:
+            memory.clear()
+
+    def stats(self):
+        with self.lock:
+            return {
+                "sessions": len(self.sessions),
+                "mode": self.mode,
+                "turns": sum(len(m.turns) for m in self.sessions.values()),
+            }
@@ -0,0 +1,11 @@
+import os
+import sys
+
+# The Toolchain modules import each other by bare name, as when run from this directory.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Offline: the in-memory graph, no trace file, no network calls for token counting.
+os.environ.setdefault("KG_BACKEND", "memory")
+os.environ.setdefault("OPENAI_API_KEY", "test")
+os.environ.setdefault("TRACE_PATH", "")
+os.environ.setdefault("CONTEXT_TOKEN_COUNT", "chars")
@@ -0,0 +1,44 @@
+from cypher_cache import CypherCache, question_entities
+
+
+def _cache(**kwargs):
+    return CypherCache(path=None, **kwargs)
+
+
+def test_exact_hit_ignores_case_and_punctuation():
+    cache = _cache()
+    cache.put("List all operations.", "MATCH (o:Operation) RETURN o", [{"o": 1}])
+    entry = cache.get("list all operations")
+    assert entry["cypher"] == "MATCH (o:Operation) RETURN o"
+    assert cache.hits["exact"] == 1
+
+
+def test_near_hit_across_stop_words_and_plurals():
+    cache = _cache()
+    cache.put("List the resources of each operation", "MATCH r", [1])
+    assert cache.get("List all resource of operations")["cypher"] == "MATCH r"
+    assert cache.hits["near"] == 1
+
+
+def test_no_near_hit_for_a_different_operation_id():
+    cache = _cache()
+    first = ("Which resources and how many operators are needed for operation S40_00010 "
+             "in the wing assembly process of the upper orbital joint")
+    second = first.replace("S40_00010", "S40_00020")
+    cache.put(first, "MATCH (o {id: 'S40_00010'}) RETURN o", [{"id": "S40_00010"}])
+    assert cache.get(second) is None
+    assert cache.hits["miss"] == 1
+
+
+def test_no_near_hit_for_a_different_number_or_quoted_name():
+    cache = _cache(similarity=0.5)
+    cache.put('List the predecessors of "Drill holes" in step 3', "MATCH a", [1])
+    assert cache.get('List the predecessors of "Fit bolts" in step 3') is None
+    assert cache.get('List the predecessors of "Drill holes" in step 4') is None
+    assert cache.get('List predecessor of "drill holes" in step 3')["cypher"] == "MATCH a"
+
+
+def test_question_entities():
+    assert question_entities("Operation S40_00010 needs 2 operators and 'Station platform'") == (
+        "2", "s40_00010", "station platform")
+    assert question_entities("What's the operation's duration?") == ()
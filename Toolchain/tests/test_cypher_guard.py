@@ -0,0 +1,112 @@
+import asyncio
+
+import pytest
+
+from cypher_guard import CypherCursor, UnsafeCypherError, bound_hops, guard_cypher
+
+
+@pytest.mark.parametrize("cypher", [
+    "MATCH (n) DETACH DELETE n",
+    "MATCH (o:Operation) SET o.duration = 0 RETURN o",
+    "CREATE (n:Operation {name: 'x'})",
+    "MATCH (n) RETURN n UNION MATCH (m) MERGE (m)-[:r]->(m) RETURN m",
+    "CALL apoc.periodic.iterate('MATCH (n) RETURN n', 'DELETE n', {})",
+    "LOAD CSV FROM 'file:///x.csv' AS row RETURN row",
+])
+def test_write_queries_are_rejected(cypher):
+    with pytest.raises(UnsafeCypherError):
+        guard_cypher(cypher)
+
+
+def test_keywords_in_strings_comments_and_aliases_are_allowed():
+    cypher = ("MATCH (o:Operation) WHERE o.name = 'Create set' // delete nothing\n"
+              "RETURN o.name AS set, o.duration AS duration LIMIT 5")
+    assert guard_cypher(cypher) == cypher
+
+
+def test_schema_procedures_are_allowed():
+    assert guard_cypher("CALL db.labels()") == "CALL db.labels()"
+
+
+def test_limit_is_added_one_past_the_row_cap():
+    assert guard_cypher("MATCH (o:Operation) RETURN o;", max_rows=10).endswith("\nLIMIT 11")
+
+
+def test_existing_limit_and_union_are_kept():
+    assert guard_cypher("MATCH (o) RETURN o LIMIT 3") == "MATCH (o) RETURN o LIMIT 3"
+    union = "MATCH (a:Operation) RETURN a.name AS n UNION MATCH (b:Resource) RETURN b.name AS n"
+    assert guard_cypher(union) == union
+
+
+def test_unbounded_paths_get_a_hop_limit():
+    assert bound_hops("MATCH (a)-[:hasPredecessors*]->(b) RETURN b", 4) == \
+        "MATCH (a)-[:hasPredecessors*1..4]->(b) RETURN b"
+    assert bound_hops("MATCH (a)-[*2..]->(b) RETURN b", 4) == "MATCH (a)-[*2..4]->(b) RETURN b"
+    assert bound_hops("MATCH (a)-[*1..3]->(b) RETURN b", 4) == "MATCH (a)-[*1..3]->(b) RETURN b"
+
+
+class FakeGraph:
+    def __init__(self, rows):
+        self.rows = rows
+        self.queries = []
+
+    def query(self, cypher, params=None):
+        self.queries.append(cypher)
+        return list(self.rows)
+
+
+def test_cursor_guards_and_cuts_the_result():
+    graph = FakeGraph([{"n": i} for i in range(10)])
+    cursor = CypherCursor(graph, "MATCH (n) RETURN n", max_rows=4)
+    assert cursor.fetch_all() == [{"n": i} for i in range(4)]
+    assert cursor.truncated
+    assert graph.queries == ["MATCH (n) RETURN n\nLIMIT 5"]
+
+    with pytest.raises(UnsafeCypherError):
+        CypherCursor(graph, "MATCH (n) DELETE n")
+
+
+def test_async_cursor_reads_through_the_driver_session():
+    class Record(dict):
+        def data(self):
+            return dict(self)
+
+    class Result:
+        def __init__(self, rows):
+            self.rows = iter(rows)
+
+        def __aiter__(self):
+            return self
+
+        async def __anext__(self):
+            try:
+                return Record(next(self.rows))
+            except StopIteration:
+                raise StopAsyncIteration
+
+    class Session:
+        def __init__(self, options):
+            self.options = options
+
+        async def __aenter__(self):
+            return self
+
+        async def __aexit__(self, *exc):
+            return False
+
+        async def run(self, query, params):
+            self.query = query
+            return Result([{"n": i} for i in range(5)])
+
+    class Driver:
+        def session(self, **options):
+            self.opened = Session(options)
+            return self.opened
+
+    pytest.importorskip("neo4j")
+    driver = Driver()
+    cursor = CypherCursor(FakeGraph([]), "MATCH (n) RETURN n", max_rows=3, page_size=2)
+    rows = asyncio.run(cursor.afetch_all(driver, "neo4j"))
+    assert rows == [{"n": 0}, {"n": 1}, {"n": 2}] and cursor.truncated
+    assert driver.opened.options["fetch_size"] == 2
+    assert driver.opened.query.text.endswith("LIMIT 4")
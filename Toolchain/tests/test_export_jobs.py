@@ -0,0 +1,59 @@
+import threading
+
+import export_jobs
+from export_jobs import ExportQueue
+
+
+class FakeIndex:
+    def __init__(self):
+        self.artifacts = []
+
+    def set_artifact(self, plan, kind, path):
+        self.artifacts.append((plan, kind, path))
+
+    def pending(self):
+        return []
+
+
+def test_overlapping_jobs_for_one_plan_never_run_together(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    release = threading.Event()
+    running, overlaps = [], []
+
+    def step(name):
+        def run(*args):
+            if running:
+                overlaps.append((running[-1], name))
+            running.append(name)
+            release.wait(5)
+            running.pop()
+        return run
+
+    monkeypatch.setattr(export_jobs, "build_fragment", step("fragment"))
+    monkeypatch.setattr(export_jobs, "merge_fragment", step("merge"))
+    monkeypatch.setattr(export_jobs, "owl_to_matlab", step("matlab"))
+    queue = ExportQueue(FakeIndex(), workers=4, pool="thread")
+    plan = "plans/assembly_plan_1.csv"
+
+    mbse = queue.submit(plan, "mbse")
+    everything = queue.submit(plan, "all")
+    assert everything is not mbse
+    assert queue.submit(plan, "mbse") is mbse
+    assert queue.submit(plan, "simulation") is everything
+
+    release.set()
+    queue.runner.shutdown(wait=True)
+    assert overlaps == []
+    assert mbse.status == everything.status == "done"
+    assert set(everything.outputs) == {"owl", "model"}
+
+
+def test_finished_job_is_not_reused(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    for name in ("build_fragment", "merge_fragment", "owl_to_matlab"):
+        monkeypatch.setattr(export_jobs, name, lambda *args: None)
+    queue = ExportQueue(FakeIndex(), workers=1, pool="thread")
+    first = queue.submit("plans/assembly_plan_2.csv", "mbse")
+    queue.runner.submit(lambda: None).result()
+    assert not first.active
+    assert queue.submit("plans/assembly_plan_2.csv", "mbse") is not first
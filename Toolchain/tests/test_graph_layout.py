@@ -0,0 +1,44 @@
+from graph_layout import collapse_hubs
+
+
+def _view(edges):
+    nodes = sorted({n for edge in edges for n in edge})
+    return {"nodes": [{"id": n, "label": n} for n in nodes],
+            "edges": [{"from": a, "to": b} for a, b in edges]}
+
+
+def test_hub_edges_move_to_the_hub_detail():
+    view = _view([("h", f"n{i}") for i in range(3)] + [("a", "b")])
+    detail = collapse_hubs(view, hub_degree=3, max_edges=100)
+    assert [e["to"] for e in detail["h"]["edges"]] == ["n0", "n1", "n2"]
+    assert [(e["from"], e["to"]) for e in view["edges"]] == [("a", "b")]
+    hub = next(n for n in view["nodes"] if n["id"] == "h")
+    assert hub["collapsed"] and hub["label"] == "h\n[+3 links]"
+
+
+def test_edge_between_two_hubs_is_listed_under_both():
+    edges = [("h1", "h2")] + [("h1", f"a{i}") for i in range(2)] + [("h2", f"b{i}") for i in range(2)]
+    view = _view(edges)
+    detail = collapse_hubs(view, hub_degree=3, max_edges=100)
+    assert "e0" in [e["id"] for e in detail["h1"]["edges"]]
+    assert "e0" in [e["id"] for e in detail["h2"]["edges"]]
+    labels = {n["id"]: n["label"] for n in view["nodes"]}
+    assert labels["h1"].endswith("[+3 links]") and labels["h2"].endswith("[+3 links]")
+    assert view["edges"] == []
+
+
+def test_hub_with_only_hub_neighbours_can_be_expanded():
+    # h3's edges all point at other hubs.
+    edges = [("h3", "h1"), ("h3", "h2"), ("h3", "h4")]
+    for hub in ("h1", "h2", "h4"):
+        edges += [(hub, f"{hub}x{i}") for i in range(2)]
+    view = _view(edges)
+    detail = collapse_hubs(view, hub_degree=3, max_edges=100)
+    assert len(detail["h3"]["edges"]) == 3
+    assert next(n for n in view["nodes"] if n["id"] == "h3")["collapsed"]
+
+
+def test_no_hubs_keeps_the_view():
+    view = _view([("a", "b"), ("b", "c")])
+    assert collapse_hubs(view, hub_degree=3, max_edges=100) == {}
+    assert len(view["edges"]) == 2
@@ -0,0 +1,21 @@
+import pytest
+
+from kg_engine import CypherError, InMemoryGraph
+
+
+@pytest.fixture(scope="module")
+def graph():
+    return InMemoryGraph.from_json()
+
+
+def test_size_and_length_of_strings_lists_and_paths(graph):
+    row, = graph.query("RETURN size('abc') AS s, size([1, 2, 3, 4]) AS l")
+    assert row == {"s": 3, "l": 4}
+    rows = graph.query("MATCH p = (a:Operation)-[:hasPredecessors]->(b) RETURN length(p) AS n LIMIT 1")
+    assert rows == [{"n": 1}]
+
+
+@pytest.mark.parametrize("call", ["size(o)", "length(o)", "size(o.duration)"])
+def test_size_of_a_node_or_number_is_a_cypher_error(graph, call):
+    with pytest.raises(CypherError, match="Type mismatch"):
+        graph.query(f"MATCH (o:Operation) WHERE o.duration IS NOT NULL RETURN {call} AS n LIMIT 1")
@@ -0,0 +1,106 @@
+import asyncio
+
+import pytest
+
+import async_backend
+import backend
+from benchmark import DEFAULT_CYPHER, FAKE_CYPHER, PLAN_QUESTION, WORKLOADS, FakeAsyncChatClient, FakeChatClient, \
+    load_design_answers
+from cypher_cache import CypherCache
+from plan_library import PlanLibrary
+from plan_store import PlanStore
+
+GRAPH_QUESTION = "What is the duration of each manual operation?"
+
+
+class RecordingSink:
+    def __init__(self):
+        self.records = []
+
+    def record(self, record):
+        self.records.append(record)
+
+
+@pytest.fixture
+def fakes(monkeypatch, tmp_path):
+    """The backend with the model, the Cypher generator and every store replaced by offline fakes."""
+    monkeypatch.chdir(tmp_path)
+    client = FakeChatClient(load_design_answers())
+    cypher = dict(FAKE_CYPHER)
+    store = PlanStore(path=None)
+    sink = RecordingSink()
+    backend.services.override("client", client)
+    backend.services.override("plan_store", store)
+    monkeypatch.setattr(backend, "llm_route", lambda question: "graph")
+    monkeypatch.setattr(backend, "generate_cypher", lambda question: cypher.get(question, DEFAULT_CYPHER))
+    monkeypatch.setattr(backend, "cypher_cache", CypherCache(path=None))
+    monkeypatch.setattr(backend, "plan_library", PlanLibrary(path=None))
+    monkeypatch.setattr(backend, "metrics_sink", sink)
+    monkeypatch.setattr(backend, "DESIGN_ENGINE", "scheduler")
+
+    async def generate_cypher_async(question):
+        return backend.generate_cypher(question)
+
+    async def llm_route_async(question):
+        return "graph"
+
+    monkeypatch.setattr(async_backend, "_client", FakeAsyncChatClient(client))
+    monkeypatch.setattr(async_backend, "generate_cypher_async", generate_cypher_async)
+    monkeypatch.setattr(async_backend, "llm_route_async", llm_route_async)
+    async_backend._semaphores.clear()
+    try:
+        yield {"cypher": cypher, "store": store, "sink": sink}
+    finally:
+        backend.services.reset("client")
+        backend.services.reset("plan_store")
+        async_backend._semaphores.clear()
+
+
+def ask(question, session_id=None):
+    return "".join(tok for tok, _ in backend.smart_qa_system(question, session_id))
+
+
+def test_table_question_is_answered_from_the_kg_tables(fakes):
+    answer = ask(WORKLOADS["tables"][1])
+    record, = fakes["sink"].records
+    assert record["status"] == "ok" and record["route"] == "graph"
+    assert "kg_lookup" in record["stages"] and answer
+
+
+def test_generated_cypher_is_cached(fakes):
+    ask(GRAPH_QUESTION)
+    ask(GRAPH_QUESTION)
+    first, second = fakes["sink"].records
+    assert first["status"] == second["status"] == "ok"
+    assert first["cypher"] == second["cypher"] == FAKE_CYPHER[GRAPH_QUESTION]
+    assert "cypher_generation" in first["stages"] and "cypher_generation" not in second["stages"]
+
+
+def test_unsafe_cypher_ends_in_an_error(fakes):
+    fakes["cypher"][GRAPH_QUESTION] = "MATCH (o:Operation) DETACH DELETE o"
+    answer = ask(GRAPH_QUESTION)
+    assert answer.startswith("Sorry, there was an error")
+    assert fakes["sink"].records[0]["status"] == "error"
+    assert len(backend.services.graph.query("MATCH (o:Operation) RETURN o.name AS n LIMIT 1")) == 1
+
+
+def test_scheduled_plan_is_stored_for_the_session(fakes):
+    answer = ask(PLAN_QUESTION, "session-a")
+    assert "Phase 3. Plan Generation" in answer
+    assert fakes["sink"].records[0]["route"] == "design"
+    plan = fakes["store"].latest(session="session-a")
+    assert plan is not None and plan["plan"]
+    assert fakes["store"].latest(session="session-b") is None
+
+
+def test_async_driver_matches_the_sync_driver(fakes):
+    async def ask_async(question):
+        parts = []
+        async for tok, _ in async_backend.smart_qa_system_async(question):
+            parts.append(tok)
+        return "".join(parts)
+
+    sync_answer = ask(WORKLOADS["tables"][0])
+    async_answer = asyncio.run(ask_async(WORKLOADS["tables"][0]))
+    assert async_answer == sync_answer
+    assert [r["status"] for r in fakes["sink"].records] == ["ok", "ok"]
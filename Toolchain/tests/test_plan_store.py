@@ -0,0 +1,44 @@
+import os
+
+from plan_store import PlanStore
+from scheduler import PLAN_HEADER
+
+ROWS = [PLAN_HEADER,
+        ["1", "S40_00010 Drill holes", "Manual", "Mechanical operator (2)", "10", "0", "10", "20"],
+        ["2", "S40_00020 Fit bolts", "Automatic", "Robot (1)", "5", "10", "15", "8"]]
+
+
+def _add(store, tmp_path, name, session, created):
+    csv_path = os.path.join(tmp_path, f"assembly_plan_{name}.csv")
+    plan_id = store.add(ROWS, plan_id=name, session=session, csv_path=csv_path, created=created)
+    store.export_csv(plan_id, csv_path)
+    return csv_path
+
+
+def test_latest_prefers_the_session_then_ownerless_plans(tmp_path):
+    store = PlanStore(path=None)
+    ownerless = _add(store, tmp_path, "cli", None, created=1)
+    mine = _add(store, tmp_path, "mine", "s1", created=2)
+    _add(store, tmp_path, "other", "s2", created=3)
+    assert store.latest("plan", "s1")["plan"] == mine
+    assert store.latest("plan", "s3")["plan"] == ownerless
+    assert store.latest("plan")["id"] == "other"
+
+
+def test_latest_skips_other_sessions_and_missing_artifacts(tmp_path):
+    store = PlanStore(path=None)
+    _add(store, tmp_path, "batch", "batch-q1", created=1)
+    assert store.latest("plan", "s1") is None
+    assert store.latest("owl", "batch-q1") is None
+    owl = os.path.join(tmp_path, "model.owl")
+    open(owl, "w").close()
+    store.set_artifact(os.path.join(tmp_path, "assembly_plan_batch.csv"), "owl", owl)
+    assert store.latest("owl", "batch-q1")["owl"] == owl
+
+
+def test_latest_writes_a_removed_csv_again(tmp_path):
+    store = PlanStore(path=None)
+    csv_path = _add(store, tmp_path, "gone", "s1", created=1)
+    os.remove(csv_path)
+    assert store.latest("plan", "s1")["plan"] == csv_path
+    assert os.path.exists(csv_path)
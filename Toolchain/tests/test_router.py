@@ -0,0 +1,35 @@
+from router import LocalRouter, NaiveBayesRouter
+
+
+def _router():
+    model = NaiveBayesRouter().fit([("list all operations", "graph"), ("design an assembly plan", "design")])
+    return LocalRouter(model=model, threshold=0.99)
+
+
+def test_rules_route_without_the_fallback():
+    router = _router()
+    assert router.route("List all information of resources.", fallback=lambda q: 1 / 0) == "graph"
+    assert router.route("Design a joint plan for the four 1/4 bodies", fallback=lambda q: 1 / 0) == "design"
+    assert router.stats()["rule_hits"] == 2
+
+
+def test_fallback_is_recorded_and_learned():
+    router = _router()
+    assert router.route("zebra quokka", fallback=lambda q: "design") == "design"
+    stats = router.stats()
+    assert stats["fallbacks"] == 1 and stats["hit_rate"] == 0.0
+    assert router.model.word_counts["design"]["zebra"] == 1
+
+
+def test_predict_runs_under_the_lock_that_learning_takes():
+    router = _router()
+    held = []
+    predict = router.model.predict
+
+    def checked(text):
+        held.append(router.lock.locked())
+        return predict(text)
+
+    router.model.predict = checked
+    router.classify("zebra quokka")
+    assert held == [True]
@@ -0,0 +1,52 @@
+import json
+import re
+
+from tracing import MetricsSink, Trace
+
+
+def _record(sink, route="graph", caches=None, stages=None):
+    trace = Trace("question", sink)
+    trace.route = route
+    trace.caches = caches or {}
+    trace.stages = stages or {"route": 0.5, "graph_query": 0.1}
+    trace.streams = {"graph_answer": {"ttft_s": 0.2, "chunks": 10, "duration_s": 1.0, "tokens_per_s": 12.5}}
+    trace.finish()
+
+
+def test_prometheus_families_are_contiguous_and_typed():
+    sink = MetricsSink(path="", prometheus_path="")
+    _record(sink, caches={"router": "rule"})
+    _record(sink, caches={"router": "fallback", "plan_library": "miss"})
+    text = sink.prometheus_text()
+
+    typed, seen, current = {}, [], None
+    for line in text.splitlines():
+        match = re.match(r"# TYPE (\S+) (\S+)$", line)
+        if match:
+            current = match.group(1)
+            assert current not in typed, f"{current} declared twice"
+            typed[current] = match.group(2)
+            continue
+        if line.startswith("#"):
+            continue
+        name = re.match(r"[a-zA-Z_:][a-zA-Z0-9_:]*", line).group(0)
+        family = re.sub(r"_(sum|count)$", "", name) if typed.get(current) == "summary" else name
+        assert family == current, f"{name} outside its family block"
+        seen.append(family)
+    assert {"qa_stage_seconds", "qa_stream_tokens_per_second", "qa_requests_total",
+            "qa_cache_requests_total", "qa_cache_hit_rate", "qa_router_llm_seconds_saved"} <= set(typed)
+    assert typed["qa_requests_total"] == "counter" and typed["qa_cache_hit_rate"] == "gauge"
+    assert 'qa_cache_hit_rate{cache="router"} 0.5' in text
+
+
+def test_trace_file_is_rotated_at_max_bytes(tmp_path):
+    path = tmp_path / "traces.jsonl"
+    sink = MetricsSink(path=str(path), prometheus_path="", max_bytes=2000)
+    for _ in range(20):
+        _record(sink)
+    rotated = tmp_path / "traces.jsonl.1"
+    assert rotated.exists()
+    assert rotated.stat().st_size >= 2000
+    assert not path.exists() or path.stat().st_size < 2000
+    for line in rotated.read_text(encoding="utf-8").splitlines():
+        assert json.loads(line)["route"] == "graph"
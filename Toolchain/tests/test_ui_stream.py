@@ -0,0 +1,56 @@
+import asyncio
+
+from ui_stream import coalesce_stream
+
+
+async def _tokens(items, delay=0.0, closed=None):
+    try:
+        for item in items:
+            await asyncio.sleep(delay)
+            yield item
+    finally:
+        if closed is not None:
+            closed.append(True)
+
+
+def _collect(stream, **kwargs):
+    async def run():
+        return [batch async for batch in coalesce_stream(stream, **kwargs)]
+    return asyncio.run(run())
+
+
+def test_merges_tokens_and_reports_graph_once():
+    batches = _collect(_tokens([("a", None), ("b", "g.json"), ("c", "g.json")]), interval=10, max_chars=100)
+    assert "".join(text for text, _ in batches) == "abc"
+    assert [graph for _, graph in batches if graph] == ["g.json"]
+
+
+def test_first_token_goes_out_at_once_then_flushes_when_buffer_is_full():
+    batches = _collect(_tokens([("ab", None), ("cd", None), ("ef", None)]), interval=10, max_chars=4)
+    assert [text for text, _ in batches] == ["ab", "cdef"]
+
+
+def test_cancel_while_waiting_for_a_token_closes_the_source():
+    closed = []
+
+    async def run():
+        received = []
+
+        async def consume():
+            async for batch in coalesce_stream(_tokens([("a", None)] * 100, delay=0.05, closed=closed),
+                                               interval=0):
+                received.append(batch)
+
+        task = asyncio.create_task(consume())
+        while not received:
+            await asyncio.sleep(0.01)
+        await asyncio.sleep(0.02)  # cancelled mid-token: the source is inside asyncio.sleep
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            return "cancelled"
+        return "finished"
+
+    assert asyncio.run(run()) == "cancelled"
+    assert closed == [True]
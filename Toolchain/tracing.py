@@ -0,0 +1,286 @@
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter, defaultdict, deque
+from contextlib import contextmanager, nullcontext
+
+import numpy as np
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+TRACE_PATH = os.getenv("TRACE_PATH", os.path.join(current_dir, "metrics", "traces.jsonl"))
+PROMETHEUS_PATH = os.getenv("PROMETHEUS_PATH", "")
+TRACE_WINDOW = int(os.getenv("TRACE_WINDOW", "1000"))
+# traces.jsonl is moved to traces.jsonl.1 (replacing the previous one) once it reaches this size; 0 keeps one file.
+TRACE_MAX_BYTES = int(os.getenv("TRACE_MAX_BYTES", str(50 * 1024 * 1024)))
+LOG_LEVEL = os.getenv("LOG_LEVEL", "WARNING").upper()
+LOG_FORMAT = "%(asctime)s %(levelname)s %(name)s: %(message)s"
+# Cache outcomes that still cost the full computation; every other outcome counts as a hit.
+MISS_OUTCOMES = ("miss", "fallback")
+
+logger = logging.getLogger("toolchain")
+logger.setLevel(LOG_LEVEL)
+
+
+def configure_logging():
+    """Logs to stderr with timestamps. For entry points only; importing a module configures nothing."""
+    logging.basicConfig(format=LOG_FORMAT)
+
+
+def get_logger(name):
+    return logger.getChild(name)
+
+
+log = get_logger("tracing")
+
+
+def _percentiles(values):
+    data = np.fromiter(values, dtype=float)
+    p50, p95 = np.percentile(data, [50, 95])
+    return {"count": len(data), "p50": round(float(p50), 4), "p95": round(float(p95), 4),
+            "mean": round(float(data.mean()), 4)}
+
+
+class MetricsSink:
+    def __init__(self, path=TRACE_PATH, prometheus_path=PROMETHEUS_PATH, window=TRACE_WINDOW,
+                 max_bytes=TRACE_MAX_BYTES):
+        self.path = path
+        self.prometheus_path = prometheus_path
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.samples = defaultdict(lambda: deque(maxlen=window))
+        self.counters = Counter()
+        self.caches = defaultdict(Counter)
+
+    def record(self, trace):
+        with self.lock:
+            self.counters["requests"] += 1
+            self.counters[f"route_{trace['route']}"] += 1
+            self.counters[f"status_{trace['status']}"] += 1
+            self.counters["tokens_in"] += trace["tokens_in"]
+            self.counters["tokens_out"] += trace["tokens_out"]
+            context = trace.get("context")
+            if context:
+                self.counters["context_tokens_raw"] += context["raw_tokens"]
+                self.counters["context_tokens"] += context["tokens"]
+                self.counters["context_tokens_saved"] += context["tokens_saved"]
+            for name, outcome in trace.get("caches", {}).items():
+                self.caches[name][outcome] += 1
+            if trace.get("caches", {}).get("router") == "fallback" and "route" in trace["stages"]:
+                self.samples["route.llm"].append(trace["stages"]["route"])
+            self.samples["total"].append(trace["total_s"])
+            for stage, seconds in trace["stages"].items():
+                self.samples[stage].append(seconds)
+            for name, stream in trace["streams"].items():
+                if stream.get("ttft_s") is not None:
+                    self.samples[f"{name}.ttft"].append(stream["ttft_s"])
+                if stream.get("tokens_per_s"):
+                    self.samples[f"{name}.tokens_per_s"].append(stream["tokens_per_s"])
+            if self.path:
+                try:
+                    os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                    with open(self.path, "a", encoding="utf-8") as f:
+                        f.write(json.dumps(trace, ensure_ascii=False) + "\n")
+                        full = self.max_bytes and f.tell() >= self.max_bytes
+                    if full:
+                        os.replace(self.path, f"{self.path}.1")
+                except OSError as e:
+                    log.warning("Write trace failed: %s", e)
+        if self.prometheus_path:
+            self.write_prometheus()
+
+    def summary(self):
+        with self.lock:
+            return {name: _percentiles(values) for name, values in self.samples.items() if values}
+
+    def cache_stats(self):
+        """Outcome counts and hit rate per cache; for the router, also the LLM routing time it saved."""
+        with self.lock:
+            stats = {}
+            for name, outcomes in self.caches.items():
+                total = sum(outcomes.values())
+                hits = total - sum(outcomes[k] for k in MISS_OUTCOMES)
+                stats[name] = dict(outcomes, hit_rate=round(hits / total, 4) if total else 0.0)
+                if name == "router":
+                    llm = self.samples.get("route.llm")
+                    # Estimated from the LLM fallbacks seen so far; unknown until there is one.
+                    stats[name]["llm_seconds_saved"] = round(hits * sum(llm) / len(llm), 4) if llm else None
+            return stats
+
+    def prometheus_text(self):
+        """Prometheus text exposition: one block per metric family, each with its HELP and TYPE lines."""
+        families = []
+
+        def family(name, kind, help_text, samples):
+            if samples:
+                families.append([f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"] + samples)
+
+        summaries = {"qa_stage_seconds": [], "qa_stream_tokens_per_second": []}
+        for name, stats in sorted(self.summary().items()):
+            metric = "qa_stream_tokens_per_second" if name.endswith(".tokens_per_s") else "qa_stage_seconds"
+            stage = name.rsplit(".tokens_per_s", 1)[0]
+            samples = summaries[metric]
+            for quantile in ("p50", "p95"):
+                samples.append(f'{metric}{{stage="{stage}",quantile="0.{quantile[1:]}"}} {stats[quantile]}')
+            samples.append(f'{metric}_sum{{stage="{stage}"}} {round(stats["mean"] * stats["count"], 4)}')
+            samples.append(f'{metric}_count{{stage="{stage}"}} {stats["count"]}')
+        family("qa_stage_seconds", "summary", "Seconds spent per pipeline stage over the recent window.",
+               summaries["qa_stage_seconds"])
+        family("qa_stream_tokens_per_second", "summary", "Streamed chunks per second after the first token.",
+               summaries["qa_stream_tokens_per_second"])
+        with self.lock:
+            counters = sorted(self.counters.items())
+            outcomes = [(name, outcome, value) for name, counts in sorted(self.caches.items())
+                        for outcome, value in sorted(counts.items())]
+        for key, value in counters:
+            family(f"qa_{key}_total", "counter", f"Total {key.replace('_', ' ')} since start.",
+                   [f"qa_{key}_total {value}"])
+        family("qa_cache_requests_total", "counter", "Cache lookups by cache and outcome.",
+               [f'qa_cache_requests_total{{cache="{name}",outcome="{outcome}"}} {value}'
+                for name, outcome, value in outcomes])
+        cache_stats = sorted(self.cache_stats().items())
+        family("qa_cache_hit_rate", "gauge", "Share of lookups answered without the full computation.",
+               [f'qa_cache_hit_rate{{cache="{name}"}} {stats["hit_rate"]}' for name, stats in cache_stats])
+        family("qa_router_llm_seconds_saved", "gauge", "Estimated LLM routing time saved by local routing.",
+               [f'qa_router_llm_seconds_saved {stats["llm_seconds_saved"]}' for name, stats in cache_stats
+                if name == "router" and stats.get("llm_seconds_saved") is not None])
+        return "\n".join(line for block in families for line in block) + "\n"
+
+    def write_prometheus(self):
+        try:
+            tmp_path = f"{self.prometheus_path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(self.prometheus_text())
+            os.replace(tmp_path, self.prometheus_path)
+        except OSError as e:
+            log.warning("Write Prometheus metrics failed: %s", e)
+
+
+class Trace:
+    def __init__(self, question, sink=None, session_id=None):
+        self.sink = sink
+        self.question = question
+        self.session_id = session_id
+        self.route = None
+        self.stages = {}
+        self.streams = {}
+        self.tokens_in = 0
+        self.tokens_out = 0
+        self.usage_reported = False
+        self.context = None
+        self.caches = {}
+        self.cypher = None
+        self.plan = None
+        self.plan_id = None
+        self.started = time.perf_counter()
+        self.finished = False
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[name] = self.stages.get(name, 0.0) + time.perf_counter() - start
+
+    def usage(self, usage):
+        # Exact counts from the API's final usage chunk replace the per-chunk estimate.
+        if usage is not None:
+            self.tokens_in += usage.prompt_tokens or 0
+            self.tokens_out += usage.completion_tokens or 0
+            self.usage_reported = True
+
+    def _stream_started(self, name):
+        stats = self.streams[name] = {"ttft_s": None, "chunks": 0, "duration_s": 0.0}
+        return stats, time.perf_counter()
+
+    def _stream_token(self, stats, start):
+        if stats["ttft_s"] is None:
+            stats["ttft_s"] = round(time.perf_counter() - start, 4)
+        stats["chunks"] += 1
+
+    def _stream_done(self, stats, start):
+        stats["duration_s"] = round(time.perf_counter() - start, 4)
+        generating = stats["duration_s"] - (stats["ttft_s"] or 0.0)
+        stats["tokens_per_s"] = round(stats["chunks"] / generating, 2) if generating > 0 else None
+
+    def stream(self, name, tokens):
+        stats, start = self._stream_started(name)
+        try:
+            for tok in tokens:
+                self._stream_token(stats, start)
+                yield tok
+        finally:
+            # Propagate an early close so the underlying HTTP stream is released too.
+            if hasattr(tokens, "close"):
+                tokens.close()
+            self._stream_done(stats, start)
+
+    async def astream(self, name, tokens):
+        stats, start = self._stream_started(name)
+        try:
+            async for tok in tokens:
+                self._stream_token(stats, start)
+                yield tok
+        finally:
+            if hasattr(tokens, "aclose"):
+                await tokens.aclose()
+            self._stream_done(stats, start)
+
+    def to_dict(self, status):
+        tokens_out = self.tokens_out
+        if not self.usage_reported:
+            tokens_out = sum(s["chunks"] for s in self.streams.values())
+        return {
+            "ts": time.time(),
+            "session": self.session_id,
+            "question": self.question[:200],
+            "route": self.route,
+            "status": status,
+            "total_s": round(time.perf_counter() - self.started, 4),
+            "stages": {k: round(v, 4) for k, v in self.stages.items()},
+            "streams": self.streams,
+            "tokens_in": self.tokens_in,
+            "tokens_out": tokens_out,
+            "context": self.context,
+            "caches": self.caches,
+            "cypher": self.cypher,
+            "plan": self.plan,
+            "plan_id": self.plan_id,
+        }
+
+    def finish(self, status="ok"):
+        if self.finished:
+            return
+        self.finished = True
+        record = self.to_dict(status)
+        log.info("%s route=%s total=%.3fs stages=%s", status, self.route, record["total_s"], record["stages"])
+        if self.sink:
+            self.sink.record(record)
+
+
+def traced(trace, name):
+    return trace.stage(name) if trace else nullcontext()
+
+
+def summarize_file(path=TRACE_PATH):
+    samples = defaultdict(list)
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            trace = json.loads(line)
+            samples["total"].append(trace["total_s"])
+            for stage, seconds in trace["stages"].items():
+                samples[stage].append(seconds)
+            for name, stream in trace["streams"].items():
+                if stream.get("ttft_s") is not None:
+                    samples[f"{name}.ttft"].append(stream["ttft_s"])
+    return {name: _percentiles(values) for name, values in samples.items()}
+
+
+metrics_sink = MetricsSink()
+
+if __name__ == "__main__":
+    for name, stats in sorted(summarize_file(*sys.argv[1:2]).items()):
+        print(f"{name:<28} n={stats['count']:<6} p50={stats['p50']:<10} p95={stats['p95']:<10} mean={stats['mean']}")
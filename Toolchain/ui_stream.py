@@ -0,0 +1,55 @@
+import asyncio
+import os
+
+# Chat answers reach the browser at most every STREAM_FLUSH_INTERVAL seconds, or sooner once
+# STREAM_FLUSH_CHARS characters are waiting; graph changes and the first token go out immediately.
+STREAM_FLUSH_INTERVAL = float(os.getenv("STREAM_FLUSH_INTERVAL", "0.08"))
+STREAM_FLUSH_CHARS = int(os.getenv("STREAM_FLUSH_CHARS", "600"))
+
+
+async def coalesce_stream(stream, interval=STREAM_FLUSH_INTERVAL, max_chars=STREAM_FLUSH_CHARS):
+    """Merge the (token, graph_path) pairs of `stream` into (text_delta, new_graph_path) batches.
+
+    `new_graph_path` is only set on the batch where the graph first appears or changes. A batch is
+    also flushed when the stream stalls, so a slow model never leaves text sitting in the buffer.
+    """
+    loop = asyncio.get_running_loop()
+    iterator = stream.__aiter__()
+    buffer, size = [], 0
+    graph, graph_changed = None, False
+    last_flush = float("-inf")
+    pending = None
+    try:
+        while True:
+            if pending is None:
+                pending = asyncio.ensure_future(iterator.__anext__())
+            timeout = max(0.0, last_flush + interval - loop.time()) if buffer else None
+            done, _ = await asyncio.wait({pending}, timeout=timeout)
+            if done:
+                try:
+                    text, graph_path = pending.result()
+                except StopAsyncIteration:
+                    pending = None
+                    break
+                pending = None
+                if text:
+                    buffer.append(text)
+                    size += len(text)
+                if graph_path and graph_path != graph:
+                    graph, graph_changed = graph_path, True
+                if not graph_changed and size < max_chars and loop.time() - last_flush < interval:
+                    continue
+            if buffer or graph_changed:
+                yield "".join(buffer), graph if graph_changed else None
+                buffer, size, graph_changed = [], 0, False
+                last_flush = loop.time()
+        if buffer or graph_changed:
+            yield "".join(buffer), graph if graph_changed else None
+    finally:
+        if pending is not None and not pending.done():
+            pending.cancel()
+            # The source is still inside __anext__ until the cancellation lands; closing it before
+            # then fails with "aclose(): asynchronous generator is already running".
+            await asyncio.gather(pending, return_exceptions=True)
+        if hasattr(iterator, "aclose"):
+            await iterator.aclose()